@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0002_asignatura_coordinator_titulacion_coordinador'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asignatura',
+            index=models.Index(fields=['titulacion', 'curso', 'semestre'], name='asignatura_tit_curso_sem_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asignatura',
+            index=models.Index(fields=['curso', 'semestre'], name='asignatura_curso_sem_idx'),
+        ),
+    ]
@@ -14,5 +14,12 @@ class Asignatura(models.Model):
     semestre = models.IntegerField()
     coordinator = models.ForeignKey('users.CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='coordinated_subjects') # New field
 
+    class Meta:
+        indexes = [
+            # Filtros de los dashboards: titulación / curso / semestre
+            models.Index(fields=['titulacion', 'curso', 'semestre'], name='asignatura_tit_curso_sem_idx'),
+            models.Index(fields=['curso', 'semestre'], name='asignatura_curso_sem_idx'),
+        ]
+
     def __str__(self):
         return self.nombre
\ No newline at end of file
@@ -1,17 +1,51 @@
+import copy
+import time
+
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+# AgendaSettings se lee en cada petición de calendario: cada proceso guarda
+# una copia durante AGENDA_SETTINGS_LOCAL_TTL segundos y después vuelve a la
+# base de datos, así los demás workers ven los cambios en ese plazo como mucho
+AGENDA_SETTINGS_LOCAL_TTL = getattr(settings, 'AGENDA_SETTINGS_LOCAL_TTL', 5)
+
+_local_settings = {'obj': None, 'expires': 0.0}
+
+
 class AgendaSettings(models.Model):
     closing_date = models.DateField()
 
     def save(self, *args, **kwargs):
         self.pk = 1
         super(AgendaSettings, self).save(*args, **kwargs)
+        self._store_local(self)
 
     def delete(self, *args, **kwargs):
         pass
 
     @classmethod
     def load(cls):
-        obj, created = cls.objects.get_or_create(pk=1, defaults={'closing_date': timezone.now().date()})
-        return obj
\ No newline at end of file
+        """
+        Devuelve la configuración (singleton pk=1).
+
+        Se lee de la copia local del proceso mientras no caduque; si no, de
+        la base de datos, creando el registro si no existe. Las rutas
+        calientes hacen como mucho una consulta cada pocos segundos.
+        """
+        obj = _local_settings['obj']
+        if obj is None or _local_settings['expires'] < time.monotonic():
+            obj, created = cls.objects.get_or_create(pk=1, defaults={'closing_date': timezone.now().date()})
+            cls._store_local(obj)
+        # Copia: quien la modifique no altera la instancia cacheada
+        return copy.copy(obj)
+
+    @classmethod
+    def invalidate_cache(cls):
+        """Descarta la copia local de la configuración"""
+        _local_settings['obj'] = None
+
+    @staticmethod
+    def _store_local(obj):
+        _local_settings['obj'] = copy.copy(obj)
+        _local_settings['expires'] = time.monotonic() + AGENDA_SETTINGS_LOCAL_TTL
@@ -84,10 +84,17 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'users.CustomUser'
 
 # Authentication backends
+# Modo consolidado (por defecto): sólo EmailVerificationBackend, que ya hereda de
+# ModelBackend (permisos) y hace exactamente un hash por intento. Con ModelBackend
+# detrás, cada contraseña errónea o usuario inexistente se hasheaba dos veces.
+# AUTH_CONSOLIDATED_BACKEND=False recupera la lista anterior (las sesiones
+# iniciadas con ModelBackend sólo siguen siendo válidas si está en la lista).
+AUTH_CONSOLIDATED_BACKEND = os.environ.get('AUTH_CONSOLIDATED_BACKEND', 'True').lower() == 'true'
 AUTHENTICATION_BACKENDS = [
     'users.backends.EmailVerificationBackend',  # Custom backend with email verification
-    'django.contrib.auth.backends.ModelBackend',  # Default backend as fallback
 ]
+if not AUTH_CONSOLIDATED_BACKEND:
+    AUTHENTICATION_BACKENDS.append('django.contrib.auth.backends.ModelBackend')  # Default backend as fallback
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -99,6 +106,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Guarda el registro de actividad de la petición con un único INSERT al final
+    'schedule.audit.AuditLogMiddleware',
 ]
 
 ROOT_URLCONF = 'agenda_academica.urls'
@@ -121,6 +130,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'agenda_academica.wsgi.application'
 
+# Los tests escriben los intentos de login al momento (sin búfer en memoria)
+TEST_RUNNER = 'agenda_academica.test_runner.AgendaTestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -170,6 +182,19 @@ else:
         }
     }
 
+# Caché compartida por todos los workers de gunicorn: los contadores de
+# generación de los feeds iCal y la limitación de logins no funcionan con una
+# caché local por proceso. Por defecto se usa una tabla de la base de datos
+# (crearla con `python manage.py createcachetable`); con Redis, p. ej.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache y
+# CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'django_cache'),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -253,6 +278,52 @@ EMAIL_TIMEOUT = 30
 TEACHER_EMAIL_DOMAINS = os.environ.get('TEACHER_EMAIL_DOMAINS', 'unex.es').split(',')
 STUDENT_EMAIL_DOMAINS = os.environ.get('STUDENT_EMAIL_DOMAINS', 'alumnos.unex.es').split(',')
 
+# iCal feeds: tiempo en caché del .ics serializado y umbral (nº de actividades)
+# a partir del cual el feed se sirve en streaming desde un cursor
+ICAL_FEED_CACHE_TIMEOUT = int(os.environ.get('ICAL_FEED_CACHE_TIMEOUT', 60 * 60 * 24))
+ICAL_STREAMING_THRESHOLD = int(os.environ.get('ICAL_STREAMING_THRESHOLD', '500'))
+ICAL_STREAMING_CHUNK_SIZE = int(os.environ.get('ICAL_STREAMING_CHUNK_SIZE', '200'))
+
+# Caché de AgendaSettings: segundos que cada proceso reutiliza su copia local
+AGENDA_SETTINGS_LOCAL_TTL = int(os.environ.get('AGENDA_SETTINGS_LOCAL_TTL', '5'))
+
+# Informes PDF de la agenda: se generan en segundo plano y se cachean en disco
+AGENDA_REPORTS_DIR = Path(os.environ.get('AGENDA_REPORTS_DIR', BASE_DIR / 'reports_cache'))
+AGENDA_REPORTS_WORKERS = int(os.environ.get('AGENDA_REPORTS_WORKERS', '2'))
+# Procesos para renderizar en paralelo el informe general del centro (requiere pypdf; 0 = secuencial)
+AGENDA_REPORTS_PROCESSES = int(os.environ.get('AGENDA_REPORTS_PROCESSES', '0'))
+# Procesos para la exportación masiva de convocatorias en ZIP (0 = en el propio worker)
+CONVOCATORIA_EXPORT_PROCESSES = int(os.environ.get('CONVOCATORIA_EXPORT_PROCESSES', '2'))
+
+# Notificaciones masivas: se envían en segundo plano por lotes reutilizando
+# una conexión SMTP, a un máximo de NOTIFICATIONS_RATE_LIMIT mensajes/s (0 = sin límite)
+NOTIFICATIONS_BATCH_SIZE = int(os.environ.get('NOTIFICATIONS_BATCH_SIZE', '50'))
+NOTIFICATIONS_RATE_LIMIT = float(os.environ.get('NOTIFICATIONS_RATE_LIMIT', '10'))
+NOTIFICATIONS_WORKERS = int(os.environ.get('NOTIFICATIONS_WORKERS', '1'))
+
+# Intentos de login: se guardan por lotes desde un búfer en memoria (0 = al momento)
+# y el comando compactar_login_attempts resume por día los de más de N días
+LOGIN_ATTEMPTS_BUFFER_SIZE = int(os.environ.get('LOGIN_ATTEMPTS_BUFFER_SIZE', '50'))
+LOGIN_ATTEMPTS_FLUSH_INTERVAL = float(os.environ.get('LOGIN_ATTEMPTS_FLUSH_INTERVAL', '5'))
+LOGIN_ATTEMPTS_RETENTION_DAYS = int(os.environ.get('LOGIN_ATTEMPTS_RETENTION_DAYS', '30'))
+
+# Limitación de logins fallidos: máximo de fallos por usuario y por IP en una
+# ventana deslizante de LOGIN_THROTTLE_WINDOW segundos (0 = sin límite)
+LOGIN_THROTTLE_WINDOW = int(os.environ.get('LOGIN_THROTTLE_WINDOW', 15 * 60))
+LOGIN_THROTTLE_MAX_FAILURES_USERNAME = int(os.environ.get('LOGIN_THROTTLE_MAX_FAILURES_USERNAME', '5'))
+LOGIN_THROTTLE_MAX_FAILURES_IP = int(os.environ.get('LOGIN_THROTTLE_MAX_FAILURES_IP', '50'))
+
+# Historial de actividades: una versión completa cada N y diferencias en el resto
+# (1 = todas completas); el historial existente se reescribe con compactar_versiones
+ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL = int(os.environ.get('ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL', '10'))
+
+# Archivo de logs: archivar_logs mueve el registro de actividad de más de N días
+# a ficheros .jsonl.gz (por lotes); compactar_login_attempts --archivar hace lo
+# mismo con el detalle de los intentos de login antes de resumirlos
+LOG_ARCHIVE_DIR = Path(os.environ.get('LOG_ARCHIVE_DIR', BASE_DIR / 'log_archive'))
+LOG_ARCHIVE_DAYS = int(os.environ.get('LOG_ARCHIVE_DAYS', '365'))
+LOG_ARCHIVE_BATCH_SIZE = int(os.environ.get('LOG_ARCHIVE_BATCH_SIZE', '1000'))
+
 LOGIN_REDIRECT_URL = '/users/dashboard_redirect/'
 LOGIN_URL = '/login/'
 
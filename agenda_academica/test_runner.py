@@ -0,0 +1,22 @@
+"""
+Runner de tests del proyecto.
+
+Los intentos de login se escriben al momento (LOGIN_ATTEMPTS_BUFFER_SIZE = 0):
+con el búfer activo, el temporizador y el volcado al salir escribirían desde
+otro hilo cuando la base de datos de test ya está bloqueada o destruida.
+Los tests del búfer lo activan con override_settings.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class AgendaTestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(LOGIN_ATTEMPTS_BUFFER_SIZE=0)
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
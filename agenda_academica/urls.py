@@ -49,6 +49,7 @@ urlpatterns = [
     path('activity/delete/<int:pk>/', schedule_views.activity_delete, name='activity_delete'),
     path('activity/list/', schedule_views.activity_list, name='activity_list'),
     path('activity/logs/', schedule_views.activity_logs, name='activity_logs'),
+    path('activity/logs/page/', schedule_views.activity_logs_page, name='activity_logs_page'),
     path('activity/reactivate/<int:pk>/', schedule_views.reactivate_activity, name='reactivate_activity'),
     path('activity/toggle_approval/<int:pk>/', schedule_views.toggle_activity_approval, name='toggle_activity_approval'),
     path('calendar_views/', schedule_views.calendar_view_panel, name='calendar_view_panel'),
@@ -74,6 +75,9 @@ urlpatterns = [
     # PDF Reports
     path('reports/agenda/<int:titulacion_id>/', schedule_views.generate_agenda_report, name='generate_agenda_report_titulacion'),
     path('reports/agenda/', schedule_views.generate_agenda_report, name='generate_agenda_report_all'),
+    path('reports/agenda/status/<str:key>/', schedule_views.agenda_report_status_view, name='agenda_report_status'),
+    path('reports/agenda/download/<str:key>/', schedule_views.agenda_report_download, name='agenda_report_download'),
+    path('reports/convocatorias/', schedule_views.export_convocatorias_zip, name='export_convocatorias_zip'),
     # iCal Management
     path('ical/create_automatic/', schedule_views.create_automatic_icals, name='create_automatic_icals'),
     path('ical/management/', schedule_views.ical_management, name='ical_management'),
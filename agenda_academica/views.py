@@ -45,7 +45,8 @@ def ajax_update_agenda_settings(request):
         except ValueError:
             return JsonResponse({'success': False, 'error': 'Formato de fecha inválido. Use YYYY-MM-DD'})
         
-        # Load and update settings
+        # Load and update settings (from the database, not the cached copy)
+        AgendaSettings.invalidate_cache()
         settings = AgendaSettings.load()
         settings.closing_date = closing_date
         settings.save()
@@ -22,6 +22,7 @@ python manage.py collectstatic --noinput --clear
 # Aplicar migraciones
 echo "→ Aplicando migraciones..."
 python manage.py migrate
+python manage.py createcachetable
 
 # Crear caché de compilación para mejorar rendimiento
 echo "→ Compilando archivos Python..."
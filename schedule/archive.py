@@ -0,0 +1,128 @@
+"""
+Archivo de registros antiguos (LogActividad y LoginAttempt) en ficheros
+JSONL comprimidos con gzip.
+
+Las filas se archivan por lotes en orden de pk: cada lote se escribe en
+LOG_ARCHIVE_DIR/<registro>/<primera pk>_<fecha mínima>_<fecha máxima>.jsonl.gz
+(fechas UTC, AAAAMMDD) de forma atómica y sólo después se borran de la base
+de datos. Si el proceso se interrumpe entre ambos pasos, al relanzarlo el
+lote vuelve a empezar por la misma pk y su fichero se sustituye, de modo
+que no quedan filas duplicadas ni perdidas.
+
+leer_archivo() recorre los ficheros cuyo rango de fechas solapa con el
+pedido y devuelve las filas como diccionarios; no hace falta restaurarlas
+para consultarlas.
+"""
+import gzip
+import json
+import os
+import tempfile
+from datetime import timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from users.models import LoginAttempt
+from .models import LogActividad
+
+LOG_ARCHIVE_DIR = Path(getattr(settings, 'LOG_ARCHIVE_DIR', settings.BASE_DIR / 'log_archive'))
+LOG_ARCHIVE_BATCH_SIZE = getattr(settings, 'LOG_ARCHIVE_BATCH_SIZE', 1000)
+
+# Registro archivable -> (modelo, columnas guardadas). El nombre de usuario
+# se guarda junto al id para poder consultar el archivo sin la base de datos
+REGISTROS = {
+    'actividad': (LogActividad, (
+        'id_log', 'timestamp', 'usuario_id', 'usuario__username', 'actividad_id',
+        'object_type', 'object_name', 'object_id', 'tipo_log', 'details',
+    )),
+    'login': (LoginAttempt, ('id', 'timestamp', 'username', 'ip_address', 'success')),
+}
+
+
+def _json_default(value):
+    # isoformat completo: DjangoJSONEncoder recorta los microsegundos
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def _fecha(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%d')
+
+
+def filas_archivables(registro, queryset):
+    """Filas del queryset con las columnas que se guardan en el archivo, en orden de pk"""
+    model, campos = REGISTROS[registro]
+    return queryset.order_by(model._meta.pk.name).values(*campos)
+
+
+def escribir_lote(registro, filas):
+    """
+    Escribe un lote de filas (diccionarios de filas_archivables) en su
+    fichero y devuelve la ruta. Sustituye el fichero de un intento anterior
+    del mismo lote.
+    """
+    model, _ = REGISTROS[registro]
+    pk = model._meta.pk.name
+    directorio = LOG_ARCHIVE_DIR / registro
+    directorio.mkdir(parents=True, exist_ok=True)
+
+    primera = filas[0][pk]
+    fechas = [fila['timestamp'] for fila in filas]
+    ruta = directorio / f'{primera:012d}_{_fecha(min(fechas))}_{_fecha(max(fechas))}.jsonl.gz'
+
+    fd, tmp_name = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as output:
+            for fila in filas:
+                output.write(json.dumps(fila, default=_json_default, ensure_ascii=False).encode('utf-8'))
+                output.write(b'\n')
+        for anterior in directorio.glob(f'{primera:012d}_*.jsonl.gz'):
+            if anterior != ruta:
+                anterior.unlink(missing_ok=True)
+        os.replace(tmp_name, ruta)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return ruta
+
+
+def archivar_lote(registro, antes_de, batch_size=None):
+    """
+    Archiva y borra el siguiente lote de filas anteriores a `antes_de`.
+    Devuelve cuántas se han archivado (0 cuando no queda ninguna).
+    """
+    model, _ = REGISTROS[registro]
+    pk = model._meta.pk.name
+    filas = list(filas_archivables(registro, model.objects.filter(timestamp__lt=antes_de))[:batch_size or LOG_ARCHIVE_BATCH_SIZE])
+    if not filas:
+        return 0
+    escribir_lote(registro, filas)
+    model.objects.filter(**{f'{pk}__in': [fila[pk] for fila in filas]}).delete()
+    return len(filas)
+
+
+def leer_archivo(registro, desde=None, hasta=None, **filtros):
+    """
+    Genera las filas archivadas de `registro` con timestamp en [desde, hasta)
+    y cuyos campos coinciden con `filtros` (p. ej. tipo_log='Creation' o
+    usuario__username='ana'). El timestamp se devuelve como datetime.
+    """
+    directorio = LOG_ARCHIVE_DIR / registro
+    if not directorio.exists():
+        return
+    for ruta in sorted(directorio.glob('*.jsonl.gz')):
+        _, minima, maxima = ruta.name.split('.')[0].split('_')
+        if (desde and maxima < _fecha(desde)) or (hasta and minima > _fecha(hasta)):
+            continue
+        with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+            for linea in archivo:
+                fila = json.loads(linea)
+                fila['timestamp'] = parse_datetime(fila['timestamp'])
+                if desde and fila['timestamp'] < desde:
+                    continue
+                if hasta and fila['timestamp'] >= hasta:
+                    continue
+                if all(fila.get(campo) == valor for campo, valor in filtros.items()):
+                    yield fila
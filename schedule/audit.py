@@ -0,0 +1,70 @@
+"""
+Escritura diferida del registro de actividad (LogActividad).
+
+registrar_log() no hace el INSERT en el momento: durante una petición las
+entradas se acumulan y AuditLogMiddleware las guarda con un único
+bulk_create cuando la vista ya ha devuelto la respuesta.
+
+Cada entrada pasa al búfer cuando se confirma la transacción en la que se
+registró (transaction.on_commit; en autocommit, al momento). Si la
+transacción, o el savepoint, se revierte, la entrada se descarta con ella:
+nunca queda en el registro una acción que no llegó a guardarse.
+
+Fuera de una petición (comandos, shell) cada entrada se escribe al
+confirmarse su transacción.
+"""
+import logging
+from contextvars import ContextVar
+
+from django.db import transaction
+
+from .models import LogActividad
+
+logger = logging.getLogger(__name__)
+
+_pendientes = ContextVar('audit_log_pendientes', default=None)
+
+
+def registrar_log(**campos):
+    """Registra una entrada de LogActividad (mismos argumentos que el modelo)"""
+    entrada = LogActividad(**campos)
+    transaction.on_commit(lambda: _encolar(entrada))
+
+
+def _encolar(entrada):
+    pendientes = _pendientes.get()
+    if pendientes is None:
+        _guardar([entrada])
+    else:
+        pendientes.append(entrada)
+
+
+def _guardar(entradas):
+    try:
+        LogActividad.objects.bulk_create(entradas)
+    except Exception as e:
+        # Una entrada inválida (p. ej. su actividad ya no existe) no debe
+        # llevarse por delante al resto del lote
+        logger.warning(f"Error saving {len(entradas)} activity log entries, retrying one by one: {e}")
+        for entrada in entradas:
+            try:
+                LogActividad.objects.bulk_create([entrada])
+            except Exception as e:
+                logger.error(f"Error saving activity log entry '{entrada.tipo_log}' for {entrada.object_name}: {e}")
+
+
+class AuditLogMiddleware:
+    """Guarda de una vez las entradas de LogActividad registradas durante la petición"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _pendientes.set([])
+        try:
+            return self.get_response(request)
+        finally:
+            pendientes = _pendientes.get()
+            _pendientes.reset(token)
+            if pendientes:
+                _guardar(pendientes)
@@ -0,0 +1,314 @@
+"""
+PDF de convocatoria de actividades.
+
+La generación se divide en dos pasos:
+
+- `convocatoria_data` lee la actividad (con sus grupos y asignaturas) y
+  devuelve un diccionario de textos ya formateados. Es el único paso que
+  usa la base de datos y la localización de Django.
+- `render_convocatoria_pdf` maqueta ese diccionario con reportlab. No usa
+  Django, de modo que puede ejecutarse en procesos del pool sin inicializar
+  Django en ellos. Los estilos se construyen una sola vez por proceso.
+
+`stream_convocatorias_zip` combina ambos para la exportación masiva: los PDF
+se renderizan en un pool de procesos propio de cada exportación y se van
+escribiendo en un ZIP que se envía por trozos.
+"""
+import io
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import multiprocessing
+
+from django.conf import settings
+from django.utils import formats, timezone
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+# Procesos para la exportación masiva (0: renderizar en el propio worker web)
+CONVOCATORIA_EXPORT_PROCESSES = getattr(settings, 'CONVOCATORIA_EXPORT_PROCESSES', 2)
+
+
+def format_spanish_datetime(dt, format_type='long'):
+    """
+    Formatea datetime en español usando el sistema de localización de Django
+    """
+    if format_type == 'long':
+        # Formato: "25 de enero de 2025, 14:30"
+        return formats.date_format(dt, "j \\d\\e F \\d\\e Y, H:i")
+    elif format_type == 'short':
+        # Formato: "25/01/2025 14:30"
+        return formats.date_format(dt, "d/m/Y H:i")
+    else:
+        return formats.date_format(dt, format_type)
+
+
+def convocatoria_filename(activity):
+    """Nombre del PDF de convocatoria de una actividad"""
+    return f'convocatoria_{activity.nombre.replace(" ", "_").replace("/", "-")}.pdf'
+
+
+def convocatoria_data(activity):
+    """
+    Textos de la convocatoria de una actividad, ya formateados.
+
+    Usa `activity.grupos.all()` y `activity.asignaturas.all()`, por lo que
+    aprovecha el prefetch_related del queryset si lo hay.
+    """
+    if activity.evaluable:
+        evaluation = [('Evaluable:', f'Sí ({activity.porcentaje_evaluacion}%)'),
+                      ('Recuperable:', 'No' if activity.no_recuperable else 'Sí')]
+    else:
+        evaluation = [('Evaluable:', 'No')]
+
+    grupos = sorted(activity.grupos.all(), key=lambda g: g.orden)
+
+    return {
+        'nombre': activity.nombre,
+        'tipo': activity.tipo_actividad.nombre,
+        'fecha_inicio': format_spanish_datetime(timezone.localtime(activity.fecha_inicio), 'long'),
+        'fecha_fin': format_spanish_datetime(timezone.localtime(activity.fecha_fin), 'long'),
+        'asignaturas': ', '.join([asig.nombre for asig in activity.asignaturas.all()]),
+        'evaluacion': evaluation,
+        'grupos': [{
+            'nombre': grupo.nombre_grupo,
+            'fecha_inicio': format_spanish_datetime(timezone.localtime(grupo.fecha_inicio), 'short'),
+            'fecha_fin': format_spanish_datetime(timezone.localtime(grupo.fecha_fin), 'short'),
+            'lugar': grupo.lugar or 'No especificado',
+            'descripcion': grupo.descripcion or '-',
+        } for grupo in grupos],
+        'descripcion': activity.descripcion,
+        'generado': format_spanish_datetime(timezone.localtime(timezone.now()), 'long'),
+    }
+
+
+@lru_cache(maxsize=None)
+def convocatoria_styles():
+    """Estilos del PDF de convocatoria, construidos una vez por proceso"""
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=colors.darkblue
+        ),
+        'subtitle': ParagraphStyle(
+            'CustomSubtitle',
+            parent=styles['Heading2'],
+            fontSize=14,
+            spaceAfter=12,
+            textColor=colors.darkblue
+        ),
+        'normal': ParagraphStyle(
+            'CustomNormal',
+            parent=styles['Normal'],
+            fontSize=11,
+            spaceAfter=6
+        ),
+        # Estilo para texto de info que puede ser largo
+        'info_cell': ParagraphStyle(
+            'InfoCellStyle',
+            parent=styles['Normal'],
+            fontSize=10,
+            wordWrap='CJK',
+            alignment=TA_LEFT
+        ),
+        # Crear un estilo para texto de celda que puede expandirse
+        'cell': ParagraphStyle(
+            'CellStyle',
+            parent=styles['Normal'],
+            fontSize=9,
+            wordWrap='CJK',  # Permite mejor ajuste de líneas
+            alignment=TA_LEFT
+        ),
+        'footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=9,
+            alignment=TA_CENTER,
+            textColor=colors.grey
+        ),
+        'info_table': TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            # No aplicar FONTNAME a columna derecha ya que puede contener Paragraphs
+            ('FONTSIZE', (0, 0), (0, -1), 10),  # Solo aplicar a columna izquierda
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),  # TOP alineación para mejor texto multilinea
+            ('LEFTPADDING', (0, 0), (-1, -1), 6),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ]),
+        'groups_table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (2, -1), 'CENTER'),  # Centrar solo las primeras 3 columnas (Grupo, fechas)
+            ('ALIGN', (3, 1), (-1, -1), 'LEFT'),    # Alinear a la izquierda lugar y descripción
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (0, 1), (2, -1), 'Helvetica'),  # Solo para texto plano (no Paragraphs)
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),  # Alinear todo al top para mejor texto multilinea
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),  # Alternar colores de filas
+        ]),
+    }
+
+
+def render_convocatoria_pdf(data, output=None):
+    """
+    Maqueta la convocatoria a partir de `convocatoria_data`. Si se indica
+    `output` escribe en él; si no, devuelve el PDF como bytes.
+    """
+    styles = convocatoria_styles()
+    target = output if output is not None else io.BytesIO()
+
+    # Create PDF document
+    doc = SimpleDocTemplate(target, pagesize=A4,
+                          rightMargin=2*cm, leftMargin=2*cm,
+                          topMargin=2*cm, bottomMargin=2*cm)
+
+    # Build content
+    content = []
+
+    # Title
+    content.append(Paragraph("CONVOCATORIA DE ACTIVIDAD", styles['title']))
+    content.append(Spacer(1, 0.5*cm))
+
+    # Activity basic info
+    content.append(Paragraph("INFORMACIÓN GENERAL", styles['subtitle']))
+
+    info_data = [
+        ['Nombre de la Actividad:', Paragraph(data['nombre'], styles['info_cell'])],
+        ['Tipo de Actividad:', data['tipo']],
+        ['Fecha de Inicio:', data['fecha_inicio']],
+        ['Fecha de Fin:', data['fecha_fin']],
+        ['Asignaturas:', Paragraph(data['asignaturas'], styles['info_cell'])],
+    ]
+    info_data.extend([label, value] for label, value in data['evaluacion'])
+
+    info_table = Table(info_data, colWidths=[5*cm, 10*cm])
+    info_table.setStyle(styles['info_table'])
+
+    content.append(info_table)
+    content.append(Spacer(1, 0.5*cm))
+
+    # Groups information (if multi-group)
+    if data['grupos']:
+        content.append(Paragraph("GRUPOS Y HORARIOS", styles['subtitle']))
+
+        group_data = [['Grupo', 'Fecha/Hora Inicio', 'Fecha/Hora Fin', 'Lugar', 'Descripción']]
+        for grupo in data['grupos']:
+            # Usar Paragraph para las celdas que pueden tener mucho texto
+            group_data.append([
+                grupo['nombre'],
+                grupo['fecha_inicio'],
+                grupo['fecha_fin'],
+                Paragraph(grupo['lugar'], styles['cell']),
+                Paragraph(grupo['descripcion'], styles['cell'])
+            ])
+
+        groups_table = Table(group_data, colWidths=[2*cm, 3.5*cm, 3.5*cm, 3*cm, 3*cm])
+        groups_table.setStyle(styles['groups_table'])
+
+        content.append(groups_table)
+        content.append(Spacer(1, 0.5*cm))
+
+    # Description
+    if data['descripcion']:
+        content.append(Paragraph("DESCRIPCIÓN", styles['subtitle']))
+        content.append(Paragraph(data['descripcion'], styles['normal']))
+        content.append(Spacer(1, 0.5*cm))
+
+    # Footer
+    content.append(Spacer(1, 1*cm))
+    content.append(Paragraph(f"Documento generado el {data['generado']}", styles['footer']))
+
+    # Build PDF
+    doc.build(content)
+
+    if output is None:
+        return target.getvalue()
+
+
+# ==================== EXPORTACIÓN MASIVA ====================
+
+class _ZipStream:
+    """Destino de zipfile que acumula lo escrito para enviarlo por trozos"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_convocatorias_zip(activities, batch_size=20):
+    """
+    Genera por trozos un ZIP con la convocatoria de cada actividad.
+
+    Las actividades se leen en bloques de `batch_size`; los datos de cada
+    bloque se preparan en este proceso y los PDF se maquetan en el pool
+    (o aquí mismo si CONVOCATORIA_EXPORT_PROCESSES es 0), de modo que la
+    memoria usada depende del bloque y no del número de actividades.
+
+    Cada exportación crea su pool y lo cierra al terminar o si el cliente
+    se desconecta: un proceso caído no deja inservible el pool de las
+    siguientes. Se usa 'spawn' para no heredar las conexiones a la base de
+    datos; los procesos sólo maquetan.
+    """
+    stream = _ZipStream()
+    pool = None
+    if CONVOCATORIA_EXPORT_PROCESSES > 0:
+        pool = ProcessPoolExecutor(
+            max_workers=CONVOCATORIA_EXPORT_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    render = pool.map if pool is not None else map
+
+    try:
+        with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+            batch = []
+            for activity in activities.iterator(chunk_size=batch_size):
+                batch.append((f"{activity.pk}_{convocatoria_filename(activity)}", convocatoria_data(activity)))
+                if len(batch) == batch_size:
+                    yield from _write_batch(archive, stream, batch, render)
+                    batch = []
+            if batch:
+                yield from _write_batch(archive, stream, batch, render)
+
+        yield stream.drain()
+    finally:
+        if pool is not None:
+            # Sin esperar: si el cliente se ha ido no se bloquea el worker web
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _write_batch(archive, stream, batch, render):
+    names = [name for name, _ in batch]
+    for name, pdf in zip(names, render(render_convocatoria_pdf, [data for _, data in batch])):
+        archive.writestr(name, pdf)
+        yield stream.drain()
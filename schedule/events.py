@@ -0,0 +1,365 @@
+"""
+Motor de proyección de actividades a eventos de calendario.
+
+Todas las vistas de calendario (dashboard del profesor, calendario general,
+calendario del estudiante y feeds iCal) leen las actividades a través de este
+módulo. Los datos se cargan una sola vez en un número fijo de consultas
+(actividades + grupos + asignaturas) y se convierten en filas en memoria
+(`ActivityRow`) que aplican la regla común: si la actividad tiene
+ActividadGrupo se usa un evento por grupo, si no se usan los campos legacy
+de la propia actividad. Cada feed sólo decide cómo serializar esas filas.
+"""
+from datetime import datetime, time
+
+from django.db.models import OuterRef, Prefetch, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from icalendar import Event
+
+from .models import ActividadGrupo, ActividadVersion
+
+
+def get_closing_date():
+    """Fecha de cierre de la agenda, con la fecha actual como valor por defecto"""
+    from agenda_academica.models import AgendaSettings
+
+    try:
+        return AgendaSettings.load().closing_date
+    except Exception:
+        # Fallback if AgendaSettings is not configured or an error occurs
+        return timezone.now().date()
+
+
+def parse_window_bound(value):
+    """
+    Convierte un límite 'start'/'end' de FullCalendar (fecha o fecha y hora
+    ISO 8601) en datetime aware. Devuelve None si no es válido.
+    """
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            moment = datetime.combine(day, time.min)
+    except ValueError:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def get_date_window(params):
+    """Rango visible (start, end) enviado por FullCalendar, o None si no viene completo"""
+    start = parse_window_bound(params.get('start'))
+    end = parse_window_bound(params.get('end'))
+    if start is None or end is None:
+        return None
+    return start, end
+
+
+def filter_date_window(activities, window):
+    """
+    Restringe las actividades a las que tienen algún evento en el rango
+    [start, end): grupos que se solapan con él o, para las actividades sin
+    grupos (legacy), sus propias fechas. Hace falta .distinct() después.
+    """
+    if window is None:
+        return activities
+    start, end = window
+    return activities.filter(
+        Q(grupos__fecha_inicio__lt=end, grupos__fecha_fin__gt=start) |
+        Q(grupos__isnull=True, fecha_inicio__lt=end, fecha_fin__gt=start)
+    )
+
+
+def with_related(activities):
+    """Añade al queryset la carga en bloque de tipo, grupos y asignaturas"""
+    return activities.select_related('tipo_actividad').prefetch_related(
+        Prefetch('grupos', queryset=ActividadGrupo.objects.order_by('orden', 'fecha_inicio')),
+        'asignaturas',
+    )
+
+
+def prefetch_actividades(activities):
+    """
+    Devuelve las actividades como lista con tipo, grupos y asignaturas precargados.
+
+    Independientemente del número de actividades se ejecutan tres consultas.
+    Los grupos quedan ordenados por 'orden' igual que en el resto de vistas.
+    """
+    return list(with_related(activities))
+
+
+class ActivityRow:
+    """Actividad con sus grupos, asignaturas y tipo ya resueltos en memoria"""
+
+    def __init__(self, activity):
+        self.activity = activity
+        self.grupos = list(activity.grupos.all())
+        self.asignaturas = list(activity.asignaturas.all())
+        self.subject_ids = {s.id for s in self.asignaturas}
+        self.subject_names = ", ".join(s.nombre for s in self.asignaturas)
+        self.activity_type = activity.tipo_actividad.nombre
+
+    @property
+    def is_multi_group(self):
+        return len(self.grupos) > 1
+
+    def base_props(self):
+        """extendedProps comunes a todos los eventos de la actividad"""
+        activity = self.activity
+        return {
+            'activity_type': self.activity_type,
+            'subjects': self.subject_names,
+            'is_approved': activity.aprobada,
+            'is_active': activity.activa,
+            'evaluable': activity.evaluable,
+            'percentage': activity.porcentaje_evaluacion,
+        }
+
+
+def load_rows(activities, window=None):
+    """
+    Carga un queryset de actividades y lo convierte en filas de proyección.
+
+    Con `window` (start, end) sólo se cargan las actividades con algún
+    evento en ese rango. Se cargan todos sus grupos para que títulos e ids
+    de los eventos no dependan del rango visible.
+    """
+    if window is not None:
+        activities = filter_date_window(activities, window).distinct()
+    return [ActivityRow(activity) for activity in prefetch_actividades(activities)]
+
+
+def iter_rows(activities, chunk_size=200):
+    """
+    Recorre las actividades con un cursor de servidor en bloques de
+    `chunk_size`, precargando grupos y asignaturas de cada bloque. La memoria
+    usada depende del tamaño del bloque, no del total de actividades.
+    """
+    for activity in with_related(activities).iterator(chunk_size=chunk_size):
+        yield ActivityRow(activity)
+
+
+def _event_class_names(fecha, closing_date):
+    """Clase CSS según la fecha del evento respecto a la fecha de cierre"""
+    return ['past-event' if fecha.date() < closing_date else 'future-event']
+
+
+def build_teacher_events(rows, closing_date, teacher_subject_ids):
+    """
+    Construye el JSON de FullCalendar usado por el dashboard del profesor.
+
+    Las actividades multi-grupo generan una fila resumen para la tabla y un
+    evento 'calendar-only' por grupo; las de un único grupo y las legacy
+    (sin ActividadGrupo) generan un único evento.
+    """
+    teacher_subject_ids = set(teacher_subject_ids)
+    data = []
+
+    for row in rows:
+        activity = row.activity
+        grupos = row.grupos
+        common_props = {
+            **row.base_props(),
+            'is_own': not teacher_subject_ids.isdisjoint(row.subject_ids),
+        }
+
+        if row.is_multi_group:
+            # Multi-grupo: una fila para la tabla y un evento por grupo en el calendario
+            primer_grupo = grupos[0]
+            grupos_info = [{
+                'nombre': g.nombre_grupo,
+                'fecha_inicio': g.fecha_inicio.isoformat(),
+                'fecha_fin': g.fecha_fin.isoformat(),
+                'lugar': g.lugar or '',
+                'descripcion': g.descripcion or ''
+            } for g in grupos]
+
+            data.append({
+                'id': activity.id,
+                'activity_id': activity.id,
+                'title': f"{activity.nombre} ({len(grupos)} grupos)",
+                'start': primer_grupo.fecha_inicio.isoformat(),
+                'end': primer_grupo.fecha_fin.isoformat(),
+                'classNames': _event_class_names(primer_grupo.fecha_inicio, closing_date),
+                'extendedProps': {
+                    'description': activity.descripcion or primer_grupo.descripcion,
+                    **common_props,
+                    'is_multi_group': True,
+                    'grupos_count': len(grupos),
+                    'grupos_info': grupos_info
+                }
+            })
+
+            for grupo in grupos:
+                data.append({
+                    'id': f"{activity.id}_grupo_{grupo.id}",
+                    'activity_id': activity.id,
+                    'grupo_id': grupo.id,
+                    'title': f"{activity.nombre} - Grupo {grupo.nombre_grupo}",
+                    'start': grupo.fecha_inicio.isoformat(),
+                    'end': grupo.fecha_fin.isoformat(),
+                    'classNames': _event_class_names(grupo.fecha_inicio, closing_date) + ['calendar-only'],
+                    'extendedProps': {
+                        'description': grupo.descripcion or activity.descripcion,
+                        **common_props,
+                        'grupo_nombre': grupo.nombre_grupo,
+                        'is_multi_group': True,
+                        'is_calendar_event': True
+                    }
+                })
+        elif grupos:
+            grupo = grupos[0]
+            data.append({
+                'id': activity.id,
+                'activity_id': activity.id,
+                'grupo_id': grupo.id,
+                'title': activity.nombre,
+                'start': grupo.fecha_inicio.isoformat(),
+                'end': grupo.fecha_fin.isoformat(),
+                'classNames': _event_class_names(grupo.fecha_inicio, closing_date),
+                'extendedProps': {
+                    'description': grupo.descripcion or activity.descripcion,
+                    **common_props,
+                    'is_multi_group': False
+                }
+            })
+        else:
+            # Sistema legacy: campos de fecha directamente en la actividad
+            data.append({
+                'id': activity.id,
+                'activity_id': activity.id,
+                'title': activity.nombre,
+                'start': activity.fecha_inicio.isoformat(),
+                'end': activity.fecha_fin.isoformat(),
+                'classNames': _event_class_names(activity.fecha_inicio, closing_date),
+                'extendedProps': {
+                    'description': activity.descripcion,
+                    **common_props,
+                    'is_multi_group': False
+                }
+            })
+
+    return data
+
+
+def build_calendar_events(rows, closing_date):
+    """
+    Construye el JSON de FullCalendar con un evento por grupo (o por
+    actividad en el sistema legacy). Usado por el calendario general y
+    por el calendario del estudiante.
+    """
+    data = []
+
+    for row in rows:
+        activity = row.activity
+        if row.grupos:
+            for grupo in row.grupos:
+                title = activity.nombre
+                if row.is_multi_group:
+                    title = f"{activity.nombre} - Grupo {grupo.nombre_grupo}"
+
+                data.append({
+                    'id': f"{activity.id}_grupo_{grupo.id}",  # Unique ID for each group
+                    'activity_id': activity.id,  # Keep original activity ID for editing
+                    'grupo_id': grupo.id,
+                    'title': title,
+                    'start': grupo.fecha_inicio.isoformat(),
+                    'end': grupo.fecha_fin.isoformat(),
+                    'classNames': _event_class_names(grupo.fecha_inicio, closing_date),
+                    'extendedProps': {
+                        'description': grupo.descripcion or activity.descripcion,
+                        **row.base_props(),
+                        'grupo_nombre': grupo.nombre_grupo,
+                        'is_multi_group': row.is_multi_group
+                    }
+                })
+        else:
+            data.append({
+                'id': activity.id,
+                'activity_id': activity.id,
+                'title': activity.nombre,
+                'start': activity.fecha_inicio.isoformat(),
+                'end': activity.fecha_fin.isoformat(),
+                'classNames': _event_class_names(activity.fecha_inicio, closing_date),
+                'extendedProps': {
+                    'description': activity.descripcion,
+                    **row.base_props(),
+                    'is_multi_group': False
+                }
+            })
+
+    return data
+
+
+def with_version_info(activities):
+    """
+    Anota cada actividad con su última versión (ActividadVersion) para los
+    campos SEQUENCE y LAST-MODIFIED de iCal, sin consultas por actividad.
+    """
+    latest = ActividadVersion.objects.filter(
+        actividad_original=OuterRef('pk')
+    ).order_by('-version_numero')
+    return activities.annotate(
+        ical_sequence=Subquery(latest.values('version_numero')[:1]),
+        ical_version_date=Subquery(latest.values('fecha_modificacion')[:1]),
+    )
+
+
+def _ical_uid(activity, grupo=None):
+    """UID estable: el mismo evento conserva el UID entre descargas del feed"""
+    if grupo is None:
+        return f"actividad-{activity.id}@agenda-academica"
+    return f"actividad-{activity.id}-grupo-{grupo.id}@agenda-academica"
+
+
+def build_ical_events(rows):
+    """
+    Genera un VEVENT de icalendar por grupo (o por actividad legacy).
+
+    Cada evento lleva un UID determinista (actividad + grupo) y SEQUENCE /
+    LAST-MODIFIED tomados de la última ActividadVersion, de modo que los
+    clientes de calendario pueden aplicar cambios incrementales. Si el
+    queryset no se anotó con `with_version_info`, SEQUENCE es 0.
+    """
+    for row in rows:
+        activity = row.activity
+        sequence = getattr(activity, 'ical_sequence', None) or 0
+        version_date = getattr(activity, 'ical_version_date', None)
+
+        if row.grupos:
+            slots = [
+                (grupo, grupo.fecha_inicio, grupo.fecha_fin, grupo.descripcion or activity.descripcion)
+                for grupo in row.grupos
+            ]
+        else:
+            slots = [(None, activity.fecha_inicio, activity.fecha_fin, activity.descripcion)]
+
+        for grupo, start, end, description in slots:
+            summary = activity.nombre
+            if row.is_multi_group:
+                summary = f"{activity.nombre} - Grupo {grupo.nombre_grupo}"
+
+            # La fecha más reciente entre la versión y el propio registro: las
+            # ediciones sin versión (p. ej. cambios de grupo) también cuentan
+            last_modified = max(
+                d for d in (version_date, activity.fecha_modificacion,
+                            grupo.fecha_modificacion if grupo else None) if d is not None
+            )
+
+            event = Event()
+            event.add('uid', _ical_uid(activity, grupo))
+            event.add('dtstamp', last_modified)
+            event.add('last-modified', last_modified)
+            event.add('sequence', sequence)
+            event.add('summary', summary)
+            event.add('dtstart', start)
+            event.add('dtend', end)
+            event.add('description', description)
+            if grupo and grupo.lugar:
+                event.add('location', grupo.lugar)
+            yield event
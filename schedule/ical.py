@@ -0,0 +1,175 @@
+"""
+Feeds iCal de las vistas de calendario (VistaCalendario).
+
+Los clientes de calendario consultan cada feed cada pocos minutos. Para no
+regenerar el .ics en cada consulta, cada feed tiene un sello de versión
+(ETag + Last-Modified) derivado de la última modificación de sus actividades
+y grupos, y el cuerpo serializado se guarda en caché junto a ese sello.
+
+Una marca global de generación, renovada por las señales de
+schedule.signals cuando cambia una actividad, permite servir la caché sin
+recalcular el sello mientras nada haya cambiado. La marca sólo es fiable si
+la caché es compartida por todos los workers (CACHES en settings); con una
+caché local por proceso, los demás workers no verían la invalidación.
+
+Los feeds grandes (p. ej. los de titulación completa creados por
+create_automatic_icals) no se cachean ni se construyen en memoria: se
+escriben VEVENT a VEVENT desde un cursor de servidor con
+`stream_ical_feed`, de modo que la memoria usada no depende del tamaño del
+feed.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from icalendar import Calendar
+
+from .events import load_rows, iter_rows, build_ical_events, with_version_info
+from .models import Actividad, ActividadGrupo
+
+ICAL_FEED_CACHE_TIMEOUT = getattr(settings, 'ICAL_FEED_CACHE_TIMEOUT', 60 * 60 * 24)
+# Feeds con más actividades que este umbral se sirven en streaming
+ICAL_STREAMING_THRESHOLD = getattr(settings, 'ICAL_STREAMING_THRESHOLD', 500)
+ICAL_STREAMING_CHUNK_SIZE = getattr(settings, 'ICAL_STREAMING_CHUNK_SIZE', 200)
+
+GENERATION_KEY = 'schedule:ical:generation'
+
+
+def invalidate_ical_feeds():
+    """Invalida todos los feeds cacheados renovando la generación"""
+    # Un valor nuevo en lugar de incr(): incr() no conserva la caducidad en
+    # todos los backends y, si la clave caducara, un contador reiniciado
+    # podría coincidir con el de un feed cacheado antiguo
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def _current_generation():
+    return cache.get_or_set(GENERATION_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def _feed_cache_key(calendar_view):
+    return f'schedule:ical:feed:{calendar_view.token}'
+
+
+def get_feed_activities(calendar_view):
+    """Actividades incluidas en el feed según sus asignaturas y tipos"""
+    activities = Actividad.objects.all()
+
+    asignatura_ids = list(calendar_view.asignaturas.values_list('id', flat=True))
+    tipo_ids = list(calendar_view.tipos_actividad.values_list('id', flat=True))
+
+    if asignatura_ids:
+        activities = activities.filter(asignaturas__in=asignatura_ids)
+    if tipo_ids:
+        activities = activities.filter(tipo_actividad__in=tipo_ids)
+
+    return activities.distinct(), asignatura_ids, tipo_ids
+
+
+def get_feed_version(calendar_view, activities, asignatura_ids, tipo_ids):
+    """
+    Calcula el sello de versión del feed: (etag, last_modified, nº de actividades).
+
+    La fecha de última modificación detecta altas y cambios; los contadores
+    de actividades y grupos detectan además los borrados.
+    """
+    activity_ids = activities.values('pk')
+    actividad_stats = Actividad.objects.filter(pk__in=activity_ids).aggregate(
+        last=Max('fecha_modificacion'), total=Count('pk')
+    )
+    grupo_stats = ActividadGrupo.objects.filter(actividad__in=activity_ids).aggregate(
+        last=Max('fecha_modificacion'), total=Count('pk')
+    )
+
+    last_modified = max(
+        (d for d in (actividad_stats['last'], grupo_stats['last']) if d is not None),
+        default=None
+    )
+
+    raw = '|'.join([
+        str(calendar_view.token),
+        calendar_view.nombre,
+        ','.join(map(str, sorted(asignatura_ids))),
+        ','.join(map(str, sorted(tipo_ids))),
+        last_modified.isoformat() if last_modified else '',
+        str(actividad_stats['total']),
+        str(grupo_stats['total']),
+    ])
+    etag = '"%s"' % hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return etag, last_modified, actividad_stats['total']
+
+
+def _new_calendar():
+    cal = Calendar()
+    cal.add('prodid', '-//My Calendar App//mxm.dk//')
+    cal.add('version', '2.0')
+    return cal
+
+
+def render_ical_feed(activities):
+    """Serializa las actividades del feed a un calendario .ics"""
+    cal = _new_calendar()
+
+    for event in build_ical_events(load_rows(with_version_info(activities))):
+        cal.add_component(event)
+
+    return cal.to_ical()
+
+
+def stream_ical_feed(activities, chunk_size=None):
+    """
+    Genera el .ics por trozos: cabecera del VCALENDAR, un VEVENT por evento
+    leído del cursor y cierre. Pensado para StreamingHttpResponse.
+    """
+    chunk_size = chunk_size or ICAL_STREAMING_CHUNK_SIZE
+
+    # Calendar vacío serializado: "BEGIN:VCALENDAR ... END:VCALENDAR\r\n"
+    empty = _new_calendar().to_ical()
+    footer = b'END:VCALENDAR\r\n'
+    yield empty[:-len(footer)]
+
+    for event in build_ical_events(iter_rows(with_version_info(activities), chunk_size=chunk_size)):
+        yield event.to_ical()
+
+    yield footer
+
+
+def get_ical_feed(calendar_view):
+    """
+    Devuelve el feed como dict con 'etag', 'last_modified' y 'body'.
+
+    Si la generación no ha cambiado desde que se cacheó, no se consulta la
+    base de datos. Si ha cambiado, se recalcula el sello y sólo se vuelve a
+    serializar cuando el sello del feed es distinto.
+
+    Los feeds con más de ICAL_STREAMING_THRESHOLD actividades tienen 'body'
+    None: se sirven con `stream_ical_feed`, pero su sello sí se cachea para
+    poder responder 304 sin recorrer las actividades.
+    """
+    key = _feed_cache_key(calendar_view)
+    generation = _current_generation()
+    cached = cache.get(key)
+
+    if cached and cached['generation'] == generation:
+        return cached
+
+    activities, asignatura_ids, tipo_ids = get_feed_activities(calendar_view)
+    etag, last_modified, total = get_feed_version(calendar_view, activities, asignatura_ids, tipo_ids)
+
+    if total > ICAL_STREAMING_THRESHOLD:
+        body = None
+    elif cached and cached['etag'] == etag and cached['body'] is not None:
+        body = cached['body']
+    else:
+        body = render_ical_feed(activities)
+
+    feed = {
+        'generation': generation,
+        'etag': etag,
+        'last_modified': last_modified,
+        'body': body,
+    }
+    cache.set(key, feed, ICAL_FEED_CACHE_TIMEOUT)
+    return feed
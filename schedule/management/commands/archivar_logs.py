@@ -0,0 +1,68 @@
+"""
+Command para archivar en ficheros JSONL comprimidos el registro de actividad antiguo
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from schedule.archive import LOG_ARCHIVE_BATCH_SIZE, LOG_ARCHIVE_DIR, archivar_lote
+from schedule.models import LogActividad
+
+
+class Command(BaseCommand):
+    help = ('Mueve las entradas de LogActividad de más de N días a ficheros .jsonl.gz en '
+            'LOG_ARCHIVE_DIR, por lotes. Se puede interrumpir y relanzar. Los intentos de login '
+            'se archivan con compactar_login_attempts --archivar')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=getattr(settings, 'LOG_ARCHIVE_DAYS', 365),
+            help='Días de registro que se conservan en la base de datos (por defecto LOG_ARCHIVE_DAYS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=LOG_ARCHIVE_BATCH_SIZE,
+            help='Entradas por fichero (por defecto LOG_ARCHIVE_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--max-lotes',
+            type=int,
+            default=0,
+            help='Detenerse tras N lotes (0 = hasta terminar)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Muestra cuántas entradas se archivarían sin hacer cambios',
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--dias no puede ser negativo y --batch-size debe ser mayor que 0')
+
+        # Límite a medianoche: el mismo durante todo el día, para relanzar con los mismos lotes
+        limite = timezone.make_aware(
+            datetime.combine(timezone.localdate() - timedelta(days=options['dias']), time.min),
+            timezone.get_current_timezone(),
+        )
+        if options['dry_run']:
+            total = LogActividad.objects.filter(timestamp__lt=limite).count()
+            self.stdout.write(f'Se archivarían {total} entradas anteriores a {limite:%Y-%m-%d}')
+            return
+
+        lotes = total = 0
+        while not options['max_lotes'] or lotes < options['max_lotes']:
+            filas = archivar_lote('actividad', limite, options['batch_size'])
+            if not filas:
+                break
+            lotes += 1
+            total += filas
+            self.stdout.write(f'Lote {lotes}: {filas} entradas')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} entradas anteriores a {limite:%Y-%m-%d} archivadas en {LOG_ARCHIVE_DIR / "actividad"}'
+        ))
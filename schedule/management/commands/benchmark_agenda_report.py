@@ -0,0 +1,112 @@
+import io
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from academics.models import Asignatura, Titulacion
+from schedule.models import Actividad, TipoActividad
+from schedule.reports import REPORTLAB_AVAILABLE, build_agenda_pdf
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Mide el tiempo de generación del informe PDF de la agenda con un número '
+            'creciente de actividades (los datos de prueba se descartan al terminar)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='100,200,400,800',
+            help='Número de actividades de cada ejecución, separados por comas',
+        )
+        parser.add_argument(
+            '--subjects',
+            type=int,
+            default=20,
+            help='Número de asignaturas de la titulación de prueba',
+        )
+
+    def handle(self, *args, **options):
+        if not REPORTLAB_AVAILABLE:
+            raise CommandError('reportlab no está instalado')
+
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes debe ser una lista de enteros separados por comas')
+
+        results = []
+        try:
+            with transaction.atomic():
+                titulacion, asignaturas, tipo = self._create_fixtures(options['subjects'])
+                created = 0
+                for size in sizes:
+                    self._create_activities(asignaturas, tipo, created, size)
+                    created = size
+                    results.append((size, *self._measure(titulacion)))
+                # Los datos de prueba no se conservan
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{'Actividades':>12} {'Consultas':>10} {'Tiempo (s)':>11} {'ms/actividad':>13}")
+        for size, queries, elapsed in results:
+            self.stdout.write(f"{size:>12} {queries:>10} {elapsed:>11.3f} {elapsed * 1000 / size:>13.2f}")
+
+        # Escalado lineal: el coste por actividad se mantiene estable
+        first, last = results[0], results[-1]
+        ratio = (last[2] / last[0]) / (first[2] / first[0])
+        self.stdout.write(f"Relación coste por actividad (mayor/menor): {ratio:.2f}")
+        if first[1] != last[1]:
+            self.stdout.write(self.style.WARNING(
+                f"El número de consultas crece con las actividades ({first[1]} -> {last[1]})"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Número de consultas constante: {first[1]}"))
+
+    def _create_fixtures(self, subject_count):
+        titulacion = Titulacion.objects.create(nombre='Benchmark informe agenda')
+        asignaturas = [
+            Asignatura.objects.create(
+                nombre=f'Asignatura benchmark {i}', titulacion=titulacion,
+                curso=i % 4 + 1, semestre=i % 2 + 1
+            )
+            for i in range(subject_count)
+        ]
+        tipo, _ = TipoActividad.objects.get_or_create(nombre='Examen Parcial')
+        return titulacion, asignaturas, tipo
+
+    def _create_activities(self, asignaturas, tipo, start_index, end_index):
+        start = timezone.now()
+        activities = Actividad.objects.bulk_create([
+            Actividad(
+                nombre=f'Actividad benchmark {i}',
+                tipo_actividad=tipo,
+                fecha_inicio=start + timedelta(hours=i),
+                fecha_fin=start + timedelta(hours=i + 1),
+                activa=True,
+            )
+            for i in range(start_index, end_index)
+        ])
+        through = Actividad.asignaturas.through
+        links = []
+        for offset, activity in enumerate(activities):
+            i = start_index + offset
+            # Cada actividad en dos asignaturas (a veces de cursos distintos)
+            for asignatura in (asignaturas[i % len(asignaturas)], asignaturas[(i + 1) % len(asignaturas)]):
+                links.append(through(actividad_id=activity.pk, asignatura_id=asignatura.pk))
+        through.objects.bulk_create(links)
+
+    def _measure(self, titulacion):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            build_agenda_pdf([titulacion], io.BytesIO())
+            elapsed = time.perf_counter() - started
+        return len(ctx.captured_queries), elapsed
@@ -0,0 +1,49 @@
+"""
+Command para guardar el historial de versiones existente en formato compacto
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from schedule.models import ActividadVersion
+from schedule.versioning import ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL, compactar_actividad
+
+
+class Command(BaseCommand):
+    help = ('Reescribe las versiones de actividades con una versión completa cada N y las '
+            'diferencias con la anterior en el resto (con --intervalo 1 vuelven a ser todas completas)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL,
+            help='Cada cuántas versiones se guarda una completa (por defecto ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Muestra cuántas versiones cambiarían sin hacer cambios',
+        )
+
+    def handle(self, *args, **options):
+        intervalo = options['intervalo']
+        if intervalo < 1:
+            raise CommandError('--intervalo debe ser mayor que 0')
+
+        actividades = (
+            ActividadVersion.objects.order_by('actividad_original_id')
+            .values_list('actividad_original_id', flat=True).distinct()
+        )
+        total_actividades = total_versiones = total_filas = 0
+        # Una actividad por transacción: se puede interrumpir y relanzar
+        for actividad_id in list(actividades):
+            with transaction.atomic():
+                versiones, filas = compactar_actividad(actividad_id, intervalo, guardar=not options['dry_run'])
+            total_actividades += 1
+            total_versiones += versiones
+            total_filas += filas
+
+        verbo = 'Se reescribirían' if options['dry_run'] else 'Reescritas'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verbo} {total_filas} de {total_versiones} versiones de {total_actividades} actividades '
+            f'(una completa cada {intervalo})'
+        ))
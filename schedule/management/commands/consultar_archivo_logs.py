@@ -0,0 +1,50 @@
+"""
+Command para consultar el registro archivado sin restaurarlo
+"""
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from schedule.archive import REGISTROS, leer_archivo
+
+
+class Command(BaseCommand):
+    help = ('Muestra en JSONL las entradas archivadas (registro de actividad o intentos de login) '
+            'que cumplen los filtros')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registro', choices=sorted(REGISTROS), default='actividad')
+        parser.add_argument('--desde', help='Fecha inicial AAAA-MM-DD (incluida)')
+        parser.add_argument('--hasta', help='Fecha final AAAA-MM-DD (incluida)')
+        parser.add_argument('--usuario', help='Nombre de usuario')
+        parser.add_argument('--tipo-log', help='Acción registrada (sólo registro de actividad)')
+        parser.add_argument('--limite', type=int, default=0, help='Máximo de entradas (0 = todas)')
+
+    def handle(self, *args, **options):
+        tz = timezone.get_current_timezone()
+        rango = {}
+        for param, offset in (('desde', 0), ('hasta', 1)):
+            if options[param]:
+                try:
+                    dia = parse_date(options[param])
+                except ValueError:
+                    dia = None
+                if dia is None:
+                    raise CommandError(f'--{param} debe tener el formato AAAA-MM-DD')
+                rango[param] = timezone.make_aware(datetime.combine(dia + timedelta(days=offset), time.min), tz)
+
+        filtros = {}
+        if options['usuario']:
+            filtros['usuario__username' if options['registro'] == 'actividad' else 'username'] = options['usuario']
+        if options['tipo_log']:
+            filtros['tipo_log'] = options['tipo_log']
+
+        mostradas = 0
+        for fila in leer_archivo(options['registro'], **rango, **filtros):
+            fila['timestamp'] = fila['timestamp'].isoformat()
+            self.stdout.write(json.dumps(fila, ensure_ascii=False))
+            mostradas += 1
+            if options['limite'] and mostradas >= options['limite']:
+                break
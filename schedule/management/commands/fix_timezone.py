@@ -1,7 +1,10 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 import pytz
 from datetime import timedelta
+from schedule.models import ActividadVersion
+from schedule.versioning import desplazar_fechas
 
 class Command(BaseCommand):
     help = 'Corrige las fechas de actividades que se guardaron con zona horaria incorrecta'
@@ -35,8 +38,8 @@ class Command(BaseCommand):
         versiones_count = 0
         
         if not dry_run:
-            # Aplicar cambios reales
-            with connection.cursor() as cursor:
+            # Aplicar cambios reales (todo o nada: relanzarlo a medias desplazaría dos veces)
+            with transaction.atomic(), connection.cursor() as cursor:
                 # Actualizar fechas de actividades
                 cursor.execute(
                     "UPDATE schedule_actividad SET fecha_inicio = fecha_inicio + INTERVAL %s HOUR",
@@ -51,21 +54,15 @@ class Command(BaseCommand):
                 cursor.execute("SELECT COUNT(*) FROM schedule_actividad")
                 actividades_count = cursor.fetchone()[0]
                 
-                # Actualizar versiones si la tabla existe
-                try:
-                    cursor.execute(
-                        "UPDATE schedule_actividadversion SET fecha_inicio = fecha_inicio + INTERVAL %s HOUR",
-                        [offset_hours]
-                    )
-                    cursor.execute(
-                        "UPDATE schedule_actividadversion SET fecha_fin = fecha_fin + INTERVAL %s HOUR", 
-                        [offset_hours]
-                    )
-                    cursor.execute("SELECT COUNT(*) FROM schedule_actividadversion")
-                    versiones_count = cursor.fetchone()[0]
-                except Exception as e:
-                    self.stdout.write(f"Tabla schedule_actividadversion no encontrada o error: {e}")
-                    versiones_count = 0
+                # Actualizar versiones: las guardadas como diferencias llevan las
+                # fechas en `cambios`, así que cada historial se reconstruye, se
+                # desplaza y se vuelve a compactar
+                actividades_con_versiones = (
+                    ActividadVersion.objects.order_by('actividad_original_id')
+                    .values_list('actividad_original_id', flat=True).distinct()
+                )
+                for actividad_id in list(actividades_con_versiones):
+                    versiones_count += desplazar_fechas(actividad_id, timedelta(hours=offset_hours))
         else:
             # Modo simulación - solo mostrar qué se cambiaría
             with connection.cursor() as cursor:
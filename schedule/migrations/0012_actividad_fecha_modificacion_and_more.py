@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0011_actividad_estado_alter_actividad_activa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actividad',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='actividadgrupo',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Última modificación (versionado de los feeds iCal)'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0012_actividad_fecha_modificacion_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actividad',
+            index=models.Index(fields=['fecha_inicio', 'fecha_fin'], name='actividad_fechas_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividadgrupo',
+            index=models.Index(fields=['fecha_inicio', 'fecha_fin'], name='grupo_fechas_idx'),
+        ),
+    ]
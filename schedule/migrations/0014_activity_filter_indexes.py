@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0013_actividad_fechas_idx_actividadgrupo_fechas_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actividad',
+            index=models.Index(fields=['estado', 'fecha_inicio'], name='actividad_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividad',
+            index=models.Index(condition=models.Q(('activa', True), ('aprobada', True)), fields=['fecha_inicio'], name='actividad_publicada_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividad',
+            index=models.Index(fields=['tipo_actividad', 'estado'], name='actividad_tipo_estado_idx'),
+        ),
+        # Tabla intermedia de Actividad.asignaturas: el índice único es
+        # (actividad_id, asignatura_id); los filtros por asignatura/titulación
+        # entran por asignatura_id, así que se añade el orden inverso
+        migrations.RunSQL(
+            'CREATE INDEX actividad_asig_asig_act_idx ON schedule_actividad_asignaturas (asignatura_id, actividad_id);',
+            reverse_sql='DROP INDEX actividad_asig_asig_act_idx;',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:05
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def inicializar_contador(apps, schema_editor):
+    """version_actual = número de la última versión existente de cada actividad"""
+    Actividad = apps.get_model('schedule', 'Actividad')
+    ActividadVersion = apps.get_model('schedule', 'ActividadVersion')
+    ultima = ActividadVersion.objects.filter(
+        actividad_original=OuterRef('pk')
+    ).values('actividad_original').annotate(n=Max('version_numero')).values('n')
+    Actividad.objects.update(version_actual=Coalesce(Subquery(ultima), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0014_activity_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actividad',
+            name='version_actual',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(inicializar_contador, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0015_actividad_version_actual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actividadversion',
+            name='es_completa',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='actividadversion',
+            name='cambios',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='actividadversion',
+            name='nombre',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='actividadversion',
+            name='fecha_inicio',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='actividadversion',
+            name='fecha_fin',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
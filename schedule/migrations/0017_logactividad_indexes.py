@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0016_actividadversion_compacta'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logactividad',
+            index=models.Index(fields=['timestamp', 'id_log'], name='log_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logactividad',
+            index=models.Index(fields=['object_type', 'timestamp', 'id_log'], name='log_object_type_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logactividad',
+            index=models.Index(fields=['tipo_log', 'timestamp', 'id_log'], name='log_tipo_log_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logactividad',
+            index=models.Index(fields=['usuario', 'timestamp', 'id_log'], name='log_usuario_ts_idx'),
+        ),
+    ]
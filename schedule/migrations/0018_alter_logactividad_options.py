@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0017_logactividad_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='logactividad',
+            options={},
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import DatabaseError, models, transaction
 from academics.models import Asignatura
 from users.models import CustomUser
 import uuid
@@ -21,10 +21,15 @@ class ActividadGrupo(models.Model):
     descripcion = models.TextField(blank=True, null=True, help_text="Descripción del grupo (instrucciones específicas, etc.)")
     lugar = models.CharField(max_length=255, blank=True, null=True, help_text="Lugar donde se realiza el grupo (aula, laboratorio, etc.)")
     orden = models.PositiveIntegerField(default=1, help_text="Orden de visualización de los grupos")
+    fecha_modificacion = models.DateTimeField(auto_now=True, help_text="Última modificación (versionado de los feeds iCal)")
     
     class Meta:
         ordering = ['orden', 'fecha_inicio']
         unique_together = ['actividad', 'nombre_grupo']
+        indexes = [
+            # Rango visible del calendario (solapamiento con start/end)
+            models.Index(fields=['fecha_inicio', 'fecha_fin'], name='grupo_fechas_idx'),
+        ]
         verbose_name = "Grupo de Actividad"
         verbose_name_plural = "Grupos de Actividades"
     
@@ -102,8 +107,38 @@ class Actividad(models.Model):
     activa = models.BooleanField(default=True, help_text="LEGACY: Usar campo 'estado' en su lugar")
     grupo_id = models.UUIDField(blank=True, null=True, help_text="Identificador para agrupar actividades de múltiples grupos - DEPRECATED")
 
+    # Última modificación, usada como sello de versión de los feeds iCal
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+
+    # Número de la última ActividadVersion; se incrementa de forma atómica
+    # (UPDATE ... SET version_actual = version_actual + 1) en schedule.signals
+    version_actual = models.PositiveIntegerField(default=0, editable=False)
+
+    # Campos cuyo cambio genera una versión (comparados con los cargados de la BD)
+    VERSIONED_FIELDS = (
+        'nombre', 'descripcion', 'fecha_inicio', 'fecha_fin', 'evaluable',
+        'porcentaje_evaluacion', 'no_recuperable', 'aprobada', 'activa', 'tipo_actividad_id',
+    )
+
     # Manager personalizado
     objects = ActividadManager()
+
+    class Meta:
+        indexes = [
+            # Rango visible del calendario para actividades legacy (sin grupos)
+            models.Index(fields=['fecha_inicio', 'fecha_fin'], name='actividad_fechas_idx'),
+            # Dashboard del coordinador: visibles / borradas, ordenadas por fecha
+            models.Index(fields=['estado', 'fecha_inicio'], name='actividad_estado_fecha_idx'),
+            # Calendario del estudiante: activas y aprobadas, ordenadas por fecha.
+            # Índice parcial: los filtros booleanos se generan como 'WHERE activa
+            # AND aprobada' y un índice normal sobre esas columnas no se usaría
+            models.Index(
+                fields=['fecha_inicio'], condition=models.Q(activa=True, aprobada=True),
+                name='actividad_publicada_fecha_idx'
+            ),
+            # Filtro por tipo de actividad combinado con el estado
+            models.Index(fields=['tipo_actividad', 'estado'], name='actividad_tipo_estado_idx'),
+        ]
     
     @property
     def grupos_count(self):
@@ -115,6 +150,31 @@ class Actividad(models.Model):
         """Primer grupo de la actividad (para compatibilidad)"""
         return self.grupos.first()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores de los campos versionados tal y como se cargaron, para saber
+        # sin consultas si un save() los modifica
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.VERSIONED_FIELDS
+        }
+        return instance
+
+    def campos_versionados_modificados(self):
+        """
+        Campos versionados que han cambiado desde que se cargó la instancia.
+        Las asignaturas se guardan después (save_m2m), así que quien las cambie
+        debe indicarlo con `_asignaturas_modificadas`. Una instancia que no
+        viene de la base de datos se considera modificada por completo.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return set(self.VERSIONED_FIELDS)
+        changed = {name for name in self.VERSIONED_FIELDS if name in loaded and getattr(self, name) != loaded[name]}
+        if getattr(self, '_asignaturas_modificadas', False):
+            changed.add('asignaturas')
+        return changed
+
     def save(self, *args, **kwargs):
         # Apply automatic approval logic only when creating a new activity or when approval status hasn't been manually set
         if not self.pk or not hasattr(self, '_approval_manually_set'):
@@ -123,7 +183,35 @@ class Actividad(models.Model):
         # Sincronizar campo legacy 'activa' con nuevo campo 'estado'
         self.activa = (self.estado == self.ESTADO_VISIBLE)
 
-        super().save(*args, **kwargs)
+        # version_actual sólo lo cambia el UPDATE atómico del versionado: una
+        # instancia cargada antes no debe sobrescribirlo con su valor antiguo
+        forced_update_fields = (
+            not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert')
+        )
+        if forced_update_fields:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.attname not in deferred and f.name != 'version_actual'
+            ]
+
+        # La versión (pre_save) y el guardado van en la misma transacción: el
+        # contador version_actual queda bloqueado hasta que se guarda la fila
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except DatabaseError:
+            # Con update_fields Django no inserta la fila si otra petición la
+            # ha borrado; sin ellos (como antes) se vuelve a crear
+            if not forced_update_fields or type(self)._base_manager.filter(pk=self.pk).exists():
+                raise
+            del kwargs['update_fields']
+            with transaction.atomic():
+                super().save(*args, force_insert=True, **kwargs)
+
+        # Lo guardado pasa a ser el estado de referencia
+        self._loaded_values = {name: self.__dict__[name] for name in self.VERSIONED_FIELDS if name in self.__dict__}
+        self._asignaturas_modificadas = False
 
     def _get_default_approval_status(self):
         """
@@ -170,8 +258,8 @@ class Actividad(models.Model):
         self.save()
         # Crear log si se proporciona usuario
         if usuario:
-            from schedule.models import LogActividad
-            LogActividad.objects.create(
+            from schedule.audit import registrar_log
+            registrar_log(
                 object_type='actividad',
                 object_name=self.nombre,
                 object_id=self.id,
@@ -188,8 +276,8 @@ class Actividad(models.Model):
             self.save()
             # Crear log si se proporciona usuario
             if usuario:
-                from schedule.models import LogActividad
-                LogActividad.objects.create(
+                from schedule.audit import registrar_log
+                registrar_log(
                     object_type='actividad',
                     object_name=self.nombre,
                     object_id=self.id,
@@ -205,8 +293,8 @@ class Actividad(models.Model):
         self.save()
         # Crear log si se proporciona usuario
         if usuario:
-            from schedule.models import LogActividad
-            LogActividad.objects.create(
+            from schedule.audit import registrar_log
+            registrar_log(
                 object_type='actividad',
                 object_name=self.nombre,
                 object_id=self.id,
@@ -223,8 +311,8 @@ class Actividad(models.Model):
             self.save()
             # Crear log si se proporciona usuario
             if usuario:
-                from schedule.models import LogActividad
-                LogActividad.objects.create(
+                from schedule.audit import registrar_log
+                registrar_log(
                     object_type='actividad',
                     object_name=self.nombre,
                     object_id=self.id,
@@ -262,7 +350,16 @@ class LogActividad(models.Model):
     details = models.TextField(blank=True, null=True)  # Additional details about the action
 
     class Meta:
-        ordering = ['-timestamp']
+        # Sin ordering por defecto: cada consulta ordena lo que necesita y las
+        # demás (recuentos, borrados del archivo) no pagan la ordenación.
+        # Paginación por (timestamp, id_log), sola o tras filtrar por tipo de
+        # objeto, acción o usuario (schedule.views.activity_logs_page)
+        indexes = [
+            models.Index(fields=['timestamp', 'id_log'], name='log_timestamp_idx'),
+            models.Index(fields=['object_type', 'timestamp', 'id_log'], name='log_object_type_ts_idx'),
+            models.Index(fields=['tipo_log', 'timestamp', 'id_log'], name='log_tipo_log_ts_idx'),
+            models.Index(fields=['usuario', 'timestamp', 'id_log'], name='log_usuario_ts_idx'),
+        ]
 
     def __str__(self):
         return f"Log {self.tipo_log} for {self.object_type}: {self.object_name} by {self.usuario.username} at {self.timestamp}"
@@ -281,6 +378,12 @@ class ActividadVersion(models.Model):
     """
     Stores historical versions of activities for version control and rollback functionality.
     Each time an activity is modified, the current version is saved here before applying changes.
+
+    Con ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL > 1 sólo una de cada N versiones
+    guarda el estado completo (es_completa); las demás guardan en `cambios`
+    los campos que difieren de la versión anterior y dejan vacías las
+    columnas del snapshot. Para leer una versión hay que reconstruirla con
+    schedule.versioning.
     """
     # Version control metadata
     actividad_original = models.ForeignKey(Actividad, on_delete=models.CASCADE, related_name='versiones')
@@ -288,12 +391,16 @@ class ActividadVersion(models.Model):
     modificada_por = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     fecha_modificacion = models.DateTimeField(auto_now_add=True)
     comentario_version = models.TextField(blank=True, null=True)  # Optional comment about the change
+
+    # Almacenamiento compacto: snapshot completo o diferencias con la versión anterior
+    es_completa = models.BooleanField(default=True)
+    cambios = models.JSONField(default=dict, blank=True)
     
     # Snapshot of all activity fields at the time of modification
-    nombre = models.CharField(max_length=255)
+    nombre = models.CharField(max_length=255, blank=True)
     descripcion = models.TextField(blank=True, null=True)
-    fecha_inicio = models.DateTimeField()
-    fecha_fin = models.DateTimeField()
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
     evaluable = models.BooleanField(default=False)
     porcentaje_evaluacion = models.DecimalField(max_digits=5, decimal_places=2, default=0.0)
     no_recuperable = models.BooleanField(default=False)
@@ -0,0 +1,64 @@
+"""
+Paginación por clave (keyset / seek) para los endpoints JSON de tablas.
+
+En lugar de OFFSET, cada página continúa a partir de la última fila de la
+anterior: se ordena por (campo, pk) y se piden las filas posteriores a ese
+par. El coste de cada página no depende de lo lejos que esté del principio
+y las filas no se repiten ni se saltan si se insertan otras mientras se
+pagina. El cursor es opaco para el cliente (JSON en base64).
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+
+def _json_default(value):
+    # isoformat completo: DjangoJSONEncoder recorta los microsegundos y el
+    # cursor dejaría de coincidir con el valor guardado
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(value, pk):
+    """Cursor opaco a partir del valor del campo de orden y la pk de la última fila"""
+    raw = json.dumps([value, pk], default=_json_default)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, field):
+    """Devuelve (valor, pk) del cursor; ValueError si no es válido"""
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return field.to_python(value), int(pk)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def keyset_paginate(queryset, order_by, cursor=None, limit=50):
+    """
+    Devuelve (filas, siguiente_cursor) de la página que sigue a `cursor`.
+
+    `order_by` es un nombre de campo no nulo del modelo, con '-' delante
+    para orden descendente; la pk desempata. `siguiente_cursor` es None en
+    la última página.
+    """
+    descending = order_by.startswith('-')
+    name = order_by.lstrip('-')
+    field = queryset.model._meta.get_field(name)
+    op = 'lt' if descending else 'gt'
+
+    queryset = queryset.order_by(order_by, '-pk' if descending else 'pk')
+    if cursor:
+        value, pk = decode_cursor(cursor, field)
+        queryset = queryset.filter(
+            Q(**{f'{name}__{op}': value}) | Q(**{name: value, f'pk__{op}': pk})
+        )
+
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, field.attname), last.pk)
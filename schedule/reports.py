@@ -0,0 +1,505 @@
+"""
+Generación de informes PDF de la agenda.
+
+La agenda de una o varias titulaciones se genera fuera del ciclo
+petición/respuesta en un pool de hilos. Los PDF se guardan en disco
+(AGENDA_REPORTS_DIR) con un nombre derivado de las titulaciones y de un hash
+de versión de sus datos, de modo que descargas repetidas se sirven desde
+disco hasta que cambie alguna actividad.
+
+El estado de cada trabajo se guarda también en disco (ficheros .pending /
+.error junto al PDF) para que sea visible desde todos los workers de
+gunicorn sin necesidad de un broker externo.
+
+El PDF cacheado lo descargan todos los usuarios con acceso a esas
+titulaciones, así que no lleva ningún dato del usuario que lo pidió.
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Max
+
+from academics.models import Asignatura, Titulacion
+from .models import Actividad, TipoActividad
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+try:
+    from pypdf import PdfReader, PdfWriter
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+AGENDA_REPORTS_DIR = Path(getattr(settings, 'AGENDA_REPORTS_DIR', settings.BASE_DIR / 'reports_cache'))
+AGENDA_REPORTS_WORKERS = getattr(settings, 'AGENDA_REPORTS_WORKERS', 2)
+# Procesos para renderizar en paralelo el informe de varias titulaciones (0/1: secuencial)
+AGENDA_REPORTS_PROCESSES = getattr(settings, 'AGENDA_REPORTS_PROCESSES', 0)
+# Arranque de los procesos del pool: 'spawn' no hereda conexiones a la base de datos
+AGENDA_REPORTS_MP_CONTEXT = 'spawn'
+# Un trabajo 'pending' más antiguo que esto se considera perdido (worker reiniciado)
+AGENDA_REPORTS_JOB_TIMEOUT = getattr(settings, 'AGENDA_REPORTS_JOB_TIMEOUT', 10 * 60)
+
+STATUS_READY = 'ready'
+STATUS_PENDING = 'pending'
+STATUS_ERROR = 'error'
+STATUS_MISSING = 'missing'
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=AGENDA_REPORTS_WORKERS, thread_name_prefix='agenda-report')
+    return _executor
+
+
+# ==================== CONSTRUCCIÓN DEL PDF ====================
+
+def _course_name(course):
+    return "Optativa" if course == 10 else "TFE" if course == 1000 else str(course)
+
+
+def _course_sort_key(course):
+    # Optativas y TFE al final
+    return 999 if course == 10 else 1001 if course == 1000 else course
+
+
+def group_activities_by_course(activities, titulacion):
+    """
+    Agrupa las actividades de una titulación por curso.
+
+    Trabaja sólo con las asignaturas precargadas (prefetch_related) de cada
+    actividad: no lanza consultas por actividad ni por fila. Devuelve una
+    lista ordenada de (curso, {'name', 'rows'}) donde 'rows' son pares
+    (actividad, asignaturas del curso) ordenados por fecha de inicio.
+    """
+    courses = {}
+    for activity in activities:
+        # Asignaturas de la actividad en esta titulación, agrupadas por curso
+        subjects_by_course = {}
+        for asignatura in activity.asignaturas.all():
+            if asignatura.titulacion_id == titulacion.pk:
+                subjects_by_course.setdefault(asignatura.curso, []).append(asignatura.nombre)
+
+        for course, subject_names in subjects_by_course.items():
+            # Diccionario por pk: evita duplicados en O(1) y conserva el orden
+            courses.setdefault(course, {})[activity.pk] = (activity, ", ".join(subject_names))
+
+    return [
+        (course, {
+            'name': _course_name(course),
+            'rows': sorted(rows.values(), key=lambda row: row[0].fecha_inicio),
+        })
+        for course, rows in sorted(courses.items(), key=lambda item: _course_sort_key(item[0]))
+    ]
+
+
+def _report_styles():
+    """Estilos de párrafo del informe"""
+    styles = getSampleStyleSheet()
+    return {
+        'normal': styles['Normal'],
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            spaceAfter=30,
+            textColor=colors.HexColor('#2c3e50'),
+            alignment=1  # Center
+        ),
+        'heading': ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=14,
+            spaceBefore=20,
+            spaceAfter=12,
+            textColor=colors.HexColor('#34495e')
+        ),
+        'course': ParagraphStyle(
+            'CourseHeading',
+            parent=styles['Heading3'],
+            fontSize=12,
+            spaceBefore=15,
+            spaceAfter=8,
+            textColor=colors.HexColor('#7f8c8d')
+        ),
+        # Create paragraph style for table content
+        'cell': ParagraphStyle(
+            'TableCell',
+            parent=styles['Normal'],
+            fontSize=8,
+            leading=10,
+            alignment=0,  # Left alignment
+            spaceAfter=0
+        ),
+        'footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=8,
+            textColor=colors.grey,
+            alignment=1
+        ),
+    }
+
+
+def _titulacion_elements(titulacion, styles, multiple):
+    """Elementos (cabecera y tablas por curso) de la sección de una titulación"""
+    elements = []
+
+    if multiple:
+        elements.append(Paragraph(f"Titulación: {titulacion.nombre}", styles['heading']))
+    else:
+        elements.append(Paragraph(f"Agenda de {titulacion.nombre}", styles['title']))
+        elements.append(Spacer(1, 20))
+
+    # Get activities for this titulacion (only active ones)
+    activities = Actividad.objects.filter(
+        asignaturas__titulacion=titulacion,
+        activa=True
+    ).select_related('tipo_actividad').prefetch_related('asignaturas').distinct().order_by('fecha_inicio')
+
+    sorted_courses = group_activities_by_course(activities, titulacion)
+
+    if not sorted_courses:
+        elements.append(Paragraph("No hay actividades activas para esta titulación.", styles['normal']))
+        return elements
+
+    cell_style = styles['cell']
+    for course_num, course_data in sorted_courses:
+        elements.append(Paragraph(f"Curso {course_data['name']}", styles['course']))
+
+        # Create table data with proper text wrapping
+        table_data = [['Actividad', 'Asignatura', 'Tipo', 'Inicio', 'Fin', 'Evaluable']]
+
+        for activity, subject_names in course_data['rows']:
+            evaluable = "Sí" if activity.evaluable else "No"
+            if activity.evaluable and activity.porcentaje_evaluacion:
+                evaluable += f" ({activity.porcentaje_evaluacion}%)"
+
+            # Create paragraphs for text content to handle wrapping
+            table_data.append([
+                Paragraph(activity.nombre, cell_style),
+                Paragraph(subject_names, cell_style),
+                Paragraph(activity.tipo_actividad.nombre, cell_style),
+                Paragraph(activity.fecha_inicio.strftime('%d/%m/%Y<br/>%H:%M'), cell_style),
+                Paragraph(activity.fecha_fin.strftime('%d/%m/%Y<br/>%H:%M'), cell_style),
+                Paragraph(evaluable, cell_style)
+            ])
+
+        # Create table with adjusted column widths
+        table = Table(table_data, colWidths=[2.2*inch, 1.8*inch, 1.2*inch, 0.9*inch, 0.9*inch, 0.8*inch])
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),  # Header centered
+            ('ALIGN', (0, 1), (-1, -1), 'LEFT'),   # Content left-aligned
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('TOPPADDING', (0, 0), (-1, 0), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('TOPPADDING', (0, 1), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+            ('LEFTPADDING', (0, 1), (-1, -1), 6),
+            ('RIGHTPADDING', (0, 1), (-1, -1), 6),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),  # Top alignment for better readability
+        ]))
+
+        elements.append(table)
+        elements.append(Spacer(1, 20))
+
+    return elements
+
+
+def _centre_title_elements(styles):
+    return [Paragraph("Agenda General del Centro", styles['title']), Spacer(1, 20)]
+
+
+def _footer_elements(styles):
+    """Pie con la fecha de generación (sin el usuario: el PDF se comparte desde la caché)"""
+    return [
+        Spacer(1, 30),
+        Paragraph(f"Generado el {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['footer']),
+    ]
+
+
+def build_agenda_pdf(titulaciones, output, processes=None):
+    """
+    Escribe en `output` el PDF de la agenda de las titulaciones indicadas.
+
+    Con varias titulaciones y `processes` (por defecto
+    AGENDA_REPORTS_PROCESSES) mayor que 1, cada titulación se renderiza en
+    un proceso distinto y los PDF resultantes se concatenan; requiere pypdf
+    y, si no está instalado, se renderiza de forma secuencial.
+    """
+    if processes is None:
+        processes = AGENDA_REPORTS_PROCESSES
+
+    if processes > 1 and len(titulaciones) > 1 and PYPDF_AVAILABLE:
+        _build_agenda_pdf_parallel(titulaciones, output, processes)
+        return
+
+    doc = SimpleDocTemplate(output, pagesize=A4)
+    styles = _report_styles()
+    multiple = len(titulaciones) > 1
+
+    elements = _centre_title_elements(styles) if multiple else []
+    for titulacion_idx, titulacion in enumerate(titulaciones):
+        elements.extend(_titulacion_elements(titulacion, styles, multiple))
+
+        # Add page break between titulaciones if multiple
+        if multiple and titulacion_idx < len(titulaciones) - 1:
+            elements.append(PageBreak())
+
+    elements.extend(_footer_elements(styles))
+
+    # Build PDF
+    doc.build(elements)
+
+
+# ==================== RENDERIZADO EN PARALELO ====================
+
+def render_titulacion_section(titulacion_id, with_title, with_footer=False):
+    """
+    Renderiza la sección de una titulación del informe general como PDF
+    independiente (bytes). Se ejecuta en los procesos del pool: la primera
+    sección lleva el título del informe y la última el pie.
+    """
+    titulacion = Titulacion.objects.get(pk=titulacion_id)
+    styles = _report_styles()
+
+    elements = _centre_title_elements(styles) if with_title else []
+    elements.extend(_titulacion_elements(titulacion, styles, multiple=True))
+    if with_footer:
+        elements.extend(_footer_elements(styles))
+
+    output = io.BytesIO()
+    SimpleDocTemplate(output, pagesize=A4).build(elements)
+    return output.getvalue()
+
+
+def _build_agenda_pdf_parallel(titulaciones, output, processes):
+    """Renderiza cada titulación en un proceso y concatena los PDF en orden"""
+    last = len(titulaciones) - 1
+    # 'spawn': los procesos no heredan las conexiones a la base de datos del
+    # proceso padre; cada uno inicializa Django y abre la suya
+    with ProcessPoolExecutor(
+        max_workers=min(processes, len(titulaciones)),
+        mp_context=multiprocessing.get_context(AGENDA_REPORTS_MP_CONTEXT),
+        initializer=django.setup,
+    ) as pool:
+        sections = pool.map(
+            render_titulacion_section,
+            [t.pk for t in titulaciones],
+            [idx == 0 for idx in range(len(titulaciones))],
+            [idx == last for idx in range(len(titulaciones))],
+        )
+
+        writer = PdfWriter()
+        for section in sections:
+            writer.append(PdfReader(io.BytesIO(section)))
+    writer.write(output)
+
+
+# ==================== CACHÉ Y TRABAJOS EN SEGUNDO PLANO ====================
+
+def agenda_report_filename(titulaciones):
+    """Nombre de descarga del informe"""
+    if len(titulaciones) == 1:
+        return f"Agenda_{titulaciones[0].nombre.replace(' ', '_')}.pdf"
+    return "Agenda_General_Centro.pdf"
+
+
+def _titulaciones_hash(titulacion_ids):
+    raw = ','.join(str(t) for t in sorted(titulacion_ids))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def agenda_data_version(titulaciones):
+    """
+    Hash de versión de los datos del informe: nombre de cada titulación,
+    última modificación / número de sus actividades activas, y nombre y
+    curso de sus asignaturas y nombres de los tipos de actividad (no tienen
+    fecha de modificación, así que entran en el hash tal cual).
+    """
+    parts = []
+    for titulacion in titulaciones:
+        stats = Actividad.objects.filter(
+            asignaturas__titulacion=titulacion, activa=True
+        ).aggregate(last=Max('fecha_modificacion'), total=Count('pk', distinct=True))
+        last = stats['last'].isoformat() if stats['last'] else ''
+        parts.append(f"{titulacion.pk}:{titulacion.nombre}:{last}:{stats['total']}")
+    asignaturas = Asignatura.objects.filter(
+        titulacion__in=[t.pk for t in titulaciones]
+    ).order_by('pk').values_list('pk', 'nombre', 'curso')
+    parts.extend(f"a{pk}:{nombre}:{curso}" for pk, nombre, curso in asignaturas)
+    parts.extend(f"t{pk}:{nombre}" for pk, nombre in TipoActividad.objects.order_by('pk').values_list('pk', 'nombre'))
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def agenda_report_key(titulaciones):
+    """Clave del informe: titulaciones + versión de sus datos"""
+    return f"{_titulaciones_hash(t.pk for t in titulaciones)}-{agenda_data_version(titulaciones)}"
+
+
+def _valid_key(key):
+    return len(key) == 33 and key[16] == '-' and all(c in '0123456789abcdef' for c in key.replace('-', ''))
+
+
+def _report_path(key, suffix='.pdf'):
+    return AGENDA_REPORTS_DIR / f"{key}{suffix}"
+
+
+def get_report_meta(key):
+    """Metadatos del informe (titulaciones, nombre de fichero) o None"""
+    if not _valid_key(key):
+        return None
+    try:
+        return json.loads(_report_path(key, '.json').read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def get_report_path(key):
+    """Ruta del PDF generado, o None si aún no existe"""
+    if not _valid_key(key):
+        return None
+    path = _report_path(key)
+    return path if path.exists() else None
+
+
+def agenda_report_status(key):
+    """Estado del informe: 'ready', 'pending', 'error' o 'missing'"""
+    if not _valid_key(key):
+        return STATUS_MISSING
+    if _report_path(key).exists():
+        return STATUS_READY
+    pending = _report_path(key, '.pending')
+    try:
+        if time.time() - pending.stat().st_mtime < AGENDA_REPORTS_JOB_TIMEOUT:
+            return STATUS_PENDING
+    except OSError:
+        pass
+    if _report_path(key, '.error').exists():
+        return STATUS_ERROR
+    return STATUS_MISSING
+
+
+def _remove_stale_pending(pending):
+    """
+    Retira el .pending de un trabajo perdido (más antiguo que
+    AGENDA_REPORTS_JOB_TIMEOUT). Devuelve False si hay un trabajo en curso.
+
+    El fichero se renombra antes de borrarlo y se comprueba que el renombrado
+    es el mismo que se vio caducado: si entretanto otro worker lo sustituyó
+    por uno nuevo, se devuelve a su sitio y se deja que siga ese trabajo.
+    """
+    try:
+        stale = pending.stat()
+    except FileNotFoundError:
+        return True
+    if time.time() - stale.st_mtime < AGENDA_REPORTS_JOB_TIMEOUT:
+        return False
+    claimed = pending.with_name(f"{pending.name}.{os.getpid()}.{time.monotonic_ns()}")
+    try:
+        os.rename(pending, claimed)
+    except FileNotFoundError:
+        # Otro worker lo retiró antes; la creación exclusiva decide quién sigue
+        return True
+    if claimed.stat().st_ino != stale.st_ino:
+        try:
+            os.link(claimed, pending)
+        except FileExistsError:
+            pass
+        claimed.unlink(missing_ok=True)
+        return False
+    claimed.unlink(missing_ok=True)
+    return True
+
+
+def enqueue_agenda_report(key, titulaciones):
+    """
+    Encola la generación del informe. Si otro worker ya lo está generando
+    (fichero .pending reciente) no se encola de nuevo; el .pending de un
+    trabajo perdido sólo se retira cuando su antigüedad lo confirma.
+    """
+    AGENDA_REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    pending = _report_path(key, '.pending')
+    if not _remove_stale_pending(pending):
+        return
+    try:
+        # Creación exclusiva: sólo un proceso gana la carrera
+        fd = os.open(pending, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.close(fd)
+    except FileExistsError:
+        return
+    _report_path(key, '.error').unlink(missing_ok=True)
+
+    meta = {
+        'titulacion_ids': [t.pk for t in titulaciones],
+        'filename': agenda_report_filename(titulaciones),
+    }
+    _report_path(key, '.json').write_text(json.dumps(meta), encoding='utf-8')
+
+    _get_executor().submit(_run_agenda_report_job, key, meta['titulacion_ids'])
+
+
+def _run_agenda_report_job(key, titulacion_ids):
+    """Genera el PDF en un fichero temporal y lo publica de forma atómica"""
+    close_old_connections()
+    try:
+        titulaciones_by_id = Titulacion.objects.in_bulk(titulacion_ids)
+        titulaciones = [titulaciones_by_id[t] for t in titulacion_ids if t in titulaciones_by_id]
+
+        fd, tmp_name = tempfile.mkstemp(dir=AGENDA_REPORTS_DIR, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                build_agenda_pdf(titulaciones, output)
+            os.replace(tmp_name, _report_path(key))
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+        _remove_stale_reports(key)
+    except Exception as e:
+        logger.error(f"Error generating agenda report {key}: {e}")
+        _report_path(key, '.error').write_text(str(e), encoding='utf-8')
+    finally:
+        _report_path(key, '.pending').unlink(missing_ok=True)
+        close_old_connections()
+
+
+def _remove_stale_reports(key):
+    """Borra versiones anteriores del informe de las mismas titulaciones"""
+    prefix = key.split('-')[0]
+    for pdf in AGENDA_REPORTS_DIR.glob(f"{prefix}-*.pdf"):
+        old_key = pdf.stem
+        if old_key != key and not _report_path(old_key, '.pending').exists():
+            for suffix in ('.pdf', '.json', '.error'):
+                _report_path(old_key, suffix).unlink(missing_ok=True)
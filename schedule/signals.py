@@ -1,74 +1,97 @@
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.db import transaction
+from django.db.models import F
 from django.dispatch import receiver
-from .models import Actividad, ActividadVersion
+from .models import Actividad, ActividadGrupo, TipoActividad, VistaCalendario
+from .ical import invalidate_ical_feeds
+from .versioning import SNAPSHOT_FIELDS, crear_version
 from django.contrib.auth import get_user_model
+import logging
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
 @receiver(pre_save, sender=Actividad)
-def create_activity_version_on_update(sender, instance, **kwargs):
+def create_activity_version_on_update(sender, instance, raw=False, **kwargs):
     """
     Create a version snapshot before updating an existing activity.
     This signal fires before saving an Actividad instance.
+
+    Sólo se guarda versión si se conoce quién modifica (_modified_by) y ha
+    cambiado algún campo versionado respecto a lo cargado de la base de
+    datos; en otro caso no se hace ninguna consulta. El número sale del
+    contador atómico Actividad.version_actual y el estado anterior, con su
+    tipo y asignaturas, se lee en una sola consulta. Se guarda completo o
+    como diferencias con la versión anterior según schedule.versioning.
     """
     # Only create version for existing activities (updates, not creates)
-    if instance.pk:
-        try:
-            # Get the current version from database before it's updated
-            old_instance = Actividad.objects.get(pk=instance.pk)
-            
-            # Get the next version number for this activity
-            last_version = ActividadVersion.objects.filter(
-                actividad_original=old_instance
-            ).order_by('-version_numero').first()
-            
-            next_version_number = (last_version.version_numero + 1) if last_version else 1
-            
-            # Create snapshot of current state
-            asignaturas_data = []
-            for asignatura in old_instance.asignaturas.all():
-                asignaturas_data.append({
-                    'id': asignatura.id,
-                    'nombre': asignatura.nombre
-                })
-            
-            tipo_actividad_data = {
-                'id': old_instance.tipo_actividad.id,
-                'nombre': old_instance.tipo_actividad.nombre
-            } if old_instance.tipo_actividad else {}
-            
-            # Get the user who is making the modification
-            modified_by = getattr(instance, '_modified_by', None)
-            if not modified_by:
-                # If no user is set, skip versioning (this shouldn't happen in normal operation)
+    if raw or not instance.pk:
+        return
+
+    # Get the user who is making the modification
+    modified_by = getattr(instance, '_modified_by', None)
+    if not modified_by:
+        # If no user is set, skip versioning (internal saves: borrar, archivar...)
+        return
+
+    if not instance.campos_versionados_modificados():
+        return
+
+    try:
+        # Savepoint: un error aquí no invalida la transacción del guardado
+        with transaction.atomic():
+            Actividad.objects.filter(pk=instance.pk).update(version_actual=F('version_actual') + 1)
+            # Una fila por asignatura (LEFT JOIN); los campos de la actividad se repiten
+            rows = list(Actividad.objects.filter(pk=instance.pk).values(
+                *SNAPSHOT_FIELDS, 'version_actual', 'tipo_actividad__id', 'tipo_actividad__nombre',
+                'asignaturas__id', 'asignaturas__nombre',
+            ).order_by('asignaturas__id'))
+            if not rows:
                 return
+            old = rows[0]
+
+            crear_version(
+                instance.pk,
+                old['version_actual'],
+                {
+                    # Copy all current field values
+                    **{field: old[field] for field in SNAPSHOT_FIELDS},
 
-            # Create version entry
-            ActividadVersion.objects.create(
-                actividad_original=old_instance,
-                version_numero=next_version_number,
+                    # Store related data as JSON snapshots
+                    'asignaturas_snapshot': [
+                        {'id': row['asignaturas__id'], 'nombre': row['asignaturas__nombre']}
+                        for row in rows if row['asignaturas__id'] is not None
+                    ],
+                    'tipo_actividad_snapshot': {
+                        'id': old['tipo_actividad__id'],
+                        'nombre': old['tipo_actividad__nombre'],
+                    } if old['tipo_actividad__id'] else {},
+                },
                 modificada_por=modified_by,
                 comentario_version=getattr(instance, '_version_comment', ''),  # Optional comment
-                
-                # Copy all current field values
-                nombre=old_instance.nombre,
-                descripcion=old_instance.descripcion,
-                fecha_inicio=old_instance.fecha_inicio,
-                fecha_fin=old_instance.fecha_fin,
-                evaluable=old_instance.evaluable,
-                porcentaje_evaluacion=old_instance.porcentaje_evaluacion,
-                no_recuperable=old_instance.no_recuperable,
-                aprobada=old_instance.aprobada,
-                activa=old_instance.activa,
-                
-                # Store related data as JSON snapshots
-                asignaturas_snapshot=asignaturas_data,
-                tipo_actividad_snapshot=tipo_actividad_data
             )
-            
-        except Actividad.DoesNotExist:
-            # This shouldn't happen, but just in case
-            pass
-        except Exception as e:
-            # Log the error but don't break the save operation
-            print(f"Error creating activity version: {e}")
\ No newline at end of file
+            instance.version_actual = old['version_actual']
+    except Exception as e:
+        # Log the error but don't break the save operation
+        logger.error(f"Error creating activity version for activity {instance.pk}: {e}")
+
+@receiver(post_save, sender=Actividad)
+@receiver(post_delete, sender=Actividad)
+@receiver(post_save, sender=ActividadGrupo)
+@receiver(post_delete, sender=ActividadGrupo)
+@receiver(post_save, sender=TipoActividad)
+@receiver(post_delete, sender=TipoActividad)
+@receiver(post_save, sender=VistaCalendario)
+@receiver(post_delete, sender=VistaCalendario)
+def invalidate_ical_feeds_on_change(sender, **kwargs):
+    """Invalidate cached iCal feeds whenever feed data changes."""
+    invalidate_ical_feeds()
+
+@receiver(m2m_changed, sender=Actividad.asignaturas.through)
+@receiver(m2m_changed, sender=VistaCalendario.asignaturas.through)
+@receiver(m2m_changed, sender=VistaCalendario.tipos_actividad.through)
+def invalidate_ical_feeds_on_m2m_change(sender, action, **kwargs):
+    """Invalidate cached iCal feeds when subjects or types are reassigned."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_ical_feeds()
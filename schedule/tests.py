@@ -1,3 +1,786 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from academics.models import Asignatura, Titulacion
+from agenda_academica.models import AGENDA_SETTINGS_LOCAL_TTL, AgendaSettings
+from users.models import CustomUser
+from . import archive, convocatorias, ical, reports, versioning
+from .audit import AuditLogMiddleware, registrar_log
+from .events import get_closing_date
+from .models import Actividad, ActividadGrupo, ActividadVersion, LogActividad, TipoActividad, VistaCalendario
+
+
+class FilteredActivitiesQueryCountTests(TestCase):
+    """El número de consultas de get_filtered_activities no crece con las actividades"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.titulacion = Titulacion.objects.create(nombre='Grado de prueba')
+        cls.asignaturas = [
+            Asignatura.objects.create(nombre=f'Asignatura {i}', titulacion=cls.titulacion, curso=1, semestre=1)
+            for i in range(3)
+        ]
+        cls.tipo = TipoActividad.objects.create(nombre='Examen')
+        cls.teacher = CustomUser.objects.create_user(
+            username='profesor', password='x', role=CustomUser.ROLE_TEACHER
+        )
+        cls.teacher.subjects.set(cls.asignaturas[:1])
+
+    def _create_activities(self, count):
+        start = timezone.now()
+        for i in range(count):
+            activity = Actividad.objects.create(
+                nombre=f'Actividad {i}',
+                tipo_actividad=self.tipo,
+                fecha_inicio=start + timedelta(days=i),
+                fecha_fin=start + timedelta(days=i, hours=2),
+            )
+            activity.asignaturas.set(self.asignaturas[i % 3:i % 3 + 2])
+            # Mezcla de actividades legacy, de un grupo y multi-grupo
+            for g in range(i % 3):
+                ActividadGrupo.objects.create(
+                    actividad=activity,
+                    nombre_grupo=str(g + 1),
+                    fecha_inicio=start + timedelta(days=i, hours=g),
+                    fecha_fin=start + timedelta(days=i, hours=g + 1),
+                    orden=g + 1,
+                )
+
+    def _count_queries(self):
+        url = reverse('get_filtered_activities')
+        params = {
+            'subject_ids': ','.join(str(a.id) for a in self.asignaturas[:1]),
+            'show_context': 'true',
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_query_count_is_constant(self):
+        self.client.force_login(self.teacher)
+        # Primera petición: crea AgendaSettings, no se tiene en cuenta
+        self._count_queries()
+
+        self._create_activities(3)
+        small_count, small_data = self._count_queries()
+
+        self._create_activities(30)
+        large_count, large_data = self._count_queries()
+
+        self.assertGreater(len(large_data), len(small_data))
+        self.assertEqual(small_count, large_count)
+
+    def test_multi_group_payload(self):
+        self.client.force_login(self.teacher)
+        self._create_activities(3)
+        _, data = self._count_queries()
+
+        summaries = [e for e in data if e['extendedProps'].get('grupos_count')]
+        calendar_only = [e for e in data if 'calendar-only' in e['classNames']]
+        self.assertEqual(len(summaries), 1)
+        self.assertEqual(summaries[0]['extendedProps']['grupos_count'], 2)
+        self.assertEqual(len(calendar_only), 2)
+
+
+class CalendarFeedsTests(TestCase):
+    """Los feeds comparten la misma proyección de actividades y grupos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        titulacion = Titulacion.objects.create(nombre='Grado de prueba')
+        cls.asignatura = Asignatura.objects.create(nombre='Asignatura', titulacion=titulacion, curso=1, semestre=1)
+        tipo = TipoActividad.objects.create(nombre='Examen')
+        start = timezone.now()
+        cls.legacy = Actividad.objects.create(
+            nombre='Legacy', tipo_actividad=tipo, fecha_inicio=start, fecha_fin=start + timedelta(hours=1)
+        )
+        cls.multi = Actividad.objects.create(
+            nombre='Multi', tipo_actividad=tipo, fecha_inicio=start, fecha_fin=start + timedelta(hours=1)
+        )
+        for activity in (cls.legacy, cls.multi):
+            activity.asignaturas.add(cls.asignatura)
+        for i in range(2):
+            ActividadGrupo.objects.create(
+                actividad=cls.multi, nombre_grupo=str(i + 1), orden=i + 1,
+                fecha_inicio=start + timedelta(days=i), fecha_fin=start + timedelta(days=i, hours=1),
+            )
+        cls.student = CustomUser.objects.create_user(username='alumno', password='x', role=CustomUser.ROLE_STUDENT)
+        cls.student.subjects.add(cls.asignatura)
+
+    def test_all_activities_one_event_per_group(self):
+        data = self.client.get(reverse('all_activities')).json()
+        self.assertEqual(sorted(e['title'] for e in data), ['Legacy', 'Multi - Grupo 1', 'Multi - Grupo 2'])
+
+    def test_student_events_match_all_activities(self):
+        self.client.force_login(self.student)
+        student = self.client.get(reverse('student_calendar_events')).json()
+        general = self.client.get(reverse('all_activities')).json()
+        self.assertEqual(sorted(str(e['id']) for e in student), sorted(str(e['id']) for e in general))
+
+    def test_visible_window_limits_events(self):
+        day = self.legacy.fecha_inicio + timedelta(days=1)
+        window = {'start': (day - timedelta(hours=1)).isoformat(), 'end': (day + timedelta(hours=2)).isoformat()}
+
+        data = self.client.get(reverse('all_activities'), window).json()
+        # La actividad multi-grupo entra por su segundo grupo y conserva todos sus eventos
+        self.assertEqual(sorted(e['title'] for e in data), ['Multi - Grupo 1', 'Multi - Grupo 2'])
+
+        self.client.force_login(self.student)
+        future = {'start': '2100-01-01', 'end': '2100-02-01'}
+        self.assertEqual(self.client.get(reverse('student_calendar_events'), future).json(), [])
+        legacy_window = {'start': (self.legacy.fecha_inicio - timedelta(minutes=30)).isoformat(),
+                         'end': (self.legacy.fecha_inicio + timedelta(minutes=30)).isoformat()}
+        titles = [e['title'] for e in self.client.get(reverse('student_calendar_events'), legacy_window).json()]
+        self.assertIn('Legacy', titles)
+
+
+class IcalFeedConditionalGetTests(TestCase):
+    """El feed iCal responde 304 mientras no cambien sus actividades"""
+
+    @classmethod
+    def setUpTestData(cls):
+        titulacion = Titulacion.objects.create(nombre='Grado de prueba')
+        asignatura = Asignatura.objects.create(nombre='Asignatura', titulacion=titulacion, curso=1, semestre=1)
+        cls.tipo = TipoActividad.objects.create(nombre='Examen')
+        start = timezone.now()
+        cls.activity = Actividad.objects.create(
+            nombre='Parcial', tipo_actividad=cls.tipo, fecha_inicio=start, fecha_fin=start + timedelta(hours=1)
+        )
+        cls.activity.asignaturas.add(asignatura)
+        owner = CustomUser.objects.create_user(username='owner', password='x')
+        cls.view = VistaCalendario.objects.create(nombre='Feed', usuario=owner)
+        cls.view.asignaturas.add(asignatura)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('ical_feed', args=[self.view.token])
+
+    def test_not_modified_with_matching_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Parcial', response.content)
+
+        with CaptureQueriesContext(connection) as ctx:
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        # Sólo se lee la vista del feed (y la caché compartida), no sus actividades
+        tables = [q['sql'] for q in ctx.captured_queries if 'django_cache' not in q['sql']]
+        self.assertEqual(len(tables), 1)
+        self.assertIn('schedule_vistacalendario', tables[0])
+
+    def test_expired_generation_is_not_mistaken_for_cached_one(self):
+        etag = self.client.get(self.url)['ETag']
+        # La marca de generación caduca o se pierde y después cambia el feed
+        cache.delete(ical.GENERATION_KEY)
+        Actividad.objects.filter(pk=self.activity.pk).update(nombre='Parcial oculto', fecha_modificacion=timezone.now())
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Parcial oculto', response.content)
+
+    def test_change_invalidates_feed(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.activity.nombre = 'Parcial modificado'
+        self.activity.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(b'Parcial modificado', response.content)
+
+    def test_streaming_matches_buffered_feed(self):
+        buffered = self.client.get(self.url).content
+        response = self.client.get(self.url, {'stream': '1'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), buffered)
+
+    def test_group_events_have_stable_uid_and_sequence(self):
+        start = timezone.now()
+        for i in range(2):
+            ActividadGrupo.objects.create(
+                actividad=self.activity, nombre_grupo=str(i + 1), orden=i + 1,
+                fecha_inicio=start, fecha_fin=start + timedelta(hours=1),
+            )
+        first = self.client.get(self.url).content.decode()
+        self.assertEqual(first.count('BEGIN:VEVENT'), 2)
+        self.assertIn(f'UID:actividad-{self.activity.id}-grupo-', first)
+        self.assertIn('SEQUENCE:0', first)
+
+        self.activity._modified_by = self.view.usuario
+        self.activity.nombre = 'Parcial (aula cambiada)'
+        self.activity.save()
+        second = self.client.get(self.url).content.decode()
+        self.assertIn('SEQUENCE:1', second)
+        self.assertEqual(
+            sorted(line for line in first.splitlines() if line.startswith('UID:')),
+            sorted(line for line in second.splitlines() if line.startswith('UID:')),
+        )
+
+
+class _InlineExecutor:
+    """Ejecuta los trabajos en el mismo hilo para poder comprobar el resultado"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class AgendaReportCacheTests(TestCase):
+    """El informe PDF se genera en segundo plano y se reutiliza mientras no cambien los datos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.titulacion = Titulacion.objects.create(nombre='Grado de prueba')
+        asignatura = Asignatura.objects.create(nombre='Asignatura', titulacion=cls.titulacion, curso=1, semestre=1)
+        tipo = TipoActividad.objects.create(nombre='Examen')
+        start = timezone.now()
+        cls.activity = Actividad.objects.create(
+            nombre='Parcial', tipo_actividad=tipo, fecha_inicio=start, fecha_fin=start + timedelta(hours=1)
+        )
+        cls.activity.asignaturas.add(asignatura)
+        cls.admin = CustomUser.objects.create_user(username='admin', password='x', role=CustomUser.ROLE_ADMIN)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for target, value in (
+            ('AGENDA_REPORTS_DIR', Path(tmp.name)),
+            ('_get_executor', lambda: _InlineExecutor()),
+            # El trabajo cerraría la conexión de la transacción del test
+            ('close_old_connections', lambda: None),
+        ):
+            patcher = mock.patch.object(reports, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client.force_login(self.admin)
+        self.url = reverse('generate_agenda_report_titulacion', args=[self.titulacion.pk])
+
+    def test_report_is_generated_once_and_then_served_from_disk(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        key = reports.agenda_report_key([self.titulacion])
+        self.assertEqual(reports.agenda_report_status(key), reports.STATUS_READY)
+
+        status = self.client.get(reverse('agenda_report_status', args=[key])).json()
+        self.assertEqual(status['status'], reports.STATUS_READY)
+
+        with mock.patch('schedule.views.enqueue_agenda_report') as enqueue:
+            cached = self.client.get(self.url)
+        enqueue.assert_not_called()
+        self.assertEqual(cached['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(cached.streaming_content).startswith(b'%PDF'))
+
+    def test_data_change_produces_new_key(self):
+        key = reports.agenda_report_key([self.titulacion])
+        self.activity.nombre = 'Parcial modificado'
+        self.activity.save()
+        self.assertNotEqual(reports.agenda_report_key([self.titulacion]), key)
+
+    def test_subject_and_type_renames_produce_new_key(self):
+        key = reports.agenda_report_key([self.titulacion])
+        Asignatura.objects.filter(titulacion=self.titulacion).update(nombre='Asignatura renombrada')
+        renamed = reports.agenda_report_key([self.titulacion])
+        self.assertNotEqual(renamed, key)
+        TipoActividad.objects.update(nombre='Prueba escrita')
+        self.assertNotEqual(reports.agenda_report_key([self.titulacion]), renamed)
+
+    def test_pending_job_is_only_replaced_when_stale(self):
+        key = reports.agenda_report_key([self.titulacion])
+        reports.AGENDA_REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+        pending = reports.AGENDA_REPORTS_DIR / f'{key}.pending'
+        pending.touch()
+
+        with mock.patch.object(reports, '_run_agenda_report_job') as job:
+            reports.enqueue_agenda_report(key, [self.titulacion])
+        job.assert_not_called()
+        self.assertTrue(pending.exists())
+
+        # Trabajo perdido: el .pending es más antiguo que el límite
+        old = time.time() - reports.AGENDA_REPORTS_JOB_TIMEOUT - 1
+        os.utime(pending, (old, old))
+        reports.enqueue_agenda_report(key, [self.titulacion])
+        self.assertEqual(reports.agenda_report_status(key), reports.STATUS_READY)
+        self.assertEqual(list(reports.AGENDA_REPORTS_DIR.glob('*.pending*')), [])
+
+    def test_course_grouping_uses_prefetched_subjects(self):
+        otra = Titulacion.objects.create(nombre='Otra titulación')
+        for curso in (2, 10):
+            self.activity.asignaturas.add(
+                Asignatura.objects.create(nombre=f'Curso {curso}', titulacion=self.titulacion, curso=curso, semestre=1)
+            )
+        self.activity.asignaturas.add(Asignatura.objects.create(nombre='Ajena', titulacion=otra, curso=1, semestre=1))
+        activities = Actividad.objects.prefetch_related('asignaturas').filter(pk=self.activity.pk)
+
+        with self.assertNumQueries(2):
+            courses = reports.group_activities_by_course(activities, self.titulacion)
+
+        self.assertEqual([(c, data['name']) for c, data in courses], [(1, '1'), (2, '2'), (10, 'Optativa')])
+        self.assertEqual([subjects for _, subjects in courses[0][1]['rows']], ['Asignatura'])
+
+    def test_benchmark_command_keeps_query_count_constant(self):
+        out = io.StringIO()
+        call_command('benchmark_agenda_report', sizes='5,20', subjects=4, stdout=out)
+        self.assertIn('Número de consultas constante', out.getvalue())
+        self.assertFalse(Titulacion.objects.filter(nombre='Benchmark informe agenda').exists())
+
+    @skipUnless(reports.PYPDF_AVAILABLE, 'pypdf no está instalado')
+    def test_parallel_rendering_merges_sections_in_order(self):
+        from pypdf import PdfReader
+
+        otra = Titulacion.objects.create(nombre='Otra titulación')
+        asignatura = Asignatura.objects.create(nombre='Asignatura de otra', titulacion=otra, curso=1, semestre=1)
+        start = timezone.now()
+        # Bastantes actividades para que la primera sección ocupe varias páginas
+        for i in range(60):
+            activity = Actividad.objects.create(
+                nombre=f'Seminario {i}', tipo_actividad=self.activity.tipo_actividad,
+                fecha_inicio=start + timedelta(days=i), fecha_fin=start + timedelta(days=i, hours=1),
+            )
+            activity.asignaturas.add(self.activity.asignaturas.first())
+        Actividad.objects.create(
+            nombre='Final de otra', tipo_actividad=self.activity.tipo_actividad,
+            fecha_inicio=start, fecha_fin=start + timedelta(hours=1),
+        ).asignaturas.add(asignatura)
+
+        sequential, parallel = io.BytesIO(), io.BytesIO()
+        reports.build_agenda_pdf([self.titulacion, otra], sequential, processes=0)
+        # 'fork': los procesos del pool ven la base de datos del test (en memoria)
+        with mock.patch.object(reports, 'AGENDA_REPORTS_MP_CONTEXT', 'fork'):
+            reports.build_agenda_pdf([self.titulacion, otra], parallel, processes=2)
+
+        pages = [page.extract_text() for page in PdfReader(io.BytesIO(parallel.getvalue())).pages]
+        self.assertEqual(len(pages), len(PdfReader(io.BytesIO(sequential.getvalue())).pages))
+        self.assertGreater(len(pages), 2)
+        self.assertIn('Agenda General del Centro', pages[0])
+        self.assertIn('Titulación: Grado de prueba', pages[0])
+        self.assertIn('Titulación: Otra titulación', pages[-1])
+        self.assertIn('Generado el', pages[-1])
+        self.assertFalse(any('Otra titulación' in page for page in pages[:-1]))
+
+    def test_parallel_rendering_falls_back_without_pypdf(self):
+        otra = Titulacion.objects.create(nombre='Otra titulación')
+        output = io.BytesIO()
+        with mock.patch.object(reports, 'PYPDF_AVAILABLE', False), \
+                mock.patch.object(reports, '_build_agenda_pdf_parallel') as parallel:
+            reports.build_agenda_pdf([self.titulacion, otra], output, processes=4)
+        parallel.assert_not_called()
+        self.assertTrue(output.getvalue().startswith(b'%PDF'))
+
+
+class ConvocatoriasExportTests(TestCase):
+    """Exportación masiva de convocatorias en un ZIP"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.titulacion = Titulacion.objects.create(nombre='Grado de prueba')
+        primero = Asignatura.objects.create(nombre='Primero', titulacion=cls.titulacion, curso=1, semestre=1)
+        segundo = Asignatura.objects.create(nombre='Segundo', titulacion=cls.titulacion, curso=2, semestre=1)
+        tipo = TipoActividad.objects.create(nombre='Examen')
+        start = timezone.now()
+        cls.activities = []
+        for i, asignatura in enumerate((primero, primero, segundo)):
+            activity = Actividad.objects.create(
+                nombre=f'Examen {i}', tipo_actividad=tipo, fecha_inicio=start, fecha_fin=start + timedelta(hours=1)
+            )
+            activity.asignaturas.add(asignatura)
+            cls.activities.append(activity)
+        ActividadGrupo.objects.create(
+            actividad=cls.activities[0], nombre_grupo='A', orden=1, lugar='Aula 1',
+            fecha_inicio=start, fecha_fin=start + timedelta(hours=1),
+        )
+        cls.admin = CustomUser.objects.create_user(
+            username='admin', password='x', role=CustomUser.ROLE_ADMIN, is_staff=True
+        )
+
+    def _export(self, **params):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('export_convocatorias_zip'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_zip_contains_filtered_convocatorias(self):
+        with mock.patch.object(convocatorias, 'CONVOCATORIA_EXPORT_PROCESSES', 0):
+            archive = self._export(titulacion=self.titulacion.pk, curso=1)
+        names = sorted(archive.namelist())
+        self.assertEqual(names, [f'{a.pk}_convocatoria_Examen_{i}.pdf' for i, a in enumerate(self.activities[:2])])
+        self.assertTrue(archive.read(names[0]).startswith(b'%PDF'))
+
+    def test_pool_rendering_matches_single_download(self):
+        archive = self._export(curso=2)
+        activity = self.activities[2]
+        self.assertEqual(archive.namelist(), [f'{activity.pk}_convocatoria_Examen_2.pdf'])
+
+        single = self.client.get(reverse('activity_pdf_convocatoria', args=[activity.pk]))
+        self.assertEqual(single['Content-Disposition'], 'attachment; filename="convocatoria_Examen_2.pdf"')
+        self.assertTrue(archive.read(archive.namelist()[0]).startswith(b'%PDF'))
+
+    def test_pool_is_shut_down_when_client_disconnects(self):
+        pool = mock.MagicMock()
+        pool.map.side_effect = map
+        with mock.patch.object(convocatorias, 'ProcessPoolExecutor', return_value=pool):
+            chunks = convocatorias.stream_convocatorias_zip(Actividad.objects.order_by('pk'), batch_size=1)
+            next(chunks)
+            pool.shutdown.assert_not_called()
+            chunks.close()
+        pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+
+class AgendaSettingsCacheTests(TestCase):
+    """La fecha de cierre se lee de caché y se actualiza al guardar la configuración"""
+
+    def setUp(self):
+        AgendaSettings.invalidate_cache()
+
+    def test_closing_date_is_read_without_queries(self):
+        get_closing_date()
+        with self.assertNumQueries(0):
+            get_closing_date()
+
+    def test_update_is_visible_immediately(self):
+        get_closing_date()
+        admin = CustomUser.objects.create_user(username='admin', password='x', role=CustomUser.ROLE_ADMIN)
+        self.client.force_login(admin)
+        response = self.client.put(
+            reverse('ajax_update_agenda_settings'), json.dumps({'closing_date': '2030-01-31'}),
+            content_type='application/json'
+        )
+        self.assertTrue(response.json()['success'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_closing_date(), date(2030, 1, 31))
+
+    def test_change_from_other_process_is_read_after_local_ttl(self):
+        get_closing_date()
+        # Otro worker guarda la configuración: este proceso no se entera
+        AgendaSettings.objects.filter(pk=1).update(closing_date=date(2031, 6, 30))
+        self.assertNotEqual(get_closing_date(), date(2031, 6, 30))
+
+        caducado = time.monotonic() + AGENDA_SETTINGS_LOCAL_TTL + 1
+        with mock.patch('agenda_academica.models.time.monotonic', return_value=caducado):
+            with self.assertNumQueries(1):
+                self.assertEqual(get_closing_date(), date(2031, 6, 30))
+
+
+class ActivityFilterIndexTests(TestCase):
+    """Los filtros de los dashboards usan los índices compuestos (EXPLAIN)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        tipos = [TipoActividad.objects.create(nombre=f'Tipo {i}') for i in range(4)]
+        cls.titulaciones = [Titulacion.objects.create(nombre=f'Grado {i}') for i in range(3)]
+        asignaturas = Asignatura.objects.bulk_create([
+            Asignatura(nombre=f'Asignatura {t.pk}-{i}', titulacion=t, curso=i % 4 + 1, semestre=i % 2 + 1)
+            for t in cls.titulaciones for i in range(40)
+        ])
+        start = timezone.now()
+        activities = Actividad.objects.bulk_create([
+            Actividad(
+                nombre=f'Actividad {i}', tipo_actividad=tipos[i % 4],
+                fecha_inicio=start + timedelta(hours=i), fecha_fin=start + timedelta(hours=i + 1),
+                estado='borrada' if i % 25 == 0 else 'visible', activa=i % 25 != 0, aprobada=i % 3 != 0,
+            )
+            for i in range(500)
+        ])
+        Actividad.asignaturas.through.objects.bulk_create([
+            Actividad.asignaturas.through(actividad_id=a.pk, asignatura_id=asignaturas[i % len(asignaturas)].pk)
+            for i, a in enumerate(activities)
+        ])
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE')
+                # Con pocas filas PostgreSQL prefiere el recorrido secuencial
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            elif connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+            else:
+                self.skipTest('EXPLAIN sólo se comprueba en SQLite y PostgreSQL')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_asignatura_titulacion_curso_semestre(self):
+        self.assertUsesIndex(
+            Asignatura.objects.filter(titulacion=self.titulaciones[0], curso=2, semestre=2),
+            'asignatura_tit_curso_sem_idx'
+        )
+
+    def test_asignatura_curso_semestre(self):
+        self.assertUsesIndex(Asignatura.objects.filter(curso=3, semestre=1), 'asignatura_curso_sem_idx')
+
+    def test_coordinator_state_split(self):
+        self.assertUsesIndex(
+            Actividad.objects.filter(estado='borrada').order_by('fecha_inicio'), 'actividad_estado_fecha_idx'
+        )
+
+    def test_student_active_approved(self):
+        self.assertUsesIndex(
+            Actividad.objects.filter(activa=True, aprobada=True).order_by('fecha_inicio'),
+            'actividad_publicada_fecha_idx'
+        )
+
+
+class ActivityVersioningTests(TestCase):
+    """Sólo se versiona lo que cambia, con número de un contador atómico"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='profesor', password='x', role=CustomUser.ROLE_TEACHER)
+        titulacion = Titulacion.objects.create(nombre='Grado')
+        cls.asignaturas = [
+            Asignatura.objects.create(nombre=f'Asignatura {i}', titulacion=titulacion, curso=1, semestre=1)
+            for i in range(2)
+        ]
+        cls.tipo = TipoActividad.objects.create(nombre='Examen')
+
+    def setUp(self):
+        start = timezone.now()
+        activity = Actividad.objects.create(
+            nombre='Parcial', tipo_actividad=self.tipo, fecha_inicio=start, fecha_fin=start + timedelta(hours=1)
+        )
+        activity.asignaturas.set(self.asignaturas)
+        self.activity = Actividad.objects.get(pk=activity.pk)
+        self.activity._modified_by = self.user
+
+    # Caché local: sólo se cuentan las consultas del guardado, no las de la caché
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_unchanged_save_creates_no_version(self):
+        with self.assertNumQueries(3):  # SAVEPOINT, UPDATE, RELEASE
+            self.activity.save()
+        self.assertFalse(ActividadVersion.objects.exists())
+
+    def test_changed_save_snapshots_previous_state(self):
+        self.activity.nombre = 'Parcial 1'
+        self.activity.save()
+        self.activity.fecha_fin += timedelta(hours=1)
+        self.activity.save()
+
+        versions = versioning.versiones_de(self.activity)[::-1]
+        self.assertEqual([v.version_numero for v in versions], [1, 2])
+        self.assertEqual([v.nombre for v in versions], ['Parcial', 'Parcial 1'])
+        self.assertEqual([a['id'] for a in versions[0].asignaturas_snapshot], [a.pk for a in self.asignaturas])
+        self.assertEqual(versions[0].tipo_actividad_snapshot, {'id': self.tipo.pk, 'nombre': 'Examen'})
+        self.assertEqual(Actividad.objects.get(pk=self.activity.pk).version_actual, 2)
+
+    def test_stale_instance_does_not_reset_counter(self):
+        stale = Actividad.objects.get(pk=self.activity.pk)
+        self.activity.nombre = 'Parcial 1'
+        self.activity.save()
+        # Guardado interno (sin _modified_by) con una instancia cargada antes
+        stale.borrar()
+        self.assertEqual(Actividad.objects.get(pk=self.activity.pk).version_actual, 1)
+
+        self.activity.descripcion = 'Aula 2'
+        self.activity.save()
+        self.assertEqual(list(ActividadVersion.objects.values_list('version_numero', flat=True).order_by('version_numero')), [1, 2])
+
+    def test_date_shift_rewrites_delta_versions(self):
+        fechas = []
+        with mock.patch.object(versioning, 'ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL', 3):
+            for i in range(5):
+                fechas.append((self.activity.fecha_inicio, self.activity.fecha_fin))
+                self.activity.fecha_inicio += timedelta(days=1)
+                self.activity.fecha_fin += timedelta(days=1)
+                self.activity.save()
+
+        with transaction.atomic():
+            self.assertEqual(versioning.desplazar_fechas(self.activity.pk, timedelta(hours=1)), 5)
+
+        desplazadas = [(inicio + timedelta(hours=1), fin + timedelta(hours=1)) for inicio, fin in fechas]
+        versions = versioning.versiones_de(self.activity)[::-1]
+        self.assertEqual([(v.fecha_inicio, v.fecha_fin) for v in versions], desplazadas)
+        # Las completas siguen siendo las mismas y las diferencias siguen vacías en columnas
+        self.assertEqual(
+            list(ActividadVersion.objects.filter(es_completa=True).values_list('version_numero', flat=True).order_by('version_numero')),
+            [1, 4],
+        )
+        self.assertIsNone(ActividadVersion.objects.get(version_numero=2).fecha_inicio)
+
+    def test_save_recreates_row_deleted_by_another_request(self):
+        Actividad.objects.filter(pk=self.activity.pk).delete()
+        self.activity.nombre = 'Parcial 1'
+        self.activity.save()
+        self.assertEqual(Actividad.objects.get(pk=self.activity.pk).nombre, 'Parcial 1')
+
+    def test_version_errors_are_logged_without_breaking_save(self):
+        self.activity.nombre = 'Parcial 1'
+        with mock.patch('schedule.signals.crear_version', side_effect=ValueError('fallo')), \
+                self.assertLogs('schedule.signals', 'ERROR') as logs:
+            self.activity.save()
+        self.assertIn('fallo', logs.output[0])
+        self.assertEqual(Actividad.objects.get(pk=self.activity.pk).nombre, 'Parcial 1')
+
+    def test_compact_history_reconstructs_every_version(self):
+        estados = []
+        with mock.patch.object(versioning, 'ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL', 3):
+            for i in range(7):
+                estados.append((self.activity.nombre, self.activity.fecha_fin))
+                self.activity.nombre = f'Parcial {i}'
+                self.activity.fecha_fin += timedelta(minutes=1)
+                self.activity.save()
+
+        self.assertEqual(
+            list(ActividadVersion.objects.filter(es_completa=True).values_list('version_numero', flat=True).order_by('version_numero')),
+            [1, 4, 7],
+        )
+        delta = ActividadVersion.objects.get(version_numero=6)
+        self.assertEqual(set(delta.cambios), {'nombre', 'fecha_fin'})
+        self.assertEqual((delta.nombre, delta.fecha_fin), ('', None))
+
+        versioning.cargar_version(delta)
+        self.assertEqual((delta.nombre, delta.fecha_fin), estados[5])
+        self.assertEqual([a['id'] for a in delta.asignaturas_snapshot], [a.pk for a in self.asignaturas])
+        reconstructed = [(v.nombre, v.fecha_fin) for v in versioning.versiones_de(self.activity)[::-1]]
+        self.assertEqual(reconstructed, estados)
+
+        # Expandir el historial y volver a compactarlo no cambia ninguna versión
+        call_command('compactar_versiones', intervalo=1, stdout=io.StringIO())
+        self.assertFalse(ActividadVersion.objects.filter(es_completa=False).exists())
+        call_command('compactar_versiones', intervalo=5, stdout=io.StringIO())
+        self.assertEqual(ActividadVersion.objects.filter(es_completa=True).count(), 2)
+        reconstructed = [(v.nombre, v.fecha_fin) for v in versioning.versiones_de(self.activity)[::-1]]
+        self.assertEqual(reconstructed, estados)
+
+
+class ActivityLogsPageTests(TestCase):
+    """Registro de actividad paginado por (timestamp, id_log) con filtros en el servidor"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(username='admin', password='x', role=CustomUser.ROLE_ADMIN)
+        otro = CustomUser.objects.create_user(username='otro', password='x', role=CustomUser.ROLE_TEACHER)
+        tipo = TipoActividad.objects.create(nombre='Examen')
+        start = timezone.now()
+        activity = Actividad.objects.create(
+            nombre='Parcial', tipo_actividad=tipo, fecha_inicio=start, fecha_fin=start + timedelta(hours=1)
+        )
+        for i in range(7):
+            LogActividad.objects.create(
+                actividad=activity, object_name='Parcial', usuario=cls.admin, tipo_log='Modificación',
+            )
+        LogActividad.objects.create(object_type='tipo_actividad', object_name='Examen', usuario=otro, tipo_log='Creación')
+        # Marcas de tiempo repetidas: id_log desempata
+        LogActividad.objects.update(timestamp=start)
+        LogActividad.objects.filter(object_type='tipo_actividad').update(timestamp=start - timedelta(days=3))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def _pages(self, **params):
+        ids, cursor, queries = [], None, []
+        while True:
+            query = dict(params, limit=3)
+            if cursor:
+                query['cursor'] = cursor
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.client.get(reverse('activity_logs_page'), query).json()
+            queries.append(len(ctx.captured_queries))
+            self.assertTrue(data['success'])
+            ids += [row['id'] for row in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return ids, queries
+
+    def test_pages_cover_log_in_order_with_constant_queries(self):
+        ids, queries = self._pages()
+        expected = list(LogActividad.objects.order_by('-timestamp', '-id_log').values_list('id_log', flat=True))
+        self.assertEqual(ids, expected)
+        # select_related: las consultas por página no dependen de las filas
+        self.assertEqual(len(set(queries)), 1)
+
+    def test_filters(self):
+        self.assertEqual(len(self._pages(object_type='tipo_actividad')[0]), 1)
+        self.assertEqual(len(self._pages(tipo_log='Modificación')[0]), 7)
+        self.assertEqual(len(self._pages(usuario='otro')[0]), 1)
+        self.assertEqual(self._pages(usuario='nadie')[0], [])
+        hoy = timezone.localdate()
+        self.assertEqual(len(self._pages(desde=hoy.isoformat())[0]), 7)
+        self.assertEqual(len(self._pages(hasta=(hoy - timedelta(days=1)).isoformat())[0]), 1)
+
+        response = self.client.get(reverse('activity_logs_page'), {'desde': '2026-13-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AuditLogTests(TransactionTestCase):
+    """El registro de actividad se guarda al final de la petición y sólo si se confirma"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='admin', password='x', role=CustomUser.ROLE_ADMIN)
+
+    def _view(self, request):
+        registrar_log(object_name='A', usuario=self.user, tipo_log='Creación')
+        with transaction.atomic():
+            registrar_log(object_name='B', usuario=self.user, tipo_log='Modificación')
+        try:
+            with transaction.atomic():
+                registrar_log(object_name='C', usuario=self.user, tipo_log='Eliminación')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(LogActividad.objects.exists())
+        return HttpResponse()
+
+    def test_entries_written_once_at_response_end_without_rolled_back_ones(self):
+        with CaptureQueriesContext(connection) as ctx:
+            AuditLogMiddleware(self._view)(RequestFactory().get('/'))
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT') and 'schedule_logactividad' in q['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(sorted(LogActividad.objects.values_list('object_name', flat=True)), ['A', 'B'])
+
+    def test_outside_request_written_on_commit(self):
+        with transaction.atomic():
+            registrar_log(object_name='A', usuario=self.user, tipo_log='Creación')
+            self.assertFalse(LogActividad.objects.exists())
+        self.assertTrue(LogActividad.objects.filter(object_name='A').exists())
+
+
+class LogArchiveTests(TestCase):
+    """El registro antiguo se mueve por lotes a ficheros .jsonl.gz consultables"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(archive, 'LOG_ARCHIVE_DIR', Path(tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = CustomUser.objects.create_user(username='ana', password='x')
+        for i in range(5):
+            LogActividad.objects.create(object_name=f'Antigua {i}', usuario=user, tipo_log='Creation' if i % 2 else 'Deletion')
+        LogActividad.objects.update(timestamp=timezone.now() - timedelta(days=400))
+        LogActividad.objects.create(object_name='Reciente', usuario=user, tipo_log='Creation')
+
+    def test_archives_old_rows_in_batches_and_reads_them_back(self):
+        # Un lote escrito pero no borrado (proceso interrumpido) se reescribe al relanzar
+        archive.escribir_lote('actividad', list(archive.filas_archivables('actividad', LogActividad.objects.all())[:3]))
+
+        call_command('archivar_logs', dias=365, batch_size=2, stdout=io.StringIO())
+
+        self.assertEqual(list(LogActividad.objects.values_list('object_name', flat=True)), ['Reciente'])
+        self.assertEqual(len(list((archive.LOG_ARCHIVE_DIR / 'actividad').glob('*.jsonl.gz'))), 3)
+        archivadas = list(archive.leer_archivo('actividad'))
+        self.assertEqual(sorted(fila['object_name'] for fila in archivadas), [f'Antigua {i}' for i in range(5)])
+        self.assertEqual(archivadas[0]['usuario__username'], 'ana')
+
+        creaciones = archive.leer_archivo('actividad', tipo_log='Creation', usuario__username='ana')
+        self.assertEqual(sorted(fila['object_name'] for fila in creaciones), ['Antigua 1', 'Antigua 3'])
+        self.assertEqual(list(archive.leer_archivo('actividad', desde=timezone.now() - timedelta(days=30))), [])
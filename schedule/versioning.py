@@ -0,0 +1,220 @@
+"""
+Almacenamiento compacto del historial de versiones de actividades.
+
+Una de cada ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL versiones (la 1, la N+1,
+la 2N+1...) guarda el estado completo en sus columnas; el resto guarda en
+`cambios` sólo los campos que difieren de la versión inmediatamente
+anterior y deja las columnas vacías. Para leer una versión se parte de la
+última completa anterior y se aplican las diferencias en orden: como mucho
+N filas, en una sola consulta.
+
+Con un intervalo de 1 (o 0) todas las versiones son completas, como antes.
+El historial existente se reescribe con `manage.py compactar_versiones`.
+
+Las fechas de una versión de diferencias están en `cambios`, no en sus
+columnas: para corregirlas hay que reconstruir el historial, cambiarlo y
+volver a compactarlo (desplazar_fechas). Ambas reescrituras bloquean la
+actividad y sus versiones y deben llamarse dentro de una transacción.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Subquery
+
+from .models import Actividad, ActividadVersion
+
+ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL = getattr(settings, 'ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL', 10)
+
+# Campos copiados a ActividadVersion desde el estado anterior de la actividad
+SNAPSHOT_FIELDS = (
+    'nombre', 'descripcion', 'fecha_inicio', 'fecha_fin', 'evaluable',
+    'porcentaje_evaluacion', 'no_recuperable', 'aprobada', 'activa',
+)
+
+# Estado completo de una versión: campos simples más tipo y asignaturas
+ESTADO_FIELDS = SNAPSHOT_FIELDS + ('asignaturas_snapshot', 'tipo_actividad_snapshot')
+
+
+def es_completa(version_numero, intervalo=None):
+    """True si a la versión le corresponde guardar el estado completo"""
+    intervalo = ACTIVIDAD_VERSION_SNAPSHOT_INTERVAL if intervalo is None else intervalo
+    return intervalo <= 1 or (version_numero - 1) % intervalo == 0
+
+
+def _serializar(value):
+    # isoformat completo: DjangoJSONEncoder recorta los microsegundos
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _deserializar(name, value):
+    return ActividadVersion._meta.get_field(name).to_python(value)
+
+
+def estado(version):
+    """Estado de una versión completa (o ya reconstruida) como diccionario"""
+    return {name: getattr(version, name) for name in ESTADO_FIELDS}
+
+
+def diferencias(anterior, actual):
+    """Campos de `actual` que cambian respecto a `anterior`, listos para JSON"""
+    return {
+        name: _serializar(actual[name])
+        for name in ESTADO_FIELDS
+        if actual[name] != anterior[name]
+    }
+
+
+def _vaciar(version):
+    for name in ESTADO_FIELDS:
+        setattr(version, name, ActividadVersion._meta.get_field(name).get_default())
+
+
+def reconstruir(versiones):
+    """
+    Rellena las columnas de las versiones guardadas como diferencias.
+
+    `versiones` son versiones de una misma actividad en orden ascendente de
+    version_numero, empezando por una completa. Se modifican en el sitio y
+    se devuelve la misma lista.
+    """
+    actual = None
+    for version in versiones:
+        if version.es_completa:
+            actual = estado(version)
+            continue
+        if actual is None:
+            raise ValueError(
+                f'La versión {version.version_numero} de la actividad '
+                f'{version.actividad_original_id} no tiene una versión completa anterior'
+            )
+        actual = {**actual, **{name: _deserializar(name, value) for name, value in version.cambios.items()}}
+        for name, value in actual.items():
+            setattr(version, name, value)
+    return versiones
+
+
+def _cadena(actividad_id, version_numero):
+    """Versiones desde la última completa hasta `version_numero`, en orden ascendente"""
+    base = ActividadVersion.objects.filter(
+        actividad_original_id=actividad_id, version_numero__lte=version_numero, es_completa=True,
+    ).order_by('-version_numero').values('version_numero')[:1]
+    return list(ActividadVersion.objects.filter(
+        actividad_original_id=actividad_id,
+        version_numero__gte=Subquery(base),
+        version_numero__lte=version_numero,
+    ).order_by('version_numero'))
+
+
+def cargar_version(version):
+    """Reconstruye `version` en el sitio (si es completa no hace consultas)"""
+    if not version.es_completa:
+        anteriores = _cadena(version.actividad_original_id, version.version_numero - 1)
+        reconstruir(anteriores + [version])
+    return version
+
+
+def versiones_de(actividad):
+    """Todas las versiones de la actividad reconstruidas, de la más reciente a la más antigua"""
+    versiones = list(actividad.versiones.select_related('modificada_por').order_by('version_numero'))
+    reconstruir(versiones)
+    versiones.reverse()
+    return versiones
+
+
+def crear_version(actividad_id, version_numero, estado_actual, **datos):
+    """
+    Guarda la versión `version_numero` con el estado `estado_actual`
+    (diccionario con ESTADO_FIELDS). Se guarda como diferencias si no le
+    toca ser completa y la versión anterior existe; si falta (hueco en la
+    numeración) se guarda completa.
+    """
+    if not es_completa(version_numero):
+        anteriores = _cadena(actividad_id, version_numero - 1)
+        if anteriores and anteriores[-1].version_numero == version_numero - 1:
+            anterior = estado(reconstruir(anteriores)[-1])
+            version = ActividadVersion(
+                actividad_original_id=actividad_id,
+                version_numero=version_numero,
+                es_completa=False,
+                cambios=diferencias(anterior, estado_actual),
+                **datos,
+            )
+            _vaciar(version)
+            version.save()
+            return version
+    return ActividadVersion.objects.create(
+        actividad_original_id=actividad_id,
+        version_numero=version_numero,
+        **estado_actual,
+        **datos,
+    )
+
+
+def _historial(actividad_id):
+    """
+    Versiones de la actividad reconstruidas, en orden ascendente, con la
+    actividad y sus versiones bloqueadas hasta el final de la transacción
+    (la señal de versionado actualiza la actividad antes de crear una)
+    """
+    list(Actividad.objects.select_for_update().filter(pk=actividad_id).values_list('pk', flat=True))
+    return reconstruir(list(
+        ActividadVersion.objects.select_for_update()
+        .filter(actividad_original_id=actividad_id).order_by('version_numero')
+    ))
+
+
+def _recompactar(versiones, completa):
+    """
+    Recalcula es_completa y cambios de versiones reconstruidas; `completa`
+    indica qué versiones se guardan completas (la primera siempre lo es).
+    Devuelve las versiones cuya forma de guardarse cambia.
+    """
+    modificadas = []
+    anterior = None
+    for version in versiones:
+        actual = estado(version)
+        previa = (version.es_completa, version.cambios)
+        if anterior is None or completa(version):
+            version.es_completa, version.cambios = True, {}
+        else:
+            version.es_completa, version.cambios = False, diferencias(anterior, actual)
+            _vaciar(version)
+        if (version.es_completa, version.cambios) != previa:
+            modificadas.append(version)
+        anterior = actual
+    return modificadas
+
+
+def compactar_actividad(actividad_id, intervalo=None, guardar=True):
+    """
+    Reescribe el historial de una actividad con el intervalo indicado:
+    completa cada N versiones (y siempre la primera), diferencias en el
+    resto. Devuelve (versiones, filas que cambian). Con intervalo 1 todas
+    vuelven a ser completas.
+    """
+    versiones = _historial(actividad_id)
+    modificadas = _recompactar(versiones, lambda version: es_completa(version.version_numero, intervalo))
+    if guardar and modificadas:
+        ActividadVersion.objects.bulk_update(modificadas, ['es_completa', 'cambios', *ESTADO_FIELDS])
+    return len(versiones), len(modificadas)
+
+
+def desplazar_fechas(actividad_id, delta):
+    """
+    Suma `delta` a fecha_inicio y fecha_fin de todas las versiones de la
+    actividad, estén en columnas o en `cambios`, conservando qué versiones
+    son completas. Devuelve cuántas versiones se han reescrito.
+    """
+    versiones = _historial(actividad_id)
+    for version in versiones:
+        for name in ('fecha_inicio', 'fecha_fin'):
+            if getattr(version, name) is not None:
+                setattr(version, name, getattr(version, name) + delta)
+    _recompactar(versiones, lambda version: version.es_completa)
+    ActividadVersion.objects.bulk_update(versiones, ['es_completa', 'cambios', *ESTADO_FIELDS])
+    return len(versiones)
@@ -1,14 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.db import transaction
 from django.http import HttpResponseRedirect
 from users.views import is_teacher, is_coordinator, is_coordinator_or_admin
 from .forms import ActividadForm, VistaCalendarioForm, MultiGroupActivityForm, UnifiedActivityForm
 from .models import Actividad, ActividadGrupo, VistaCalendario, LogActividad, TipoActividad, ActividadVersion
-from icalendar import Calendar, Event
-from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
+from .events import load_rows, get_closing_date, get_date_window, build_teacher_events, build_calendar_events
+from .ical import get_ical_feed, get_feed_activities, stream_ical_feed
+from .versioning import cargar_version, versiones_de
+from .pagination import keyset_paginate
+from .audit import registrar_log
+from users.models import CustomUser, EstadisticasKPI
+from .convocatorias import (
+    convocatoria_data, convocatoria_filename, render_convocatoria_pdf, stream_convocatorias_zip,
+)
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect, StreamingHttpResponse, FileResponse
 from agenda_academica.models import AgendaSettings
 from academics.models import Asignatura, Titulacion
 from django.core import serializers
@@ -19,18 +27,18 @@ from django.utils.translation import gettext_lazy as _
 from django.template.loader import get_template
 from django.conf import settings
 from django.utils import formats
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.dateparse import parse_date
+from django.utils import timezone
 import json
 import uuid
-from datetime import datetime
-try:
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+from datetime import datetime, time, timedelta
+from .reports import (
+    REPORTLAB_AVAILABLE, STATUS_READY, STATUS_PENDING, STATUS_MISSING,
+    agenda_report_filename, agenda_report_key, agenda_report_status,
+    enqueue_agenda_report, get_report_meta, get_report_path,
+)
 
 def get_user_dashboard_url(user):
     """Helper function to get the correct dashboard URL based on user role"""
@@ -69,13 +77,15 @@ def activity_form(request, pk=None, read_only=False): # Added read_only paramete
                 activity = form.save(commit=False)
                 activity._modified_by = request.user
                 activity._version_comment = request.POST.get('version_comment', '')
+                # Las asignaturas se guardan después (save_m2m): se avisa al versionado
+                activity._asignaturas_modificadas = 'asignaturas' in form.changed_data
                 activity.save()
                 # Need to save many-to-many relationships manually when using commit=False
                 form.save_m2m()
             else:
                 activity = form.save()
             if is_new_activity:
-                LogActividad.objects.create(
+                registrar_log(
                     object_type='actividad',
                     object_name=activity.nombre,
                     object_id=activity.id,
@@ -88,7 +98,7 @@ def activity_form(request, pk=None, read_only=False): # Added read_only paramete
                     }
                 )
             else:
-                LogActividad.objects.create(
+                registrar_log(
                     object_type='actividad',
                     object_name=activity.nombre,
                     object_id=activity.id,
@@ -116,7 +126,7 @@ def activity_delete(request, pk):
     if request.method == 'POST':
         activity.activa = False
         activity.save()
-        LogActividad.objects.create(
+        registrar_log(
             actividad=activity,
             usuario=request.user,
             tipo_log=_('Deletion')
@@ -147,35 +157,12 @@ def activity_detail_view(request, pk):
 
     return render(request, 'schedule/activity_detail.html', context)
 
-def format_spanish_datetime(dt, format_type='long'):
-    """
-    Formatea datetime en español usando el sistema de localización de Django
-    """
-    if format_type == 'long':
-        # Formato: "25 de enero de 2025, 14:30"
-        return formats.date_format(dt, "j \\d\\e F \\d\\e Y, H:i")
-    elif format_type == 'short':
-        # Formato: "25/01/2025 14:30"
-        return formats.date_format(dt, "d/m/Y H:i")
-    else:
-        return formats.date_format(dt, format_type)
-
 @login_required
 @user_passes_test(is_teacher)
 def activity_pdf_convocatoria(request, pk):
     """
     Genera un PDF con formato de convocatoria oficial para una actividad
     """
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import cm
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib import colors
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-    from django.http import HttpResponse
-    from django.utils import timezone
-    import os
-
     activity = get_object_or_404(Actividad, pk=pk)
 
     # IDOR check
@@ -184,167 +171,58 @@ def activity_pdf_convocatoria(request, pk):
 
     # Create HTTP response with PDF content type
     response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="convocatoria_{activity.nombre.replace(" ", "_")}.pdf"'
-
-    # Create PDF document
-    doc = SimpleDocTemplate(response, pagesize=A4,
-                          rightMargin=2*cm, leftMargin=2*cm,
-                          topMargin=2*cm, bottomMargin=2*cm)
-
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
+    response['Content-Disposition'] = f'attachment; filename="{convocatoria_filename(activity)}"'
 
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=12,
-        textColor=colors.darkblue
-    )
-
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=6
-    )
+    render_convocatoria_pdf(convocatoria_data(activity), response)
 
-    # Build content
-    content = []
-
-    # Title
-    content.append(Paragraph("CONVOCATORIA DE ACTIVIDAD", title_style))
-    content.append(Spacer(1, 0.5*cm))
+    return response
 
-    # Activity basic info
-    content.append(Paragraph("INFORMACIÓN GENERAL", subtitle_style))
+@login_required
+@user_passes_test(is_coordinator_or_admin)
+def export_convocatorias_zip(request):
+    """
+    Descarga en un ZIP las convocatorias de las actividades activas filtradas
+    por titulación, curso y semestre. Los PDF se maquetan en un pool de
+    procesos y el ZIP se envía en streaming según se van generando.
+    """
+    if not REPORTLAB_AVAILABLE:
+        return HttpResponse("PDF generation is not available. Please install reportlab.", status=500)
 
-    # Estilo para texto de info que puede ser largo
-    info_cell_style = ParagraphStyle(
-        'InfoCellStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        wordWrap='CJK',
-        alignment=TA_LEFT
-    )
+    selected_titulaciones = request.GET.getlist('titulacion')
+    selected_cursos = request.GET.getlist('curso')
+    selected_semestres = request.GET.getlist('semestre')
 
-    info_data = [
-        ['Nombre de la Actividad:', Paragraph(activity.nombre, info_cell_style)],
-        ['Tipo de Actividad:', activity.tipo_actividad.nombre],
-        ['Fecha de Inicio:', format_spanish_datetime(timezone.localtime(activity.fecha_inicio), 'long')],
-        ['Fecha de Fin:', format_spanish_datetime(timezone.localtime(activity.fecha_fin), 'long')],
-    ]
-
-    # Add subjects
-    asignaturas = ', '.join([asig.nombre for asig in activity.asignaturas.all()])
-    info_data.append(['Asignaturas:', Paragraph(asignaturas, info_cell_style)])
-
-    # Add evaluation info if applicable
-    if activity.evaluable:
-        info_data.append(['Evaluable:', f'Sí ({activity.porcentaje_evaluacion}%)'])
-        if activity.no_recuperable:
-            info_data.append(['Recuperable:', 'No'])
-        else:
-            info_data.append(['Recuperable:', 'Sí'])
+    # Solo el admin ve todo; el resto (rol o perfil de coordinador), sus titulaciones
+    if request.user.es_admin():
+        titulaciones = Titulacion.objects.all()
     else:
-        info_data.append(['Evaluable:', 'No'])
-
-    info_table = Table(info_data, colWidths=[5*cm, 10*cm])
-    info_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        # No aplicar FONTNAME a columna derecha ya que puede contener Paragraphs
-        ('FONTSIZE', (0, 0), (0, -1), 10),  # Solo aplicar a columna izquierda
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),  # TOP alineación para mejor texto multilinea
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-
-    content.append(info_table)
-    content.append(Spacer(1, 0.5*cm))
-
-    # Groups information (if multi-group)
-    grupos = activity.grupos.all().order_by('orden')
-    if grupos.exists():
-        content.append(Paragraph("GRUPOS Y HORARIOS", subtitle_style))
-
-        # Crear un estilo para texto de celda que puede expandirse
-        cell_style = ParagraphStyle(
-            'CellStyle',
-            parent=styles['Normal'],
-            fontSize=9,
-            wordWrap='CJK',  # Permite mejor ajuste de líneas
-            alignment=TA_LEFT
-        )
+        titulaciones = Titulacion.objects.filter(coordinador=request.user)
 
-        group_data = [['Grupo', 'Fecha/Hora Inicio', 'Fecha/Hora Fin', 'Lugar', 'Descripción']]
-        for grupo in grupos:
-            # Usar Paragraph para las celdas que pueden tener mucho texto
-            lugar_text = Paragraph(grupo.lugar or 'No especificado', cell_style)
-            descripcion_text = Paragraph(grupo.descripcion or '-', cell_style)
-
-            group_data.append([
-                grupo.nombre_grupo,
-                format_spanish_datetime(timezone.localtime(grupo.fecha_inicio), 'short'),
-                format_spanish_datetime(timezone.localtime(grupo.fecha_fin), 'short'),
-                lugar_text,
-                descripcion_text
-            ])
-
-        groups_table = Table(group_data, colWidths=[2*cm, 3.5*cm, 3.5*cm, 3*cm, 3*cm])
-        groups_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (2, -1), 'CENTER'),  # Centrar solo las primeras 3 columnas (Grupo, fechas)
-            ('ALIGN', (3, 1), (-1, -1), 'LEFT'),    # Alinear a la izquierda lugar y descripción
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, 1), (2, -1), 'Helvetica'),  # Solo para texto plano (no Paragraphs)
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),  # Alinear todo al top para mejor texto multilinea
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),  # Alternar colores de filas
-        ]))
-
-        content.append(groups_table)
-        content.append(Spacer(1, 0.5*cm))
-
-    # Description
-    if activity.descripcion:
-        content.append(Paragraph("DESCRIPCIÓN", subtitle_style))
-        content.append(Paragraph(activity.descripcion, normal_style))
-        content.append(Spacer(1, 0.5*cm))
-
-    # Footer
-    content.append(Spacer(1, 1*cm))
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=9,
-        alignment=TA_CENTER,
-        textColor=colors.grey
+    asignaturas = Asignatura.objects.filter(titulacion__in=titulaciones)
+    try:
+        if selected_titulaciones:
+            asignaturas = asignaturas.filter(titulacion_id__in=[int(t) for t in selected_titulaciones])
+        if selected_cursos:
+            asignaturas = asignaturas.filter(curso__in=[int(c) for c in selected_cursos])
+        if selected_semestres:
+            asignaturas = asignaturas.filter(semestre__in=[int(s) for s in selected_semestres])
+    except ValueError:
+        return HttpResponse("Invalid filter.", status=400)
+
+    activities = Actividad.objects.filter(
+        asignaturas__in=asignaturas, activa=True
+    ).distinct().order_by('fecha_inicio').select_related('tipo_actividad').prefetch_related('grupos', 'asignaturas')
+
+    registrar_log(
+        object_type='actividad',
+        object_name="Convocatorias ZIP",
+        usuario=request.user,
+        tipo_log=_('Report Generation'),
+        details=f'Bulk convocatoria export (titulacion={selected_titulaciones or "all"}, curso={selected_cursos or "all"}, semestre={selected_semestres or "all"})'
     )
 
-    content.append(Paragraph(
-        f"Documento generado el {format_spanish_datetime(timezone.localtime(timezone.now()), 'long')}",
-        footer_style
-    ))
-
-    # Build PDF
-    doc.build(content)
-
+    response = StreamingHttpResponse(stream_convocatorias_zip(activities), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="convocatorias.zip"'
     return response
 
 @login_required
@@ -381,173 +259,15 @@ def get_filtered_activities(request):
 
     activities = Actividad.objects.filter(**activities_filter).distinct().order_by('fecha_inicio')
 
-    # Manually serialize the data to include related fields
-    from django.utils import timezone
-
-    try:
-        closing_date = AgendaSettings.load().closing_date
-    except Exception:
-        closing_date = timezone.now().date()
-
-    activities_data = []
-    teacher_subject_ids = set(request.user.subjects.all().values_list('id', flat=True))
-
-    for activity in activities:
-        # Get groups for this activity (new system) or use legacy fields
-        grupos = activity.grupos.all().order_by('orden')
-        
-        if grupos.exists():
-            # New system: 
-            # For multi-group activities: show as single row in table, multiple events in calendar
-            # For single-group activities: show normally
-            
-            if grupos.count() > 1:
-                # Multi-group activity: create single entry for table display
-                primer_grupo = grupos.first()
-                event_class_names = []
-                if primer_grupo.fecha_inicio.date() < closing_date:
-                    event_class_names.append('past-event')
-                else:
-                    event_class_names.append('future-event')
-
-                subject_names = ", ".join([s.nombre for s in activity.asignaturas.all()])
-                
-                # Check if the activity belongs to the current teacher
-                activity_subject_ids = set(activity.asignaturas.all().values_list('id', flat=True))
-                is_own = not teacher_subject_ids.isdisjoint(activity_subject_ids)
-
-                # Create summary info for multi-group activity
-                grupos_info = []
-                for g in grupos:
-                    grupos_info.append({
-                        'nombre': g.nombre_grupo,
-                        'fecha_inicio': g.fecha_inicio.isoformat(),
-                        'fecha_fin': g.fecha_fin.isoformat(),
-                        'lugar': g.lugar or '',
-                        'descripcion': g.descripcion or ''
-                    })
-
-                activities_data.append({
-                    'id': activity.id,  # Use activity ID for table display
-                    'activity_id': activity.id,
-                    'title': f"{activity.nombre} ({grupos.count()} grupos)",
-                    'start': primer_grupo.fecha_inicio.isoformat(),
-                    'end': primer_grupo.fecha_fin.isoformat(), 
-                    'classNames': event_class_names,
-                    'extendedProps': {
-                        'description': activity.descripcion or primer_grupo.descripcion,
-                        'activity_type': activity.tipo_actividad.nombre,
-                        'subjects': subject_names,
-                        'is_approved': activity.aprobada,
-                        'is_active': activity.activa,
-                        'evaluable': activity.evaluable,
-                        'percentage': activity.porcentaje_evaluacion,
-                        'is_own': is_own,
-                        'is_multi_group': True,
-                        'grupos_count': grupos.count(),
-                        'grupos_info': grupos_info
-                    }
-                })
-                
-                # Also add individual events for calendar display
-                for grupo in grupos:
-                    event_class_names = []
-                    if grupo.fecha_inicio.date() < closing_date:
-                        event_class_names.append('past-event')
-                    else:
-                        event_class_names.append('future-event')
-
-                    activities_data.append({
-                        'id': f"{activity.id}_grupo_{grupo.id}",  # Unique ID for calendar
-                        'activity_id': activity.id,
-                        'grupo_id': grupo.id,
-                        'title': f"{activity.nombre} - Grupo {grupo.nombre_grupo}",
-                        'start': grupo.fecha_inicio.isoformat(),
-                        'end': grupo.fecha_fin.isoformat(),
-                        'classNames': event_class_names + ['calendar-only'],  # Mark as calendar-only
-                        'extendedProps': {
-                            'description': grupo.descripcion or activity.descripcion,
-                            'activity_type': activity.tipo_actividad.nombre,
-                            'subjects': subject_names,
-                            'is_approved': activity.aprobada,
-                            'is_active': activity.activa,
-                            'evaluable': activity.evaluable,
-                            'percentage': activity.porcentaje_evaluacion,
-                            'is_own': is_own,
-                            'grupo_nombre': grupo.nombre_grupo,
-                            'is_multi_group': True,
-                            'is_calendar_event': True  # Mark as calendar-only event
-                        }
-                    })
-            else:
-                # Single group activity: show normally
-                grupo = grupos.first()
-                event_class_names = []
-                if grupo.fecha_inicio.date() < closing_date:
-                    event_class_names.append('past-event')
-                else:
-                    event_class_names.append('future-event')
+    teacher_subject_ids = request.user.subjects.all().values_list('id', flat=True)
 
-                subject_names = ", ".join([s.nombre for s in activity.asignaturas.all()])
-                
-                # Check if the activity belongs to the current teacher
-                activity_subject_ids = set(activity.asignaturas.all().values_list('id', flat=True))
-                is_own = not teacher_subject_ids.isdisjoint(activity_subject_ids)
-
-                activities_data.append({
-                    'id': activity.id,
-                    'activity_id': activity.id,
-                    'grupo_id': grupo.id,
-                    'title': activity.nombre,
-                    'start': grupo.fecha_inicio.isoformat(),
-                    'end': grupo.fecha_fin.isoformat(),
-                    'classNames': event_class_names,
-                    'extendedProps': {
-                        'description': grupo.descripcion or activity.descripcion,
-                        'activity_type': activity.tipo_actividad.nombre,
-                        'subjects': subject_names,
-                        'is_approved': activity.aprobada,
-                        'is_active': activity.activa,
-                        'evaluable': activity.evaluable,
-                        'percentage': activity.porcentaje_evaluacion,
-                        'is_own': is_own,
-                        'is_multi_group': False
-                    }
-                })
-        else:
-            # Legacy system: use activity's direct fields
-            event_class_names = []
-            if activity.fecha_inicio.date() < closing_date:
-                event_class_names.append('past-event')
-            else:
-                event_class_names.append('future-event')
+    # Grupos, asignaturas y tipos se cargan en bloque: el número de consultas
+    # no depende del número de actividades. Si FullCalendar envía el rango
+    # visible (start/end) sólo se devuelven las actividades de ese rango
+    activities_data = build_teacher_events(
+        load_rows(activities, get_date_window(request.GET)), get_closing_date(), teacher_subject_ids
+    )
 
-            subject_names = ", ".join([s.nombre for s in activity.asignaturas.all()])
-            
-            # Check if the activity belongs to the current teacher
-            activity_subject_ids = set(activity.asignaturas.all().values_list('id', flat=True))
-            is_own = not teacher_subject_ids.isdisjoint(activity_subject_ids)
-
-            activities_data.append({
-                'id': activity.id,
-                'activity_id': activity.id,
-                'title': activity.nombre,
-                'start': activity.fecha_inicio.isoformat(),
-                'end': activity.fecha_fin.isoformat(),
-                'classNames': event_class_names,
-                'extendedProps': {
-                    'description': activity.descripcion,
-                    'activity_type': activity.tipo_actividad.nombre,
-                    'subjects': subject_names,
-                    'is_approved': activity.aprobada,
-                    'is_active': activity.activa,
-                    'evaluable': activity.evaluable,
-                    'percentage': activity.porcentaje_evaluacion,
-                    'is_own': is_own,
-                    'is_multi_group': False
-                }
-            })
-    
     return JsonResponse(activities_data, safe=False)
 
 @login_required
@@ -559,8 +279,79 @@ def activity_list(request):
 @login_required
 @user_passes_test(is_coordinator_or_admin)
 def activity_logs(request):
-    logs = LogActividad.objects.all().order_by('-timestamp')
-    return render(request, 'schedule/activity_logs.html', {'logs': logs})
+    # Las filas se cargan por páginas desde activity_logs_page
+    return render(request, 'schedule/activity_logs.html', {
+        'object_types': LogActividad.OBJECT_TYPE_CHOICES,
+    })
+
+LOG_PAGE_SIZE = 50
+LOG_MAX_PAGE_SIZE = 200
+
+@login_required
+@user_passes_test(is_coordinator_or_admin)
+def activity_logs_page(request):
+    """
+    Una página del registro de actividad en JSON, de la entrada más reciente
+    a la más antigua.
+
+    Filtros opcionales: 'object_type', 'tipo_log', 'usuario' (nombre de
+    usuario), 'desde' y 'hasta' (AAAA-MM-DD, ambos incluidos). Se pagina por
+    clave sobre (timestamp, id_log) con 'limit' y el 'cursor' devuelto por
+    la página anterior; cada combinación de filtros tiene su índice, así
+    que el coste de una página no crece con el tamaño del registro.
+    """
+    try:
+        limit = min(int(request.GET.get('limit', LOG_PAGE_SIZE)), LOG_MAX_PAGE_SIZE)
+    except ValueError:
+        limit = LOG_PAGE_SIZE
+    limit = max(limit, 1)
+
+    logs = LogActividad.objects.select_related('usuario', 'actividad')
+
+    object_type = request.GET.get('object_type')
+    if object_type:
+        logs = logs.filter(object_type=object_type)
+    tipo_log = request.GET.get('tipo_log')
+    if tipo_log:
+        logs = logs.filter(tipo_log=tipo_log)
+    username = request.GET.get('usuario')
+    if username:
+        # Se resuelve el id antes para usar el índice (usuario, timestamp)
+        usuario_id = CustomUser.objects.filter(username=username).values_list('pk', flat=True).first()
+        logs = logs.filter(usuario_id=usuario_id) if usuario_id else logs.none()
+
+    tz = timezone.get_current_timezone()
+    for param, lookup, offset in (('desde', 'timestamp__gte', 0), ('hasta', 'timestamp__lt', 1)):
+        value = request.GET.get(param)
+        if not value:
+            continue
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            return JsonResponse({'success': False, 'error': f'Invalid {param}'}, status=400)
+        day += timedelta(days=offset)
+        logs = logs.filter(**{lookup: timezone.make_aware(datetime.combine(day, time.min), tz)})
+
+    try:
+        rows, next_cursor = keyset_paginate(logs, '-timestamp', request.GET.get('cursor'), limit)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    results = [{
+        'id': log.id_log,
+        'object_type': log.object_type,
+        'object_type_display': log.get_object_type_display(),
+        'object_name': log.object_name,
+        'object_id': log.object_id,
+        'actividad': log.actividad.nombre if log.actividad else None,
+        'usuario': log.usuario.username,
+        'tipo_log': log.tipo_log,
+        'details': log.details or '',
+        'timestamp': formats.date_format(timezone.localtime(log.timestamp), 'M d, Y H:i'),
+    } for log in rows]
+    return JsonResponse({'success': True, 'results': results, 'next_cursor': next_cursor})
 
 @login_required
 @user_passes_test(is_coordinator_or_admin)
@@ -569,7 +360,7 @@ def reactivate_activity(request, pk):
     if request.method == 'POST':
         activity.activa = True
         activity.save()
-        LogActividad.objects.create(
+        registrar_log(
             actividad=activity,
             usuario=request.user,
             tipo_log=_('Reactivation')
@@ -587,7 +378,7 @@ def toggle_activity_approval(request, pk):
         activity.set_approval_manually(new_status, modified_by=request.user)
         
         log_type = 'Aprobación' if new_status else 'Desaprobación'
-        LogActividad.objects.create(
+        registrar_log(
             actividad=activity,
             usuario=request.user,
             tipo_log=log_type
@@ -625,28 +416,23 @@ def delete_calendar_view(request, pk):
 
 def ical_feed(request, token):
     calendar_view = get_object_or_404(VistaCalendario, token=token)
-    
-    cal = Calendar()
-    cal.add('prodid', '-//My Calendar App//mxm.dk//')
-    cal.add('version', '2.0')
-
-    activities = Actividad.objects.all()
+    feed = get_ical_feed(calendar_view)
+
+    # Conditional GET: los clientes que ya tienen esta versión reciben un 304
+    last_modified = feed['last_modified'].timestamp() if feed['last_modified'] else None
+    response = get_conditional_response(request, etag=feed['etag'], last_modified=last_modified)
+    if response is None:
+        if feed['body'] is None or request.GET.get('stream') == '1':
+            # Feeds grandes: VEVENTs escritos incrementalmente desde un cursor
+            activities = get_feed_activities(calendar_view)[0]
+            response = StreamingHttpResponse(stream_ical_feed(activities), content_type='text/calendar')
+        else:
+            response = HttpResponse(feed['body'], content_type='text/calendar')
+        response['Content-Disposition'] = 'attachment; filename="{}.ics"'.format(calendar_view.nombre)
 
-    if calendar_view.asignaturas.exists():
-        activities = activities.filter(asignaturas__in=calendar_view.asignaturas.all())
-    if calendar_view.tipos_actividad.exists():
-        activities = activities.filter(tipo_actividad__in=calendar_view.tipos_actividad.all())
-
-    for activity in activities.distinct():
-        event = Event()
-        event.add('summary', activity.nombre)
-        event.add('dtstart', activity.fecha_inicio)
-        event.add('dtend', activity.fecha_fin)
-        event.add('description', activity.descripcion)
-        cal.add_component(event)
-
-    response = HttpResponse(cal.to_ical(), content_type='text/calendar')
-    response['Content-Disposition'] = 'attachment; filename="{}.ics"'.format(calendar_view.nombre)
+    response['ETag'] = feed['etag']
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
     return response
 
 @login_required
@@ -673,7 +459,7 @@ def toggle_activity_approval_from_dashboard(request, pk):
 
         # Check if any of the activity's titulaciones are coordinated by the user
         can_approve = False
-        if request.user.role == 'ADMIN': # Admins can approve all
+        if request.user.es_admin(): # Admins can approve all
             can_approve = True
         else:
             for act_tit in activity_titulaciones:
@@ -687,7 +473,7 @@ def toggle_activity_approval_from_dashboard(request, pk):
         activity.set_approval_manually(new_status, modified_by=request.user)
 
         log_type = 'Aprobación desde Dashboard' if new_status else 'Desaprobación desde Dashboard'
-        LogActividad.objects.create(
+        registrar_log(
             actividad=activity,
             usuario=request.user,
             tipo_log=log_type
@@ -829,89 +615,10 @@ def all_activities(request):
     elif approval_status == 'unapproved':
         activities = activities.filter(aprobada=False)
 
-    print(f"Filtered activities count: {activities.distinct().count()}") # Debug print
-
-    from agenda_academica.models import AgendaSettings
-    from django.utils import timezone
-
-    # Load the closing date
-    try:
-        closing_date = AgendaSettings.load().closing_date
-    except Exception:
-        # Fallback if AgendaSettings is not configured or an error occurs
-        closing_date = timezone.now().date()
-
-    data = []
-    for activity in activities.distinct():
-        # Get groups for this activity (new system) or use legacy fields
-        grupos = activity.grupos.all().order_by('orden')
-        
-        if grupos.exists():
-            # New system: create an event for each group
-            for grupo in grupos:
-                event_class_names = []
-                if grupo.fecha_inicio.date() < closing_date:
-                    event_class_names.append('past-event')
-                else:
-                    event_class_names.append('future-event')
-
-                # Get assigned subject names
-                subject_names = ", ".join([s.nombre for s in activity.asignaturas.all()])
-
-                # Activity title with group name if multiple groups
-                title = activity.nombre
-                if grupos.count() > 1:
-                    title = f"{activity.nombre} - Grupo {grupo.nombre_grupo}"
-
-                data.append({
-                    'id': f"{activity.id}_grupo_{grupo.id}",  # Unique ID for each group
-                    'activity_id': activity.id,  # Keep original activity ID for editing
-                    'grupo_id': grupo.id,
-                    'title': title,
-                    'start': grupo.fecha_inicio.isoformat(),
-                    'end': grupo.fecha_fin.isoformat(),
-                    'classNames': event_class_names,
-                    'extendedProps': {
-                        'description': grupo.descripcion or activity.descripcion,
-                        'activity_type': activity.tipo_actividad.nombre,
-                        'subjects': subject_names,
-                        'is_approved': activity.aprobada,
-                        'is_active': activity.activa,
-                        'evaluable': activity.evaluable,
-                        'percentage': activity.porcentaje_evaluacion,
-                        'grupo_nombre': grupo.nombre_grupo,
-                        'is_multi_group': grupos.count() > 1
-                    }
-                })
-        else:
-            # Legacy system: use activity's direct fields
-            event_class_names = []
-            if activity.fecha_inicio.date() < closing_date:
-                event_class_names.append('past-event')
-            else:
-                event_class_names.append('future-event')
-
-            # Get assigned subject names
-            subject_names = ", ".join([s.nombre for s in activity.asignaturas.all()])
-
-            data.append({
-                'id': activity.id, # Add activity ID for eventClick
-                'activity_id': activity.id,
-                'title': activity.nombre,
-                'start': activity.fecha_inicio.isoformat(),
-                'end': activity.fecha_fin.isoformat(),
-                'classNames': event_class_names, # Add class for styling
-                'extendedProps': { # Add more details for eventClick
-                    'description': activity.descripcion,
-                    'activity_type': activity.tipo_actividad.nombre,
-                    'subjects': subject_names,
-                    'is_approved': activity.aprobada,
-                    'is_active': activity.activa,
-                    'evaluable': activity.evaluable,
-                    'percentage': activity.porcentaje_evaluacion,
-                    'is_multi_group': False
-                }
-            })
+    # Sólo el rango visible del calendario (start/end de FullCalendar)
+    data = build_calendar_events(
+        load_rows(activities.distinct(), get_date_window(request.GET)), get_closing_date()
+    )
     return JsonResponse(data, safe=False)
 
 class TipoActividadListView(ListView):
@@ -982,7 +689,7 @@ def ajax_create_tipo_actividad(request):
         tipo = TipoActividad.objects.create(nombre=nombre)
         
         # Log the creation
-        LogActividad.objects.create(
+        registrar_log(
             object_type='tipo_actividad',
             object_name=tipo.nombre,
             object_id=tipo.id,
@@ -1022,7 +729,7 @@ def ajax_update_tipo_actividad(request, pk):
         tipo.save()
         
         # Log the update
-        LogActividad.objects.create(
+        registrar_log(
             object_type='tipo_actividad',
             object_name=tipo.nombre,
             object_id=tipo.id,
@@ -1069,7 +776,7 @@ def ajax_delete_tipo_actividad(request, pk):
                     tipo.delete()
                     
                     # Log the deletion with reassignment
-                    LogActividad.objects.create(
+                    registrar_log(
                         object_type='tipo_actividad',
                         object_name=tipo_name,
                         object_id=pk,
@@ -1086,7 +793,7 @@ def ajax_delete_tipo_actividad(request, pk):
             tipo.delete()
             
             # Log the cascade deletion
-            LogActividad.objects.create(
+            registrar_log(
                 object_type='tipo_actividad',
                 object_name=tipo_name,
                 object_id=pk,
@@ -1101,7 +808,7 @@ def ajax_delete_tipo_actividad(request, pk):
             tipo.delete()
             
             # Log the simple deletion
-            LogActividad.objects.create(
+            registrar_log(
                 object_type='tipo_actividad',
                 object_name=tipo_name,
                 object_id=pk,
@@ -1158,7 +865,7 @@ def activity_version_history(request, pk):
         return HttpResponseRedirect(reverse_lazy(get_user_dashboard_url(request.user)))
     
     # Get all versions of this activity, ordered by version number (newest first)
-    versions = ActividadVersion.objects.filter(actividad_original=activity).order_by('-version_numero')
+    versions = versiones_de(activity)
     
     return render(request, 'schedule/activity_version_history.html', {
         'activity': activity,
@@ -1171,6 +878,8 @@ def activity_version_detail(request, pk, version_id):
     """Show details of a specific version"""
     activity = get_object_or_404(Actividad, pk=pk)
     version = get_object_or_404(ActividadVersion, pk=version_id, actividad_original=activity)
+    # Las versiones guardadas como diferencias se reconstruyen
+    cargar_version(version)
     
     # Same permission check as version history
     user_subjects = request.user.subjects.all()
@@ -1191,6 +900,8 @@ def activity_restore_version(request, pk, version_id):
     """Restore an activity to a previous version"""
     activity = get_object_or_404(Actividad, pk=pk)
     version = get_object_or_404(ActividadVersion, pk=version_id, actividad_original=activity)
+    # Las versiones guardadas como diferencias se reconstruyen
+    cargar_version(version)
     
     # Same permission check
     user_subjects = request.user.subjects.all()
@@ -1216,26 +927,24 @@ def activity_restore_version(request, pk, version_id):
         activity.aprobada = version.aprobada
         activity.activa = version.activa
         
+        # Restore tipo_actividad if available (en el mismo save: una sola versión)
+        if version.tipo_actividad_snapshot and version.tipo_actividad_snapshot.get('id'):
+            tipo_id = version.tipo_actividad_snapshot['id']
+            if TipoActividad.objects.filter(id=tipo_id).exists():
+                activity.tipo_actividad_id = tipo_id
+            # If the tipo_actividad no longer exists, keep current one
+        
+        asignatura_ids = [asig['id'] for asig in version.asignaturas_snapshot or []]
+        activity._asignaturas_modificadas = (
+            set(asignatura_ids) != set(activity.asignaturas.values_list('id', flat=True))
+        )
         activity.save()
         
         # Restore asignaturas relationships
-        activity.asignaturas.clear()
-        if version.asignaturas_snapshot:
-            asignatura_ids = [asig['id'] for asig in version.asignaturas_snapshot]
-            asignaturas = Asignatura.objects.filter(id__in=asignatura_ids)
-            activity.asignaturas.set(asignaturas)
-        
-        # Restore tipo_actividad if available
-        if version.tipo_actividad_snapshot and version.tipo_actividad_snapshot.get('id'):
-            try:
-                tipo_actividad = TipoActividad.objects.get(id=version.tipo_actividad_snapshot['id'])
-                activity.tipo_actividad = tipo_actividad
-                activity.save()
-            except TipoActividad.DoesNotExist:
-                pass  # If the tipo_actividad no longer exists, keep current one
+        activity.asignaturas.set(Asignatura.objects.filter(id__in=asignatura_ids))
         
         # Log the restoration
-        LogActividad.objects.create(
+        registrar_log(
             object_type='actividad',
             object_name=activity.nombre,
             object_id=activity.id,
@@ -1254,211 +963,102 @@ def activity_restore_version(request, pk, version_id):
 
 # ==================== PDF REPORTS VIEWS ====================
 
-@login_required
-@user_passes_test(is_coordinator_or_admin)
-def generate_agenda_report(request, titulacion_id=None):
-    """Generate PDF agenda report for coordinators (specific titulacion) or admins (all titulaciones)"""
-    
-    if not REPORTLAB_AVAILABLE:
-        return HttpResponse("PDF generation is not available. Please install reportlab.", status=500)
-    
-    # Check permissions and get data
-    if request.user.role == 'COORDINATOR':
-        # Coordinators can only generate reports for their coordinated titulaciones
+def _get_report_titulaciones(user, titulacion_id=None):
+    """Titulaciones que el usuario puede incluir en el informe, o HttpResponse de error"""
+    if user.es_admin():
+        if titulacion_id:
+            titulaciones = [get_object_or_404(Titulacion, pk=titulacion_id)]
+        else:
+            titulaciones = list(Titulacion.objects.all())
+    else:
+        # Coordinators (by role or profile) can only generate reports for their coordinated titulaciones
         if titulacion_id:
             titulacion = get_object_or_404(Titulacion, pk=titulacion_id)
-            user_coordinated_titulaciones = Titulacion.objects.filter(coordinador=request.user)
+            user_coordinated_titulaciones = Titulacion.objects.filter(coordinador=user)
             if titulacion not in user_coordinated_titulaciones:
                 return HttpResponse("You don't have permission to generate reports for this titulacion.", status=403)
             titulaciones = [titulacion]
         else:
             # If no specific titulacion, get all coordinated titulaciones
-            titulaciones = Titulacion.objects.filter(coordinador=request.user)
-    else:  # ADMIN
-        if titulacion_id:
-            titulaciones = [get_object_or_404(Titulacion, pk=titulacion_id)]
-        else:
-            titulaciones = Titulacion.objects.all()
-    
+            titulaciones = list(Titulacion.objects.filter(coordinador=user))
+
     if not titulaciones:
         return HttpResponse("No titulaciones found for report generation.", status=404)
-    
-    # Create response
-    response = HttpResponse(content_type='application/pdf')
-    if len(titulaciones) == 1:
-        filename = f"Agenda_{titulaciones[0].nombre.replace(' ', '_')}.pdf"
-    else:
-        filename = "Agenda_General_Centro.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    # Create PDF document
-    doc = SimpleDocTemplate(response, pagesize=A4)
-    elements = []
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        textColor=colors.HexColor('#2c3e50'),
-        alignment=1  # Center
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceBefore=20,
-        spaceAfter=12,
-        textColor=colors.HexColor('#34495e')
-    )
-    
-    course_style = ParagraphStyle(
-        'CourseHeading',
-        parent=styles['Heading3'],
-        fontSize=12,
-        spaceBefore=15,
-        spaceAfter=8,
-        textColor=colors.HexColor('#7f8c8d')
-    )
-    
-    for titulacion_idx, titulacion in enumerate(titulaciones):
-        # Add title
-        if len(titulaciones) == 1:
-            title = f"Agenda de {titulacion.nombre}"
-        else:
-            title = f"Agenda General del Centro"
-            if titulacion_idx == 0:
-                elements.append(Paragraph(title, title_style))
-                elements.append(Spacer(1, 20))
-        
-        if len(titulaciones) > 1:
-            elements.append(Paragraph(f"Titulación: {titulacion.nombre}", heading_style))
-        elif titulacion_idx == 0:
-            elements.append(Paragraph(title, title_style))
-            elements.append(Spacer(1, 20))
-        
-        # Get activities for this titulacion (only active ones)
-        activities = Actividad.objects.filter(
-            asignaturas__titulacion=titulacion,
-            activa=True
-        ).select_related('tipo_actividad').prefetch_related('asignaturas').distinct().order_by('fecha_inicio')
-        
-        if not activities.exists():
-            elements.append(Paragraph("No hay actividades activas para esta titulación.", styles['Normal']))
-            continue
-        
-        # Group activities by course
-        courses_data = {}
-        for activity in activities:
-            for asignatura in activity.asignaturas.filter(titulacion=titulacion):
-                course = asignatura.curso
-                course_name = "Optativa" if course == 10 else "TFE" if course == 1000 else str(course)
-                
-                if course not in courses_data:
-                    courses_data[course] = {
-                        'name': course_name,
-                        'activities': []
-                    }
-                
-                # Avoid duplicates
-                if activity not in courses_data[course]['activities']:
-                    courses_data[course]['activities'].append(activity)
-        
-        # Sort courses
-        sorted_courses = sorted(courses_data.items(), key=lambda x: x[0] if x[0] not in [10, 1000] else (999 if x[0] == 10 else 1001))
-        
-        for course_num, course_data in sorted_courses:
-            elements.append(Paragraph(f"Curso {course_data['name']}", course_style))
-            
-            # Create table data with proper text wrapping
-            table_data = [['Actividad', 'Asignatura', 'Tipo', 'Inicio', 'Fin', 'Evaluable']]
-            
-            # Create paragraph style for table content
-            cell_style = ParagraphStyle(
-                'TableCell',
-                parent=styles['Normal'],
-                fontSize=8,
-                leading=10,
-                alignment=0,  # Left alignment
-                spaceAfter=0
-            )
-            
-            for activity in sorted(course_data['activities'], key=lambda x: x.fecha_inicio):
-                # Get subject names for this course
-                subject_names = ", ".join([
-                    asig.nombre for asig in activity.asignaturas.filter(titulacion=titulacion, curso=course_num)
-                ])
-                
-                evaluable = "Sí" if activity.evaluable else "No"
-                if activity.evaluable and activity.porcentaje_evaluacion:
-                    evaluable += f" ({activity.porcentaje_evaluacion}%)"
-                
-                # Create paragraphs for text content to handle wrapping
-                table_data.append([
-                    Paragraph(activity.nombre, cell_style),
-                    Paragraph(subject_names, cell_style),
-                    Paragraph(activity.tipo_actividad.nombre, cell_style),
-                    Paragraph(activity.fecha_inicio.strftime('%d/%m/%Y<br/>%H:%M'), cell_style),
-                    Paragraph(activity.fecha_fin.strftime('%d/%m/%Y<br/>%H:%M'), cell_style),
-                    Paragraph(evaluable, cell_style)
-                ])
-            
-            # Create table with adjusted column widths
-            table = Table(table_data, colWidths=[2.2*inch, 1.8*inch, 1.2*inch, 0.9*inch, 0.9*inch, 0.8*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),  # Header centered
-                ('ALIGN', (0, 1), (-1, -1), 'LEFT'),   # Content left-aligned
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('TOPPADDING', (0, 0), (-1, 0), 8),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                ('TOPPADDING', (0, 1), (-1, -1), 6),
-                ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-                ('LEFTPADDING', (0, 1), (-1, -1), 6),
-                ('RIGHTPADDING', (0, 1), (-1, -1), 6),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),  # Top alignment for better readability
-            ]))
-            
-            elements.append(table)
-            elements.append(Spacer(1, 20))
-        
-        # Add page break between titulaciones if multiple
-        if len(titulaciones) > 1 and titulacion_idx < len(titulaciones) - 1:
-            elements.append(PageBreak())
-    
-    # Add footer with generation info
-    elements.append(Spacer(1, 30))
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.grey,
-        alignment=1
-    )
-    elements.append(Paragraph(f"Generado el {datetime.now().strftime('%d/%m/%Y %H:%M')} por {request.user.username}", footer_style))
-    
-    # Build PDF
-    doc.build(elements)
-    
+    return titulaciones
+
+def _agenda_report_file_response(key, filename):
+    return FileResponse(open(get_report_path(key), 'rb'), as_attachment=True,
+                        filename=filename, content_type='application/pdf')
+
+@login_required
+@user_passes_test(is_coordinator_or_admin)
+def generate_agenda_report(request, titulacion_id=None):
+    """
+    Generate PDF agenda report for coordinators (specific titulacion) or admins (all titulaciones).
+
+    The PDF is rendered in a background worker and cached on disk per data version:
+    if it is already available it is served directly, otherwise a waiting page polls
+    agenda_report_status until it can be downloaded.
+    """
+    if not REPORTLAB_AVAILABLE:
+        return HttpResponse("PDF generation is not available. Please install reportlab.", status=500)
+
+    titulaciones = _get_report_titulaciones(request.user, titulacion_id)
+    if isinstance(titulaciones, HttpResponse):
+        return titulaciones
+
+    filename = agenda_report_filename(titulaciones)
+    key = agenda_report_key(titulaciones)
+    status = agenda_report_status(key)
+
     # Log the action
-    LogActividad.objects.create(
+    registrar_log(
         object_type='actividad',
         object_name=f"PDF Report: {filename}",
         usuario=request.user,
         tipo_log=_('Report Generation'),
-        details=f'PDF agenda report generated for {len(titulaciones)} titulacion(s)'
+        details=f'PDF agenda report requested for {len(titulaciones)} titulacion(s) ({status})'
     )
-    
-    return response
+
+    if status == STATUS_READY:
+        return _agenda_report_file_response(key, filename)
+
+    if status != STATUS_PENDING:
+        enqueue_agenda_report(key, titulaciones)
+
+    return render(request, 'schedule/agenda_report_pending.html', {
+        'filename': filename,
+        'status_url': reverse('agenda_report_status', args=[key]),
+        'download_url': reverse('agenda_report_download', args=[key]),
+    })
+
+def _check_report_access(user, key):
+    """Devuelve los metadatos del informe si el usuario puede descargarlo"""
+    meta = get_report_meta(key)
+    if meta is None:
+        return None
+    if not user.es_admin():
+        coordinated_ids = set(Titulacion.objects.filter(coordinador=user).values_list('id', flat=True))
+        if not set(meta['titulacion_ids']) <= coordinated_ids:
+            return None
+    return meta
+
+@login_required
+@user_passes_test(is_coordinator_or_admin)
+def agenda_report_status_view(request, key):
+    """Estado de generación de un informe PDF (JSON)"""
+    if _check_report_access(request.user, key) is None:
+        return JsonResponse({'status': STATUS_MISSING}, status=404)
+    return JsonResponse({'status': agenda_report_status(key)})
+
+@login_required
+@user_passes_test(is_coordinator_or_admin)
+def agenda_report_download(request, key):
+    """Descarga un informe PDF ya generado"""
+    meta = _check_report_access(request.user, key)
+    if meta is None or get_report_path(key) is None:
+        return HttpResponse("Report not found.", status=404)
+    return _agenda_report_file_response(key, meta['filename'])
 
 @login_required
 @user_passes_test(is_coordinator_or_admin)
@@ -1468,10 +1068,10 @@ def create_automatic_icals(request):
     existing_feeds = []
     
     # Get titulaciones based on user role
-    if request.user.role == 'COORDINATOR':
-        titulaciones = Titulacion.objects.filter(coordinador=request.user)
-    else:  # ADMIN
+    if request.user.es_admin():
         titulaciones = Titulacion.objects.all()
+    else:
+        titulaciones = Titulacion.objects.filter(coordinador=request.user)
     
     for titulacion in titulaciones:
         # 1. Create iCal for the entire titulacion
@@ -1528,7 +1128,7 @@ def create_automatic_icals(request):
                 existing_feeds.append(course_name)
     
     # Log the action
-    LogActividad.objects.create(
+    registrar_log(
         object_type='actividad',
         object_name="Automatic iCal Creation",
         usuario=request.user,
@@ -1585,7 +1185,7 @@ def delete_all_icals(request):
     feeds.delete()
     
     # Log the action
-    LogActividad.objects.create(
+    registrar_log(
         object_type='actividad',
         object_name="Delete All iCals",
         usuario=request.user,
@@ -1637,7 +1237,7 @@ def check_and_edit_activity(request, pk):
                 new_activity.asignaturas.set(activity.asignaturas.all())
 
                 # 5. Create a log entry for the copy action
-                LogActividad.objects.create(
+                registrar_log(
                     object_type='actividad',
                     object_name=new_activity.nombre,
                     object_id=new_activity.id,
@@ -1685,9 +1285,12 @@ def multi_group_activity_form(request, grupo_id=None):
             try:
                 with transaction.atomic():
                     if grupo_id:
-                        existing_activities.update(activa=False)
-                        for activity in existing_activities:
-                            LogActividad.objects.create(
+                        anteriores = list(existing_activities)
+                        desactivadas = existing_activities.update(activa=False)
+                        # update() no pasa por post_save: el contador de activas se ajusta aquí
+                        EstadisticasKPI.ajustar(active_activities=-desactivadas)
+                        for activity in anteriores:
+                            registrar_log(
                                 object_type='actividad',
                                 object_name=activity.nombre,
                                 object_id=activity.id,
@@ -1697,18 +1300,17 @@ def multi_group_activity_form(request, grupo_id=None):
                                 details=_('Multi-group activity updated - old version deactivated')
                             )
                     
-                    actividades_creadas = form.save(user=request.user)
-                    
-                    for activity in actividades_creadas:
-                        LogActividad.objects.create(
-                            object_type='actividad',
-                            object_name=activity.nombre,
-                            object_id=activity.id,
-                            actividad=activity,
-                            usuario=request.user,
-                            tipo_log=_('Creation') if not grupo_id else _('Modification'),
-                            details=_('Multi-group activity created/updated')
-                        )
+                    # El formulario crea una sola actividad con sus grupos
+                    actividad_creada = form.save(user=request.user)
+                    registrar_log(
+                        object_type='actividad',
+                        object_name=actividad_creada.nombre,
+                        object_id=actividad_creada.id,
+                        actividad=actividad_creada,
+                        usuario=request.user,
+                        tipo_log=_('Creation') if not grupo_id else _('Modification'),
+                        details=_('Multi-group activity created/updated')
+                    )
                     
                     return redirect(get_user_dashboard_url(request.user))
             except Exception as e:
@@ -1763,7 +1365,7 @@ def copy_activity_individual(request, activity_id):
                     activity = form.save(user=request.user)
                     
                     # Log the activity creation
-                    LogActividad.objects.create(
+                    registrar_log(
                         object_type='actividad',
                         object_name=activity.nombre,
                         object_id=activity.id,
@@ -1838,7 +1440,7 @@ def copy_activity_multi_group(request, activity_id):
                     activity = form.save(user=request.user)
                     
                     # Log the activity creation
-                    LogActividad.objects.create(
+                    registrar_log(
                         object_type='actividad',
                         object_name=activity.nombre,
                         object_id=activity.id,
@@ -1983,7 +1585,7 @@ def unified_activity_form(request, pk=None):
                             )
                         
                         # Log de modificación
-                        LogActividad.objects.create(
+                        registrar_log(
                             object_type='actividad',
                             object_name=activity.nombre,
                             object_id=activity.id,
@@ -1997,7 +1599,7 @@ def unified_activity_form(request, pk=None):
                         activity = form.save(user=request.user)
                         
                         # Log de creación
-                        LogActividad.objects.create(
+                        registrar_log(
                             object_type='actividad',
                             object_name=activity.nombre,
                             object_id=activity.id,
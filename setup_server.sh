@@ -36,6 +36,7 @@ fi
 # 5. Aplicar migraciones
 echo "→ Aplicando migraciones..."
 python manage.py migrate
+python manage.py createcachetable
 
 # 6. Verificar permisos
 echo "→ Configurando permisos..."
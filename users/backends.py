@@ -2,12 +2,21 @@ from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 from django.contrib import messages
 from django.contrib.auth.forms import AuthenticationForm
+from django.core.exceptions import PermissionDenied
+from .signals import get_client_ip
+from .throttling import is_throttled, register_failure, reset_username
 
 UserModel = get_user_model()
 
 class EmailVerificationBackend(ModelBackend):
     """
     Custom authentication backend that checks if user's email is verified (is_active)
+
+    Cada intento cuesta exactamente un hash: check_password si el usuario
+    existe o set_password sobre un usuario vacío si no (protección frente a
+    ataques de tiempo), y ninguno si está limitado por users.throttling.
+    Para que se cumpla no debe haber otro backend de contraseña detrás
+    (ver AUTH_CONSOLIDATED_BACKEND en settings).
     """
     
     def authenticate(self, request, username=None, password=None, **kwargs):
@@ -16,10 +25,27 @@ class EmailVerificationBackend(ModelBackend):
         
         if username is None or password is None:
             return None
+
+        # Demasiados fallos recientes: se rechaza antes de calcular ningún hash.
+        # PermissionDenied detiene también el resto de backends.
+        ip_address = get_client_ip(request) if request is not None else None
+        if is_throttled(username, ip_address):
+            if request:
+                messages.error(
+                    request,
+                    'Demasiados intentos de inicio de sesión fallidos. Inténtalo de nuevo en unos minutos.',
+                    fail_silently=True
+                )
+            raise PermissionDenied('Too many failed login attempts')
             
         try:
             # Try to get user by username (case insensitive)
-            user = UserModel.objects.get(username__iexact=username)
+            try:
+                user = UserModel.objects.get(username__iexact=username)
+            except UserModel.MultipleObjectsReturned:
+                # Nombres que sólo difieren en mayúsculas: vale la coincidencia exacta
+                # (lo que hacía ModelBackend cuando estaba detrás en la lista)
+                user = UserModel._default_manager.get_by_natural_key(username)
             
             # Check if password is correct
             if user.check_password(password):
@@ -35,14 +61,17 @@ class EmailVerificationBackend(ModelBackend):
                     return None
                 
                 # Everything is OK - return user for successful login
+                reset_username(username)
                 return user
             else:
                 # Password is incorrect - let Django handle the default error message
+                register_failure(username, ip_address)
                 return None
             
         except UserModel.DoesNotExist:
             # User doesn't exist - run password hasher to prevent timing attacks
             UserModel().set_password(password)
+            register_failure(username, ip_address)
             return None
     
     def get_user(self, user_id):
@@ -1,7 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, PasswordResetForm
-from .models import CustomUser
-from academics.models import Asignatura
+from .models import CustomUser, TipoPerfil
+from academics.models import Asignatura, Titulacion
 from django.contrib.auth import get_user_model
 
 class CustomUserCreationForm(UserCreationForm):
@@ -33,6 +33,37 @@ class NotificationForm(forms.Form):
     subject = forms.CharField(max_length=100)
     message = forms.CharField(widget=forms.Textarea)
 
+    # Destinatarios: sin selección se envía a todos los usuarios activos.
+    # Dentro de un criterio basta con cumplir una opción; entre criterios, todos.
+    titulaciones = forms.ModelMultipleChoiceField(
+        queryset=Titulacion.objects.order_by('nombre'),
+        required=False,
+        help_text='Usuarios con alguna asignatura de estas titulaciones'
+    )
+    cursos = forms.TypedMultipleChoiceField(
+        coerce=int,
+        required=False,
+        help_text='Usuarios con alguna asignatura de estos cursos'
+    )
+    asignaturas = forms.ModelMultipleChoiceField(
+        queryset=Asignatura.objects.order_by('nombre'),
+        required=False,
+        help_text='Usuarios matriculados o asignados a estas asignaturas'
+    )
+    tipos_perfil = forms.ModelMultipleChoiceField(
+        queryset=TipoPerfil.objects.filter(activo=True),
+        required=False,
+        help_text='Usuarios con alguno de estos perfiles'
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        cursos = Asignatura.objects.order_by('curso').values_list('curso', flat=True).distinct()
+        self.fields['cursos'].choices = [
+            (curso, 'Optativa' if curso == 10 else 'TFE' if curso == 1000 else str(curso))
+            for curso in cursos
+        ]
+
 class StudentSubjectForm(forms.ModelForm):
     subjects = forms.ModelMultipleChoiceField(
         queryset=Asignatura.objects.all(),
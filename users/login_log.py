@@ -0,0 +1,104 @@
+"""
+Registro de intentos de inicio de sesión en memoria con volcado por lotes.
+
+Las señales de login sólo añaden el intento a un búfer del proceso; se
+escribe con un único bulk_create cuando se llena (LOGIN_ATTEMPTS_BUFFER_SIZE)
+o, como mucho, LOGIN_ATTEMPTS_FLUSH_INTERVAL segundos después del primer
+intento pendiente. El volcado se hace en un hilo aparte, de modo que la
+petición de login no espera a la base de datos. Si el proceso termina de
+forma abrupta se pierden como máximo los intentos del búfer; al salir de
+forma ordenada se vuelcan (atexit).
+
+Con LOGIN_ATTEMPTS_BUFFER_SIZE = 0 cada intento se escribe al momento; así
+se ejecutan los tests (agenda_academica.test_runner). Los ajustes se leen en
+cada intento para que override_settings tenga efecto.
+"""
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import LoginAttempt
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_buffer = []
+_timer = None
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='login-attempts')
+    return _executor
+
+
+def record_login_attempt(username, ip_address, success):
+    """Añade un intento al búfer (la hora es la del intento, no la del volcado)"""
+    global _timer
+    attempt = LoginAttempt(username=username, ip_address=ip_address, success=success, timestamp=timezone.now())
+    buffer_size = getattr(settings, 'LOGIN_ATTEMPTS_BUFFER_SIZE', 50)
+    if not buffer_size:
+        LoginAttempt.objects.bulk_create([attempt])
+        return
+
+    with _lock:
+        _buffer.append(attempt)
+        full = len(_buffer) >= buffer_size
+        if not full and _timer is None:
+            _timer = threading.Timer(getattr(settings, 'LOGIN_ATTEMPTS_FLUSH_INTERVAL', 5), _schedule_flush)
+            _timer.daemon = True
+            _timer.start()
+    if full:
+        _schedule_flush()
+
+
+def pending_login_attempts():
+    """Copia de los intentos aún no volcados a la base de datos"""
+    with _lock:
+        return list(_buffer)
+
+
+def _schedule_flush():
+    _get_executor().submit(_run_flush_job)
+
+
+def _run_flush_job():
+    close_old_connections()
+    try:
+        flush_login_attempts()
+    finally:
+        close_old_connections()
+
+
+def flush_login_attempts():
+    """Escribe los intentos pendientes con un único bulk_create y devuelve cuántos"""
+    global _timer
+    with _lock:
+        attempts = _buffer[:]
+        _buffer.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not attempts:
+        return 0
+    try:
+        LoginAttempt.objects.bulk_create(attempts, batch_size=500)
+    except Exception as e:
+        logger.error(f"Error saving {len(attempts)} login attempts: {e}")
+        return 0
+    return len(attempts)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        flush_login_attempts()
+    except Exception:
+        pass
@@ -0,0 +1,94 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from users import throttling
+from users.login_log import flush_login_attempts
+from users.models import CustomUser
+
+
+class _Rollback(Exception):
+    pass
+
+
+BACKENDS = {
+    'consolidado': ['users.backends.EmailVerificationBackend'],
+    'legacy': ['users.backends.EmailVerificationBackend', 'django.contrib.auth.backends.ModelBackend'],
+}
+
+PASSWORD = 'benchmark-password'
+
+
+class Command(BaseCommand):
+    help = ('Mide los logins por segundo de un worker y los hashes de contraseña por intento, '
+            'con el backend consolidado y con la lista anterior (EmailVerificationBackend + ModelBackend). '
+            'Los datos de prueba se descartan al terminar')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--attempts',
+            type=int,
+            default=20,
+            help='Intentos por escenario',
+        )
+
+    def handle(self, *args, **options):
+        attempts = options['attempts']
+        if attempts < 1:
+            raise CommandError('--attempts debe ser mayor que 0')
+
+        scenarios = [
+            ('correcto', 'benchmark_activo', PASSWORD),
+            ('contraseña errónea', 'benchmark_activo', 'incorrecta'),
+            ('usuario inexistente', 'benchmark_inexistente', PASSWORD),
+            ('cuenta no activada', 'benchmark_inactivo', PASSWORD),
+        ]
+        hasher = get_hasher()
+        self.stdout.write(f'Hasher: {hasher.algorithm}, {attempts} intentos por escenario')
+
+        results = []
+        try:
+            with transaction.atomic():
+                CustomUser.objects.create_user(username='benchmark_activo', password=PASSWORD)
+                CustomUser.objects.create_user(username='benchmark_inactivo', password=PASSWORD, is_active=False)
+                # Sin límite de fallos: se mide el coste del hash, no el rechazo
+                with mock.patch.object(throttling, 'LOGIN_THROTTLE_MAX_FAILURES_USERNAME', 0), \
+                        mock.patch.object(throttling, 'LOGIN_THROTTLE_MAX_FAILURES_IP', 0):
+                    for mode, backends in BACKENDS.items():
+                        with override_settings(AUTHENTICATION_BACKENDS=backends):
+                            for name, username, password in scenarios:
+                                results.append((mode, name, *self._measure(hasher, username, password, attempts)))
+                # Los intentos registrados por las señales se descartan con el resto
+                flush_login_attempts()
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{'Modo':<12} {'Escenario':<22} {'Hashes/intento':>15} {'Logins/s':>10}")
+        for mode, name, hashes, per_second in results:
+            self.stdout.write(f'{mode:<12} {name:<22} {hashes:>15.2f} {per_second:>10.1f}')
+
+        consolidated = [hashes for mode, _, hashes, _ in results if mode == 'consolidado']
+        if all(hashes == 1 for hashes in consolidated):
+            self.stdout.write(self.style.SUCCESS('Backend consolidado: un hash por intento en todos los escenarios'))
+        else:
+            self.stdout.write(self.style.WARNING(f'Backend consolidado: hashes por intento {consolidated}'))
+
+    def _measure(self, hasher, username, password, attempts):
+        # encode() es la operación costosa tanto al comprobar como al crear un hash
+        request = RequestFactory().post('/login/')
+        # El aviso de cuenta no activada necesita almacén de mensajes
+        request._messages = CookieStorage(request)
+        with mock.patch.object(type(hasher), 'encode', autospec=True, side_effect=type(hasher).encode) as encode:
+            started = time.perf_counter()
+            for _ in range(attempts):
+                authenticate(request, username=username, password=password)
+            elapsed = time.perf_counter() - started
+        return encode.call_count / attempts, attempts / elapsed
@@ -0,0 +1,91 @@
+"""
+Command para resumir por día los intentos de login antiguos y borrar el detalle
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from schedule.archive import escribir_lote, filas_archivables
+from users.models import LoginAttempt, LoginAttemptDaily
+
+
+class Command(BaseCommand):
+    help = ('Agrega en LoginAttemptDaily (fecha, usuario, IP) los intentos de login de más de '
+            'N días y elimina las filas individuales')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=getattr(settings, 'LOGIN_ATTEMPTS_RETENTION_DAYS', 30),
+            help='Días de detalle que se conservan (por defecto LOGIN_ATTEMPTS_RETENTION_DAYS)',
+        )
+        parser.add_argument(
+            '--archivar',
+            action='store_true',
+            help='Guarda antes el detalle de cada día en el archivo de logs (LOG_ARCHIVE_DIR/login)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Muestra los días que se compactarían sin hacer cambios',
+        )
+
+    def handle(self, *args, **options):
+        tz = timezone.get_current_timezone()
+        hoy = timezone.localdate()
+        limite = timezone.make_aware(datetime.combine(hoy - timedelta(days=options['dias']), time.min), tz)
+
+        primero = LoginAttempt.objects.filter(timestamp__lt=limite).order_by('timestamp').first()
+        if primero is None:
+            self.stdout.write('No hay intentos que compactar')
+            return
+
+        # Un día por transacción: lotes acotados y se puede interrumpir y relanzar
+        dia = timezone.localtime(primero.timestamp, tz).date()
+        total_dias = total_filas = 0
+        while True:
+            inicio = timezone.make_aware(datetime.combine(dia, time.min), tz)
+            fin = min(timezone.make_aware(datetime.combine(dia + timedelta(days=1), time.min), tz), limite)
+            if inicio >= limite:
+                break
+            filas = self._compactar_dia(dia, inicio, fin, options['dry_run'], options['archivar'])
+            if filas:
+                total_dias += 1
+                total_filas += filas
+                self.stdout.write(f'{dia}: {filas} intentos')
+            dia += timedelta(days=1)
+
+        accion = 'se compactarían' if options['dry_run'] else 'compactados'
+        self.stdout.write(self.style.SUCCESS(f'{total_filas} intentos de {total_dias} días {accion}'))
+
+    def _compactar_dia(self, dia, inicio, fin, dry_run, archivar=False):
+        intentos = LoginAttempt.objects.filter(timestamp__gte=inicio, timestamp__lt=fin)
+        if dry_run:
+            return intentos.count()
+
+        with transaction.atomic():
+            resumen = intentos.values('username', 'ip_address').annotate(
+                exitos=Count('id', filter=Q(success=True)),
+                fallos=Count('id', filter=Q(success=False)),
+            )
+            filas = 0
+            for fila in resumen:
+                filas += fila['exitos'] + fila['fallos']
+                diario, created = LoginAttemptDaily.objects.select_for_update().get_or_create(
+                    fecha=dia, username=fila['username'], ip_address=fila['ip_address'],
+                    defaults={'exitos': fila['exitos'], 'fallos': fila['fallos']},
+                )
+                if not created:
+                    diario.exitos += fila['exitos']
+                    diario.fallos += fila['fallos']
+                    diario.save(update_fields=['exitos', 'fallos'])
+            if filas:
+                if archivar:
+                    # Si la transacción se revierte, el fichero del día se reescribe al relanzar
+                    escribir_lote('login', list(filas_archivables('login', intentos)))
+                intentos.delete()
+        return filas
@@ -0,0 +1,43 @@
+"""
+Command para procesar las notificaciones masivas encoladas
+"""
+from django.core.management.base import BaseCommand
+from users.models import EnvioNotificacion
+from users.notifications import procesar_envio
+
+
+class Command(BaseCommand):
+    help = ('Envía las notificaciones masivas pendientes (por ejemplo, las que quedaron '
+            'a medias al reiniciarse el servidor)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reanudar',
+            action='store_true',
+            help="Retoma también los envíos en estado 'enviando' (interrumpidos)",
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=None,
+            help='Mensajes por segundo (por defecto NOTIFICATIONS_RATE_LIMIT; 0 = sin límite)',
+        )
+
+    def handle(self, *args, **options):
+        estados = [EnvioNotificacion.ESTADO_PENDIENTE]
+        if options['reanudar']:
+            estados.append(EnvioNotificacion.ESTADO_ENVIANDO)
+
+        envio_ids = list(EnvioNotificacion.objects.filter(estado__in=estados).order_by('fecha_creacion').values_list('id', flat=True))
+        if not envio_ids:
+            self.stdout.write('No hay notificaciones pendientes')
+            return
+
+        for envio_id in envio_ids:
+            if not procesar_envio(envio_id, reanudar=options['reanudar'], rate_limit=options['rate']):
+                self.stdout.write(self.style.WARNING(f'Envío {envio_id}: lo está procesando otro worker'))
+                continue
+            resumen = EnvioNotificacion.objects.get(pk=envio_id).resumen()
+            self.stdout.write(self.style.SUCCESS(
+                f"Envío {envio_id}: {resumen['enviado']} enviados, {resumen['fallido']} fallidos"
+            ))
@@ -0,0 +1,41 @@
+"""
+Command para reconciliar los contadores precalculados de EstadisticasKPI
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users.models import EstadisticasKPI
+
+
+class Command(BaseCommand):
+    help = ('Recalcula los contadores de los paneles de administración (EstadisticasKPI) '
+            'y muestra las desviaciones respecto a los valores mantenidos por señales')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Muestra las desviaciones sin corregirlas',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            actual = EstadisticasKPI.objects.select_for_update().filter(pk=1).first()
+            reales = EstadisticasKPI.contar()
+
+            desviaciones = {
+                campo: (getattr(actual, campo) if actual else None, valor)
+                for campo, valor in reales.items()
+                if actual is None or getattr(actual, campo) != valor
+            }
+            for campo, (antes, despues) in desviaciones.items():
+                self.stdout.write(f'{campo}: {antes} -> {despues}')
+
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING(f'{len(desviaciones)} contadores desviados (sin cambios)'))
+                return
+            EstadisticasKPI.objects.update_or_create(pk=1, defaults=reales)
+
+        if desviaciones:
+            self.stdout.write(self.style.SUCCESS(f'{len(desviaciones)} contadores corregidos'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Contadores al día'))
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+def calcular_estadisticas(apps, schema_editor):
+    """Fila inicial con los valores actuales"""
+    EstadisticasKPI = apps.get_model('users', 'EstadisticasKPI')
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Actividad = apps.get_model('schedule', 'Actividad')
+    Titulacion = apps.get_model('academics', 'Titulacion')
+    Asignatura = apps.get_model('academics', 'Asignatura')
+    EstadisticasKPI.objects.update_or_create(pk=1, defaults={
+        'total_users': CustomUser.objects.count(),
+        'total_teachers': CustomUser.objects.filter(role='TEACHER').count(),
+        'total_students': CustomUser.objects.filter(role='STUDENT').count(),
+        'total_activities': Actividad.objects.count(),
+        'active_activities': Actividad.objects.filter(activa=True).count(),
+        'total_titulaciones': Titulacion.objects.count(),
+        'total_asignaturas': Asignatura.objects.count(),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0003_asignatura_asignatura_tit_curso_sem_idx_and_more'),
+        ('schedule', '0014_activity_filter_indexes'),
+        ('users', '0007_populate_initial_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticasKPI',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_users', models.IntegerField(default=0)),
+                ('total_teachers', models.IntegerField(default=0)),
+                ('total_students', models.IntegerField(default=0)),
+                ('total_activities', models.IntegerField(default=0)),
+                ('active_activities', models.IntegerField(default=0)),
+                ('total_titulaciones', models.IntegerField(default=0)),
+                ('total_asignaturas', models.IntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Estadísticas KPI',
+                'verbose_name_plural': 'Estadísticas KPI',
+            },
+        ),
+        migrations.RunPython(calcular_estadisticas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_envionotificacion_destinatarionotificacion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loginattempt',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='loginattempt',
+            index=models.Index(fields=['timestamp'], name='loginattempt_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginattempt',
+            index=models.Index(fields=['username', 'ip_address'], name='loginattempt_user_ip_idx'),
+        ),
+        migrations.CreateModel(
+            name='LoginAttemptDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('username', models.CharField(max_length=150)),
+                ('ip_address', models.GenericIPAddressField()),
+                ('exitos', models.PositiveIntegerField(default=0)),
+                ('fallos', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Resumen diario de accesos',
+                'verbose_name_plural': 'Resúmenes diarios de accesos',
+                'unique_together': {('fecha', 'username', 'ip_address')},
+            },
+        ),
+    ]
@@ -1,5 +1,9 @@
 from django.contrib.auth.models import AbstractUser
+from django.apps import apps
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
+from django.utils.functional import cached_property
 from academics.models import Asignatura, Titulacion
 
 
@@ -77,9 +81,27 @@ class CustomUser(AbstractUser):
     tipos_perfil = models.ManyToManyField(TipoPerfil, through=AsignacionPerfil, 
                                          through_fields=('usuario', 'tipo_perfil'), blank=True)
     
+    @cached_property
+    def codigos_perfil(self):
+        """
+        Códigos de los perfiles activos del usuario (nuevo sistema).
+
+        Se resuelven con una única consulta y quedan cacheados en la instancia:
+        como request.user se carga una vez por petición, todas las
+        comprobaciones de perfil de una petición comparten el mismo conjunto.
+        Las señales de AsignacionPerfil lo invalidan con `invalidar_perfiles`.
+        """
+        return frozenset(AsignacionPerfil.objects.filter(
+            usuario=self, activa=True, tipo_perfil__activo=True
+        ).values_list('tipo_perfil__codigo', flat=True))
+
+    def invalidar_perfiles(self):
+        """Descarta los códigos de perfil cacheados en la instancia"""
+        self.__dict__.pop('codigos_perfil', None)
+
     def tiene_perfil(self, codigo_perfil):
         """Verifica si el usuario tiene un perfil específico (nuevo sistema)"""
-        return self.tipos_perfil.filter(codigo=codigo_perfil, activo=True).exists()
+        return codigo_perfil in self.codigos_perfil
     
     def perfiles_activos(self):
         """Retorna todos los perfiles activos del usuario"""
@@ -102,6 +124,7 @@ class CustomUser(AbstractUser):
                 asignacion.activa = True
                 asignacion.fecha_desactivacion = None
                 asignacion.save()
+            self.invalidar_perfiles()
             return asignacion
         except TipoPerfil.DoesNotExist:
             return None
@@ -118,33 +141,32 @@ class CustomUser(AbstractUser):
             asignacion.activa = False
             asignacion.fecha_desactivacion = timezone.now()
             asignacion.save()
+            self.invalidar_perfiles()
             return True
         except AsignacionPerfil.DoesNotExist:
             return False
     
     # MÉTODOS DE COMPATIBILIDAD - Funcionan con ambos sistemas
+    # Se comprueba primero el rol legacy para no consultar los perfiles si no hace falta
     def es_estudiante(self):
         """Compatible con sistema legacy y nuevo"""
-        return (self.tiene_perfil('STUDENT') or self.role == 'STUDENT')
+        return (self.role == 'STUDENT' or self.tiene_perfil('STUDENT'))
     
     def es_profesor(self):
         """Compatible con sistema legacy y nuevo"""
-        return (self.tiene_perfil('TEACHER') or 
-                self.tiene_perfil('COORDINATOR') or 
-                self.tiene_perfil('ADMIN') or
-                self.role in ['TEACHER', 'COORDINATOR', 'ADMIN'])
+        return (self.role in ['TEACHER', 'COORDINATOR', 'ADMIN'] or
+                not self.codigos_perfil.isdisjoint({'TEACHER', 'COORDINATOR', 'ADMIN'}))
     
     def es_coordinador(self):
         """Compatible con sistema legacy y nuevo"""
-        return (self.tiene_perfil('COORDINATOR') or 
-                self.tiene_perfil('ADMIN') or
-                self.role in ['COORDINATOR', 'ADMIN'])
+        return (self.role in ['COORDINATOR', 'ADMIN'] or
+                not self.codigos_perfil.isdisjoint({'COORDINATOR', 'ADMIN'}))
     
     def es_admin(self):
         """Compatible con sistema legacy y nuevo"""
-        return (self.tiene_perfil('ADMIN') or 
-                self.role == 'ADMIN' or 
-                self.is_superuser)
+        return (self.role == 'ADMIN' or 
+                self.is_superuser or
+                self.tiene_perfil('ADMIN'))
     
     def es_equipo_direccion(self):
         """Nuevo método para equipo de dirección"""
@@ -165,8 +187,163 @@ class CustomUser(AbstractUser):
 class LoginAttempt(models.Model):
     username = models.CharField(max_length=150)
     ip_address = models.GenericIPAddressField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # default y no auto_now_add: los intentos se guardan por lotes (users.login_log)
+    # y deben conservar la hora del intento, no la del volcado
+    timestamp = models.DateTimeField(default=timezone.now)
     success = models.BooleanField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='loginattempt_timestamp_idx'),
+            models.Index(fields=['username', 'ip_address'], name='loginattempt_user_ip_idx'),
+        ]
+
     def __str__(self):
         return f'{self.username} - {self.timestamp} - {"Success" if self.success else "Failed"}'
+
+
+class LoginAttemptDaily(models.Model):
+    """Resumen diario de LoginAttempt por usuario e IP (comando compactar_login_attempts)"""
+    fecha = models.DateField()
+    username = models.CharField(max_length=150)
+    ip_address = models.GenericIPAddressField()
+    exitos = models.PositiveIntegerField(default=0)
+    fallos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('fecha', 'username', 'ip_address')
+        verbose_name = 'Resumen diario de accesos'
+        verbose_name_plural = 'Resúmenes diarios de accesos'
+
+    def __str__(self):
+        return f'{self.fecha} - {self.username} - {self.ip_address}: {self.exitos}/{self.fallos}'
+
+
+class EstadisticasKPI(models.Model):
+    """
+    Contadores precalculados de admin_dashboard y kpi_report (singleton pk=1).
+
+    Las señales de users.signals los ajustan con UPDATE campo = campo + n al
+    crear, borrar o modificar usuarios, actividades, titulaciones y
+    asignaturas. Lo que no pasa por señales (bulk_create, QuerySet.update,
+    SQL directo) lo corrige el comando recalcular_kpis. Son IntegerField y no
+    PositiveIntegerField para que una desviación nunca haga fallar un borrado.
+    """
+    total_users = models.IntegerField(default=0)
+    total_teachers = models.IntegerField(default=0)
+    total_students = models.IntegerField(default=0)
+    total_activities = models.IntegerField(default=0)
+    active_activities = models.IntegerField(default=0)
+    total_titulaciones = models.IntegerField(default=0)
+    total_asignaturas = models.IntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    CONTADORES = (
+        'total_users', 'total_teachers', 'total_students', 'total_activities',
+        'active_activities', 'total_titulaciones', 'total_asignaturas',
+    )
+
+    class Meta:
+        verbose_name = 'Estadísticas KPI'
+        verbose_name_plural = 'Estadísticas KPI'
+
+    @classmethod
+    def load(cls):
+        """Devuelve la fila de contadores, calculándola si aún no existe"""
+        return cls.objects.filter(pk=1).first() or cls.recalcular()
+
+    @classmethod
+    def contar(cls):
+        """Valores reales de los contadores, con COUNT(*) sobre cada tabla"""
+        Actividad = apps.get_model('schedule', 'Actividad')
+        return {
+            'total_users': CustomUser.objects.count(),
+            'total_teachers': CustomUser.objects.filter(role=CustomUser.ROLE_TEACHER).count(),
+            'total_students': CustomUser.objects.filter(role=CustomUser.ROLE_STUDENT).count(),
+            'total_activities': Actividad.objects.count(),
+            'active_activities': Actividad.objects.filter(activa=True).count(),
+            'total_titulaciones': Titulacion.objects.count(),
+            'total_asignaturas': Asignatura.objects.count(),
+        }
+
+    @classmethod
+    def recalcular(cls):
+        """Recalcula todos los contadores desde cero y los guarda"""
+        obj, created = cls.objects.update_or_create(pk=1, defaults=cls.contar())
+        return obj
+
+    @classmethod
+    def ajustar(cls, **deltas):
+        """
+        Suma los incrementos indicados (ej: total_users=1, total_students=-1)
+        en una sola sentencia UPDATE. Si la fila no existe aún se calcula
+        entera, lo que ya incluye el cambio que originó el ajuste.
+        """
+        cambios = {campo: F(campo) + delta for campo, delta in deltas.items() if delta}
+        if not cambios:
+            return
+        if not cls.objects.filter(pk=1).update(fecha_actualizacion=timezone.now(), **cambios):
+            cls.recalcular()
+
+
+class EnvioNotificacion(models.Model):
+    """Notificación masiva encolada; se envía en segundo plano (users.notifications)"""
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_ENVIANDO = 'enviando'
+    ESTADO_COMPLETADO = 'completado'
+
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_ENVIANDO, 'Enviando'),
+        (ESTADO_COMPLETADO, 'Completado'),
+    ]
+
+    asunto = models.CharField(max_length=100)
+    mensaje = models.TextField()
+    remitente = models.ForeignKey('CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='notificaciones_enviadas')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default=ESTADO_PENDIENTE)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-fecha_creacion']
+        verbose_name = 'Envío de Notificación'
+        verbose_name_plural = 'Envíos de Notificaciones'
+
+    def __str__(self):
+        return f'{self.asunto} ({self.get_estado_display()})'
+
+    def resumen(self):
+        """Número de destinatarios por estado de entrega"""
+        conteos = dict(self.destinatarios.values_list('estado').annotate(n=models.Count('id')))
+        return {estado: conteos.get(estado, 0) for estado, _ in DestinatarioNotificacion.ESTADO_CHOICES}
+
+
+class DestinatarioNotificacion(models.Model):
+    """Estado de entrega de una notificación masiva para cada destinatario"""
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_ENVIADO = 'enviado'
+    ESTADO_FALLIDO = 'fallido'
+
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_ENVIADO, 'Enviado'),
+        (ESTADO_FALLIDO, 'Fallido'),
+    ]
+
+    envio = models.ForeignKey(EnvioNotificacion, on_delete=models.CASCADE, related_name='destinatarios')
+    usuario = models.ForeignKey('CustomUser', on_delete=models.SET_NULL, null=True, blank=True)
+    email = models.EmailField()
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default=ESTADO_PENDIENTE)
+    error = models.TextField(blank=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Destinatario de Notificación'
+        verbose_name_plural = 'Destinatarios de Notificaciones'
+        indexes = [
+            models.Index(fields=['envio', 'estado'], name='destinatario_envio_estado_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.email} - {self.get_estado_display()}'
@@ -0,0 +1,183 @@
+"""
+Envío de notificaciones masivas por correo.
+
+La vista sólo registra el envío y sus destinatarios (EnvioNotificacion /
+DestinatarioNotificacion) y lo encola; un hilo en segundo plano (o el
+comando enviar_notificaciones) lo procesa por lotes:
+
+- una sola conexión SMTP (get_connection) para todo el envío,
+- un mensaje por destinatario, para no exponer las direcciones de los demás
+  y poder registrar el estado de cada uno,
+- como máximo NOTIFICATIONS_RATE_LIMIT mensajes por segundo.
+
+Si el proceso se interrumpe, los destinatarios pendientes se retoman con
+`manage.py enviar_notificaciones --reanudar`.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from academics.models import Asignatura
+from .models import AsignacionPerfil, CustomUser, DestinatarioNotificacion, EnvioNotificacion
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_BATCH_SIZE = getattr(settings, 'NOTIFICATIONS_BATCH_SIZE', 50)
+NOTIFICATIONS_RATE_LIMIT = getattr(settings, 'NOTIFICATIONS_RATE_LIMIT', 10)
+NOTIFICATIONS_WORKERS = getattr(settings, 'NOTIFICATIONS_WORKERS', 1)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=NOTIFICATIONS_WORKERS, thread_name_prefix='notifications')
+    return _executor
+
+
+def usuarios_destinatarios(titulaciones=None, cursos=None, asignaturas=None, tipos_perfil=None):
+    """
+    Usuarios activos a los que va dirigida una notificación.
+
+    Los criterios de asignatura (titulación, curso, asignatura) se aplican a
+    una misma asignatura del usuario; el de perfil incluye el rol legacy y
+    las asignaciones activas. Se usan subconsultas en lugar de JOINs para
+    que cada usuario aparezca una sola vez: el resultado se resuelve en una
+    única consulta al leerlo.
+    """
+    usuarios = CustomUser.objects.filter(is_active=True)
+
+    if titulaciones or cursos or asignaturas:
+        matriculas = CustomUser.subjects.through.objects.all()
+        if titulaciones or cursos:
+            materias = Asignatura.objects.all()
+            if titulaciones:
+                materias = materias.filter(titulacion__in=titulaciones)
+            if cursos:
+                materias = materias.filter(curso__in=cursos)
+            matriculas = matriculas.filter(asignatura__in=materias.values('pk'))
+        if asignaturas:
+            matriculas = matriculas.filter(asignatura__in=asignaturas)
+        usuarios = usuarios.filter(pk__in=matriculas.values('customuser_id'))
+
+    if tipos_perfil:
+        asignaciones = AsignacionPerfil.objects.filter(tipo_perfil__in=tipos_perfil, activa=True)
+        codigos = [t.codigo for t in tipos_perfil]
+        usuarios = usuarios.filter(Q(role__in=codigos) | Q(pk__in=asignaciones.values('usuario_id')))
+
+    return usuarios
+
+
+def crear_envio(asunto, mensaje, remitente, usuarios):
+    """
+    Registra un envío para los usuarios indicados (queryset) y devuelve el
+    EnvioNotificacion. Los destinatarios se leen en streaming y se insertan
+    por lotes; las direcciones repetidas o vacías se descartan.
+    """
+    envio = EnvioNotificacion.objects.create(asunto=asunto, mensaje=mensaje, remitente=remitente)
+    vistos = set()
+    lote = []
+    filas = usuarios.exclude(email='').exclude(email__isnull=True).values_list('id', 'email')
+    for usuario_id, email in filas.iterator(chunk_size=NOTIFICATIONS_BATCH_SIZE * 10):
+        clave = email.strip().lower()
+        if clave in vistos:
+            continue
+        vistos.add(clave)
+        lote.append(DestinatarioNotificacion(envio=envio, usuario_id=usuario_id, email=email.strip()))
+        if len(lote) >= NOTIFICATIONS_BATCH_SIZE * 10:
+            DestinatarioNotificacion.objects.bulk_create(lote)
+            lote = []
+    DestinatarioNotificacion.objects.bulk_create(lote)
+    return envio
+
+
+def encolar_envio(envio):
+    """Procesa el envío en segundo plano una vez confirmada la transacción"""
+    transaction.on_commit(lambda: _get_executor().submit(_run_envio_job, envio.pk))
+
+
+def _run_envio_job(envio_id):
+    close_old_connections()
+    try:
+        procesar_envio(envio_id)
+    except Exception:
+        logger.exception('Error procesando el envío de notificación %s', envio_id)
+    finally:
+        close_old_connections()
+
+
+def procesar_envio(envio_id, reanudar=False, batch_size=None, rate_limit=None):
+    """
+    Envía los destinatarios pendientes del envío. Devuelve False si otro
+    worker ya lo está procesando (o ya se completó).
+
+    Con `reanudar` también se toman envíos en estado 'enviando', que quedan
+    así si el proceso que los enviaba se interrumpió.
+    """
+    batch_size = batch_size or NOTIFICATIONS_BATCH_SIZE
+    rate_limit = NOTIFICATIONS_RATE_LIMIT if rate_limit is None else rate_limit
+
+    estados = [EnvioNotificacion.ESTADO_PENDIENTE]
+    if reanudar:
+        estados.append(EnvioNotificacion.ESTADO_ENVIANDO)
+    # Actualización condicional: sólo un worker se queda con el envío
+    if not EnvioNotificacion.objects.filter(pk=envio_id, estado__in=estados).update(
+        estado=EnvioNotificacion.ESTADO_ENVIANDO
+    ):
+        return False
+    envio = EnvioNotificacion.objects.get(pk=envio_id)
+    pendientes = envio.destinatarios.filter(estado=DestinatarioNotificacion.ESTADO_PENDIENTE).order_by('pk')
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+        ultimo_pk = 0
+        while True:
+            lote = list(pendientes.filter(pk__gt=ultimo_pk)[:batch_size])
+            if not lote:
+                break
+            inicio = time.monotonic()
+            _enviar_lote(envio, lote, connection)
+            ultimo_pk = lote[-1].pk
+            # Limitación de ritmo: el lote no puede durar menos de len/rate segundos
+            if rate_limit:
+                espera = len(lote) / rate_limit - (time.monotonic() - inicio)
+                if espera > 0:
+                    time.sleep(espera)
+    finally:
+        connection.close()
+
+    envio.estado = EnvioNotificacion.ESTADO_COMPLETADO
+    envio.fecha_fin = timezone.now()
+    envio.save(update_fields=['estado', 'fecha_fin'])
+    return True
+
+
+def _enviar_lote(envio, lote, connection):
+    """Envía un lote por la conexión abierta y guarda el estado de cada destinatario"""
+    from_email = settings.DEFAULT_FROM_EMAIL
+    for destinatario in lote:
+        message = EmailMessage(envio.asunto, envio.mensaje, from_email, [destinatario.email], connection=connection)
+        try:
+            connection.send_messages([message])
+            destinatario.estado = DestinatarioNotificacion.ESTADO_ENVIADO
+            destinatario.error = ''
+        except Exception as e:
+            logger.warning('No se pudo enviar la notificación %s a %s: %s', envio.pk, destinatario.email, e)
+            destinatario.estado = DestinatarioNotificacion.ESTADO_FALLIDO
+            destinatario.error = str(e)[:500]
+            # El servidor puede haber cerrado la conexión: se abre otra para el resto
+            try:
+                connection.close()
+                connection.open()
+            except Exception:
+                logger.exception('No se pudo reabrir la conexión SMTP')
+        destinatario.fecha_envio = timezone.now()
+    DestinatarioNotificacion.objects.bulk_update(lote, ['estado', 'error', 'fecha_envio'])
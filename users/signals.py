@@ -1,26 +1,35 @@
 from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import LoginAttempt
+from academics.models import Asignatura, Titulacion
+from schedule.models import Actividad
+from .login_log import record_login_attempt
+from .models import AsignacionPerfil, CustomUser, EstadisticasKPI
 import logging
 
 logger = logging.getLogger(__name__)
 
 def get_client_ip(request):
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
+    """
+    IP del cliente según el proxy (nginx), no según el propio cliente.
+
+    nginx sustituye X-Real-IP por $remote_addr y añade esa misma dirección al
+    final de X-Forwarded-For; las entradas anteriores las pone el cliente y
+    pueden falsearse, así que nunca se usa la primera.
+    """
+    ip = request.META.get('HTTP_X_REAL_IP', '').strip()
+    if not ip:
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if x_forwarded_for:
+            ip = x_forwarded_for.split(',')[-1].strip()
+        else:
+            ip = request.META.get('REMOTE_ADDR')
     return ip or '0.0.0.0'
 
 @receiver(user_logged_in)
 def user_logged_in_handler(sender, request, user, **kwargs):
     try:
-        LoginAttempt.objects.create(
-            username=user.username,
-            ip_address=get_client_ip(request),
-            success=True
-        )
+        record_login_attempt(user.username, get_client_ip(request), True)
     except Exception as e:
         logger.error(f"Error logging successful login attempt: {e}")
 
@@ -30,10 +39,88 @@ def user_login_failed_handler(sender, credentials, request, **kwargs):
         username = credentials.get('username', 'unknown')
         if username and len(username) > 150:
             username = username[:150]
-        LoginAttempt.objects.create(
-            username=username,
-            ip_address=get_client_ip(request),
-            success=False
-        )
+        record_login_attempt(username, get_client_ip(request), False)
     except Exception as e:
         logger.error(f"Error logging failed login attempt: {e}")
+
+@receiver([post_save, post_delete], sender=AsignacionPerfil)
+def invalidate_profiles_on_assignment_change(sender, instance, **kwargs):
+    """Invalida los códigos de perfil cacheados en el usuario de la asignación"""
+    # Sólo si el usuario ya está cargado: si no, no hay caché que invalidar
+    if AsignacionPerfil.usuario.is_cached(instance):
+        instance.usuario.invalidar_perfiles()
+
+@receiver(m2m_changed, sender=CustomUser.tipos_perfil.through)
+def invalidate_profiles_on_m2m_change(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and not reverse:
+        instance.invalidar_perfiles()
+
+
+# --- Contadores de EstadisticasKPI ---
+# post_init guarda el rol / activa con que se cargó la instancia (sin consultas:
+# se lee de __dict__ para no forzar campos diferidos) y post_save ajusta los
+# contadores solo si han cambiado.
+
+_ROLE_COUNTERS = {
+    CustomUser.ROLE_TEACHER: 'total_teachers',
+    CustomUser.ROLE_STUDENT: 'total_students',
+}
+
+def _role_deltas(role, sign):
+    counter = _ROLE_COUNTERS.get(role)
+    return {counter: sign} if counter else {}
+
+@receiver(post_init, sender=CustomUser)
+def remember_user_role(sender, instance, **kwargs):
+    instance._kpi_role = instance.__dict__.get('role')
+
+@receiver(post_save, sender=CustomUser)
+def update_kpis_on_user_save(sender, instance, created, **kwargs):
+    if created:
+        deltas = {'total_users': 1, **_role_deltas(instance.role, 1)}
+    elif instance._kpi_role is not None and instance.role != instance._kpi_role:
+        deltas = _role_deltas(instance._kpi_role, -1)
+        for counter, delta in _role_deltas(instance.role, 1).items():
+            deltas[counter] = deltas.get(counter, 0) + delta
+    else:
+        return
+    instance._kpi_role = instance.role
+    EstadisticasKPI.ajustar(**deltas)
+
+@receiver(post_delete, sender=CustomUser)
+def update_kpis_on_user_delete(sender, instance, **kwargs):
+    EstadisticasKPI.ajustar(total_users=-1, **_role_deltas(instance.role, -1))
+
+@receiver(post_init, sender=Actividad)
+def remember_activity_active(sender, instance, **kwargs):
+    instance._kpi_activa = instance.__dict__.get('activa')
+
+@receiver(post_save, sender=Actividad)
+def update_kpis_on_activity_save(sender, instance, created, **kwargs):
+    if created:
+        EstadisticasKPI.ajustar(total_activities=1, active_activities=int(instance.activa))
+    elif instance._kpi_activa is not None and instance.activa != instance._kpi_activa:
+        EstadisticasKPI.ajustar(active_activities=1 if instance.activa else -1)
+    instance._kpi_activa = instance.activa
+
+@receiver(post_delete, sender=Actividad)
+def update_kpis_on_activity_delete(sender, instance, **kwargs):
+    EstadisticasKPI.ajustar(total_activities=-1, active_activities=-int(instance.activa))
+
+@receiver(post_save, sender=Titulacion)
+def update_kpis_on_titulacion_save(sender, instance, created, **kwargs):
+    if created:
+        EstadisticasKPI.ajustar(total_titulaciones=1)
+
+@receiver(post_delete, sender=Titulacion)
+def update_kpis_on_titulacion_delete(sender, instance, **kwargs):
+    EstadisticasKPI.ajustar(total_titulaciones=-1)
+
+@receiver(post_save, sender=Asignatura)
+def update_kpis_on_asignatura_save(sender, instance, created, **kwargs):
+    if created:
+        EstadisticasKPI.ajustar(total_asignaturas=1)
+
+@receiver(post_delete, sender=Asignatura)
+def update_kpis_on_asignatura_delete(sender, instance, **kwargs):
+    EstadisticasKPI.ajustar(total_asignaturas=-1)
@@ -1,3 +1,422 @@
-from django.test import TestCase
+import io
+import json
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from academics.models import Asignatura, Titulacion
+from schedule.models import Actividad, TipoActividad, VistaCalendario
+from schedule.views import _get_report_titulaciones
+
+from .models import (
+    AsignacionPerfil, CustomUser, DestinatarioNotificacion, EnvioNotificacion, EstadisticasKPI,
+    LoginAttempt, LoginAttemptDaily, TipoPerfil,
+)
+from .login_log import flush_login_attempts, pending_login_attempts, record_login_attempt
+from .notifications import crear_envio, procesar_envio, usuarios_destinatarios
+from .throttling import is_throttled
+from .views import is_coordinator, is_teacher
+
+
+class ProfileResolverTests(TestCase):
+    """Las comprobaciones de perfil se resuelven con una consulta por usuario"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for codigo in ('STUDENT', 'TEACHER', 'COORDINATOR', 'ADMIN'):
+            TipoPerfil.objects.create(nombre=codigo.title(), codigo=codigo)
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='usuario', password='x', role=CustomUser.ROLE_STUDENT)
+        self.user.asignar_perfil('TEACHER')
+
+    def test_checks_share_one_query(self):
+        user = CustomUser.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(user.es_profesor())
+            self.assertFalse(user.es_coordinador())
+            self.assertFalse(user.es_admin())
+            self.assertTrue(is_teacher(user))
+            self.assertFalse(is_coordinator(user))
+
+    def test_assignment_changes_invalidate_cache(self):
+        self.assertFalse(self.user.es_coordinador())
+
+        self.user.asignar_perfil('COORDINATOR')
+        self.assertTrue(self.user.es_coordinador())
+
+        self.user.remover_perfil('COORDINATOR')
+        self.assertFalse(self.user.es_coordinador())
+
+        asignacion = AsignacionPerfil.objects.get(usuario=self.user, tipo_perfil__codigo='TEACHER')
+        asignacion.usuario = self.user
+        asignacion.delete()
+        self.assertFalse(self.user.es_profesor())
+
+
+class ProfileCoordinatorScopeTests(TestCase):
+    """Un coordinador por perfil (sin rol) sólo accede a sus titulaciones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        TipoPerfil.objects.create(nombre='Coordinator', codigo='COORDINATOR')
+        cls.user = CustomUser.objects.create_user(username='perfil', password='x', role=CustomUser.ROLE_TEACHER)
+        cls.user.asignar_perfil('COORDINATOR')
+        otro = CustomUser.objects.create_user(username='otro', password='x', role=CustomUser.ROLE_COORDINATOR)
+        cls.propia = Titulacion.objects.create(nombre='Propia', coordinador=cls.user)
+        cls.ajena = Titulacion.objects.create(nombre='Ajena', coordinador=otro)
+        Asignatura.objects.create(nombre='A', titulacion=cls.propia, curso=1, semestre=1)
+        Asignatura.objects.create(nombre='B', titulacion=cls.ajena, curso=1, semestre=1)
+
+    def test_automatic_icals_only_for_own_titulaciones(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('create_automatic_icals'))
+
+        self.assertEqual(response.status_code, 200)
+        nombres = set(VistaCalendario.objects.filter(usuario=self.user).values_list('nombre', flat=True))
+        self.assertIn('Agenda completa - Propia', nombres)
+        self.assertFalse(any('Ajena' in nombre for nombre in nombres))
+
+    def test_reports_only_for_own_titulaciones(self):
+        user = CustomUser.objects.get(pk=self.user.pk)
+        self.assertEqual(_get_report_titulaciones(user), [self.propia])
+        self.assertEqual(_get_report_titulaciones(user, self.ajena.pk).status_code, 403)
+
+
+class CoordinatorActivitiesPageTests(TestCase):
+    """Tablas del panel del coordinador servidas por páginas (paginación por clave)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.coordinator = CustomUser.objects.create_user(
+            username='coordinador', password='x', role=CustomUser.ROLE_COORDINATOR
+        )
+        titulacion = Titulacion.objects.create(nombre='Grado', coordinador=cls.coordinator)
+        otra = Titulacion.objects.create(nombre='Otro grado')
+        asignatura = Asignatura.objects.create(nombre='Cálculo', titulacion=titulacion, curso=1, semestre=1)
+        ajena = Asignatura.objects.create(nombre='Física', titulacion=otra, curso=1, semestre=1)
+        tipo = TipoActividad.objects.create(nombre='Examen')
+        start = timezone.now()
+        for i in range(7):
+            activity = Actividad.objects.create(
+                nombre=f'Actividad {i}', tipo_actividad=tipo,
+                # Fechas repetidas: la pk desempata
+                fecha_inicio=start + timedelta(days=i // 2),
+                fecha_fin=start + timedelta(days=i // 2, hours=2),
+            )
+            activity.asignaturas.add(asignatura, ajena)
+        outsider = Actividad.objects.create(
+            nombre='Ajena', tipo_actividad=tipo, fecha_inicio=start, fecha_fin=start + timedelta(hours=1)
+        )
+        outsider.asignaturas.add(ajena)
+
+    def setUp(self):
+        self.client.force_login(self.coordinator)
+
+    def _pages(self, **params):
+        url = reverse('coordinator_activities_page')
+        ids, cursor, queries = [], None, []
+        while True:
+            query = dict(params, limit=3)
+            if cursor:
+                query['cursor'] = cursor
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.client.get(url, query).json()
+            queries.append(len(ctx.captured_queries))
+            self.assertTrue(data['success'])
+            ids.extend(row['id'] for row in data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                return ids, data, queries
+
+    def test_pages_cover_all_rows_once(self):
+        ids, _, queries = self._pages(sort='-fecha_inicio')
+        expected = list(
+            Actividad.objects.exclude(nombre='Ajena').order_by('-fecha_inicio', '-pk').values_list('pk', flat=True)
+        )
+        self.assertEqual(ids, expected)
+        # Consultas constantes por página (la primera añade el total)
+        self.assertEqual(len(set(queries[1:])), 1)
+
+    def test_rows_include_approval_permission(self):
+        data = self.client.get(reverse('coordinator_activities_page')).json()
+        self.assertEqual(data['total'], 7)
+        self.assertTrue(all(row['can_edit_approval'] for row in data['results']))
+
+    def test_invalid_cursor_and_sort_are_rejected(self):
+        url = reverse('coordinator_activities_page')
+        self.assertEqual(self.client.get(url, {'cursor': 'basura'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'sort': 'descripcion'}).status_code, 400)
+
+
+class EstadisticasKPITests(TestCase):
+    """Los contadores precalculados siguen a los datos reales"""
+
+    def assertCountersMatch(self):
+        kpis = EstadisticasKPI.load()
+        self.assertEqual({campo: getattr(kpis, campo) for campo in EstadisticasKPI.CONTADORES}, EstadisticasKPI.contar())
+
+    def test_signals_keep_counters_in_sync(self):
+        EstadisticasKPI.recalcular()
+        user = CustomUser.objects.create_user(username='alumno', password='x', role=CustomUser.ROLE_STUDENT)
+        titulacion = Titulacion.objects.create(nombre='Grado')
+        asignatura = Asignatura.objects.create(nombre='Cálculo', titulacion=titulacion, curso=1, semestre=1)
+        tipo = TipoActividad.objects.create(nombre='Examen')
+        start = timezone.now()
+        activity = Actividad.objects.create(
+            nombre='Parcial', tipo_actividad=tipo, fecha_inicio=start, fecha_fin=start + timedelta(hours=1)
+        )
+        self.assertCountersMatch()
+
+        user = CustomUser.objects.get(pk=user.pk)
+        user.role = CustomUser.ROLE_TEACHER
+        user.save()
+        activity.activa = False
+        activity.save()
+        self.assertCountersMatch()
+
+        # El borrado en cascada también pasa por las señales
+        titulacion.delete()
+        activity.delete()
+        user.delete()
+        self.assertCountersMatch()
+        self.assertFalse(Asignatura.objects.filter(pk=asignatura.pk).exists())
+
+    def test_multi_group_edit_keeps_active_count(self):
+        teacher = CustomUser.objects.create_user(username='profesor', password='x', role=CustomUser.ROLE_TEACHER)
+        titulacion = Titulacion.objects.create(nombre='Grado')
+        asignatura = Asignatura.objects.create(nombre='Cálculo', titulacion=titulacion, curso=1, semestre=1)
+        teacher.subjects.add(asignatura)
+        tipo = TipoActividad.objects.create(nombre='Examen')
+        grupo_id = uuid.uuid4()
+        start = timezone.now()
+        for grupo in ('A', 'B'):
+            Actividad.objects.create(
+                nombre='Parcial', tipo_actividad=tipo, grupo_id=grupo_id, descripcion=f'Grupo {grupo}: aula',
+                fecha_inicio=start, fecha_fin=start + timedelta(hours=1),
+            )
+        EstadisticasKPI.recalcular()
+
+        self.client.force_login(teacher)
+        response = self.client.post(reverse('multi_group_activity_edit', args=[grupo_id]), {
+            'nombre': 'Parcial', 'asignaturas': [asignatura.pk], 'tipo_actividad': tipo.pk,
+            'porcentaje_evaluacion': '0', 'grupos_data': json.dumps([
+                {'grupo': 'A', 'fecha_inicio': '2030-01-10T09:00', 'fecha_fin': '2030-01-10T11:00', 'descripcion': 'aula'},
+            ]),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Actividad.objects.filter(grupo_id=grupo_id, activa=True).exists())
+        self.assertCountersMatch()
+
+    def test_command_reconciles_drift(self):
+        CustomUser.objects.bulk_create([CustomUser(username=f'u{i}') for i in range(3)])
+        EstadisticasKPI.objects.filter(pk=1).update(total_users=0)
+        call_command('recalcular_kpis', stdout=io.StringIO())
+        self.assertCountersMatch()
+
+
+class _InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class MassNotificationTests(TestCase):
+    """Las notificaciones masivas se envían fuera de la petición, por lotes y con una conexión"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.coordinator = CustomUser.objects.create_user(
+            username='coordinador', password='x', email='coord@unex.es', role=CustomUser.ROLE_COORDINATOR
+        )
+        for i in range(5):
+            CustomUser.objects.create_user(username=f'alumno{i}', password='x', email=f'alumno{i}@alumnos.unex.es')
+        # Sin correo y correo repetido: no generan destinatarios
+        CustomUser.objects.create_user(username='sin_correo', password='x')
+        CustomUser.objects.create_user(username='repetido', password='x', email='ALUMNO0@alumnos.unex.es')
+
+    def test_view_queues_and_sends_one_message_per_recipient(self):
+        self.client.force_login(self.coordinator)
+        with mock.patch('users.notifications._get_executor', lambda: _InlineExecutor()), \
+                mock.patch('users.notifications.close_old_connections'), \
+                mock.patch('users.notifications.NOTIFICATIONS_RATE_LIMIT', 0), \
+                mock.patch('users.notifications.NOTIFICATIONS_BATCH_SIZE', 2), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('send_notification'), {'subject': 'Aviso', 'message': 'Hola'})
+        self.assertRedirects(response, reverse('coordinator_dashboard'), fetch_redirect_response=False)
+
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertTrue(all(len(message.to) == 1 for message in mail.outbox))
+        envio = EnvioNotificacion.objects.get()
+        self.assertEqual(envio.estado, EnvioNotificacion.ESTADO_COMPLETADO)
+        self.assertEqual(envio.resumen(), {'pendiente': 0, 'enviado': 6, 'fallido': 0})
+
+        status = self.client.get(reverse('notification_status', args=[envio.pk])).json()
+        self.assertEqual(status['destinatarios']['enviado'], 6)
+
+    def test_failures_are_recorded_per_recipient(self):
+        envio = crear_envio('Aviso', 'Hola', self.coordinator, CustomUser.objects.all())
+        original = locmem.EmailBackend.send_messages
+
+        def send_messages(backend, messages):
+            if messages[0].to == ['alumno3@alumnos.unex.es']:
+                raise OSError('buzón lleno')
+            return original(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', send_messages):
+            self.assertTrue(procesar_envio(envio.pk, batch_size=4, rate_limit=0))
+        # Ya completado: no se vuelve a enviar
+        self.assertFalse(procesar_envio(envio.pk))
+
+        self.assertEqual(envio.resumen(), {'pendiente': 0, 'enviado': 5, 'fallido': 1})
+        fallido = envio.destinatarios.get(estado=DestinatarioNotificacion.ESTADO_FALLIDO)
+        self.assertEqual(fallido.email, 'alumno3@alumnos.unex.es')
+        self.assertIn('buzón lleno', fallido.error)
+
+    def test_audience_filters_resolve_active_recipients_in_one_query(self):
+        titulacion = Titulacion.objects.create(nombre='Grado')
+        primero = Asignatura.objects.create(nombre='Cálculo', titulacion=titulacion, curso=1, semestre=1)
+        segundo = Asignatura.objects.create(nombre='Redes', titulacion=titulacion, curso=2, semestre=1)
+        alumno0, alumno1, alumno2 = (CustomUser.objects.get(username=f'alumno{i}') for i in range(3))
+        alumno0.subjects.add(primero, segundo)
+        alumno1.subjects.add(primero)
+        alumno2.subjects.add(segundo)
+        CustomUser.objects.filter(pk=alumno1.pk).update(is_active=False)
+
+        destinatarios = usuarios_destinatarios(titulaciones=[titulacion], cursos=[1])
+        with self.assertNumQueries(1):
+            emails = list(destinatarios.values_list('email', flat=True))
+        self.assertEqual(emails, ['alumno0@alumnos.unex.es'])
+
+        profesor = TipoPerfil.objects.create(nombre='Profesor', codigo='TEACHER')
+        alumno2.asignar_perfil('TEACHER')
+        destinatarios = usuarios_destinatarios(asignaturas=[segundo], tipos_perfil=[profesor])
+        self.assertEqual(list(destinatarios.values_list('username', flat=True)), ['alumno2'])
+
+
+class LoginAttemptLogTests(TestCase):
+    """Los intentos de login se guardan por lotes y se resumen por día"""
+
+    def tearDown(self):
+        # Nada queda en el búfer para el temporizador ni para el volcado al salir
+        flush_login_attempts()
+
+    @override_settings(LOGIN_ATTEMPTS_BUFFER_SIZE=50)
+    def test_buffered_attempt_is_written_on_flush(self):
+        record_login_attempt('ana', '10.0.0.1', False)
+        self.assertFalse(LoginAttempt.objects.exists())
+        self.assertEqual(len(pending_login_attempts()), 1)
+
+        self.assertEqual(flush_login_attempts(), 1)
+        self.assertEqual(pending_login_attempts(), [])
+        self.assertTrue(LoginAttempt.objects.filter(username='ana', success=False).exists())
+
+    def test_attempts_are_written_immediately_without_buffer(self):
+        with self.assertNumQueries(1):
+            record_login_attempt('ana', '10.0.0.1', True)
+        self.assertEqual(pending_login_attempts(), [])
+
+    @override_settings(LOGIN_ATTEMPTS_BUFFER_SIZE=3)
+    def test_attempts_are_buffered_and_flushed_in_bulk(self):
+        with mock.patch('users.login_log._get_executor', lambda: _InlineExecutor()), \
+                mock.patch('users.login_log.close_old_connections'):
+            with self.assertNumQueries(0):
+                record_login_attempt('ana', '10.0.0.1', False)
+                record_login_attempt('ana', '10.0.0.1', True)
+            self.assertEqual(len(pending_login_attempts()), 2)
+            # El tercero llena el búfer: un único INSERT
+            with self.assertNumQueries(1):
+                record_login_attempt('luis', '10.0.0.2', False)
+        self.assertEqual(pending_login_attempts(), [])
+        self.assertEqual(LoginAttempt.objects.count(), 3)
+
+    def test_command_rolls_up_old_attempts_and_view_pages_aggregates(self):
+        old = timezone.now() - timedelta(days=40)
+        LoginAttempt.objects.bulk_create(
+            [LoginAttempt(username='ana', ip_address='10.0.0.1', success=i % 2 == 0, timestamp=old) for i in range(5)]
+            + [LoginAttempt(username='ana', ip_address='10.0.0.1', success=False, timestamp=timezone.now())]
+        )
+        call_command('compactar_login_attempts', dias=30, stdout=io.StringIO())
+
+        self.assertEqual(LoginAttempt.objects.count(), 1)
+        daily = LoginAttemptDaily.objects.get()
+        self.assertEqual((daily.fecha, daily.exitos, daily.fallos), (timezone.localtime(old).date(), 3, 2))
+
+        admin = CustomUser.objects.create_user(username='admin', password='x', role=CustomUser.ROLE_ADMIN)
+        self.client.force_login(admin)
+        response = self.client.get(reverse('login_attempts'), {'username': 'ana'})
+        rows = list(response.context['page_obj'])
+        self.assertEqual([(row['exitos'], row['fallos']) for row in rows], [(0, 1), (3, 2)])
+
+
+class LoginThrottleTests(TestCase):
+    """Tras demasiados fallos se rechaza el login sin calcular el hash"""
+
+    def setUp(self):
+        cache.clear()
+        flush_login_attempts()
+        self.user = CustomUser.objects.create_user(username='ana', password='correcta')
+        self.request = RequestFactory().post('/login/', REMOTE_ADDR='10.0.0.1')
+
+    def tearDown(self):
+        cache.clear()
+
+    def _fail(self, times, username='ana'):
+        for _ in range(times):
+            self.assertIsNone(authenticate(self.request, username=username, password='mala'))
+
+    @mock.patch('users.throttling.LOGIN_THROTTLE_MAX_FAILURES_USERNAME', 3)
+    def test_username_is_blocked_before_check_password(self):
+        self._fail(3)
+        with mock.patch.object(CustomUser, 'check_password') as check_password:
+            self.assertIsNone(authenticate(self.request, username='ANA', password='correcta'))
+        check_password.assert_not_called()
+
+    @mock.patch('users.throttling.LOGIN_THROTTLE_MAX_FAILURES_USERNAME', 3)
+    def test_success_resets_username_counter(self):
+        self._fail(2)
+        self.assertEqual(authenticate(self.request, username='ana', password='correcta'), self.user)
+        self._fail(2)
+        self.assertEqual(authenticate(self.request, username='ana', password='correcta'), self.user)
+
+    @mock.patch('users.throttling.LOGIN_THROTTLE_MAX_FAILURES_IP', 4)
+    def test_ip_limit_spans_usernames(self):
+        self._fail(2, 'ana')
+        self._fail(2, 'inexistente')
+        self.assertIsNone(authenticate(self.request, username='ana', password='correcta'))
+
+    @mock.patch('users.throttling.LOGIN_THROTTLE_MAX_FAILURES_IP', 3)
+    def test_spoofed_forwarded_for_does_not_bypass_ip_limit(self):
+        for i in range(3):
+            # nginx: X-Real-IP y la última entrada de X-Forwarded-For son la IP real
+            self.request = RequestFactory().post(
+                '/login/', REMOTE_ADDR='127.0.0.1', HTTP_X_REAL_IP='10.0.0.9',
+                HTTP_X_FORWARDED_FOR=f'192.0.2.{i}, 10.0.0.9',
+            )
+            self._fail(1, f'usuario{i}')
+        self.assertTrue(is_throttled('otro', '10.0.0.9'))
+        self.assertFalse(is_throttled('otro', '192.0.2.0'))
+
+    def test_consolidated_backend_hashes_once_per_attempt(self):
+        out = io.StringIO()
+        call_command('benchmark_login', attempts=2, stdout=out)
+        self.assertIn('un hash por intento en todos los escenarios', out.getvalue())
+        self.assertEqual(settings.AUTHENTICATION_BACKENDS, ['users.backends.EmailVerificationBackend'])
+
+    @mock.patch('users.throttling.LOGIN_THROTTLE_MAX_FAILURES_USERNAME', 3)
+    def test_database_fallback_when_cache_fails(self):
+        self._fail(3)
+        with mock.patch('users.throttling.cache.get_many', side_effect=ConnectionError('caché caída')):
+            self.assertTrue(is_throttled('ana', '10.0.0.2'))
+            self.assertFalse(is_throttled('luis', '10.0.0.2'))
@@ -0,0 +1,112 @@
+"""
+Limitación de intentos de login fallidos por usuario y por IP.
+
+Cada fallo se cuenta en una ventana deslizante de LOGIN_THROTTLE_WINDOW
+segundos, aproximada con dos contadores de la caché (ventana actual y
+anterior, ponderada por la parte que aún solapa). Si la caché no responde
+se cuentan los fallos en LoginAttempt (más los que aún están en el búfer de
+users.login_log).
+
+EmailVerificationBackend lo consulta antes de check_password: un usuario o
+IP por encima del umbral se rechaza sin calcular ningún hash.
+
+La IP es la que fija el proxy (users.signals.get_client_ip), no la primera
+de X-Forwarded-For, que el cliente puede cambiar en cada intento. Los
+contadores deben estar en una caché compartida por todos los workers (la
+configurada en CACHES); con LocMemCache cada proceso llevaría su cuenta.
+"""
+import hashlib
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .login_log import pending_login_attempts
+from .models import LoginAttempt
+
+logger = logging.getLogger(__name__)
+
+LOGIN_THROTTLE_WINDOW = getattr(settings, 'LOGIN_THROTTLE_WINDOW', 15 * 60)
+LOGIN_THROTTLE_MAX_FAILURES_USERNAME = getattr(settings, 'LOGIN_THROTTLE_MAX_FAILURES_USERNAME', 5)
+LOGIN_THROTTLE_MAX_FAILURES_IP = getattr(settings, 'LOGIN_THROTTLE_MAX_FAILURES_IP', 50)
+
+KIND_USERNAME = 'username'
+KIND_IP = 'ip'
+
+
+def _cache_key(kind, value, bucket):
+    digest = hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
+    return f'login_throttle:{kind}:{digest}:{bucket}'
+
+
+def _limits(username, ip_address):
+    limits = []
+    if username and LOGIN_THROTTLE_MAX_FAILURES_USERNAME:
+        limits.append((KIND_USERNAME, username.lower(), LOGIN_THROTTLE_MAX_FAILURES_USERNAME))
+    if ip_address and LOGIN_THROTTLE_MAX_FAILURES_IP:
+        limits.append((KIND_IP, ip_address, LOGIN_THROTTLE_MAX_FAILURES_IP))
+    return limits
+
+
+def _cache_failures(kind, value, now):
+    bucket, offset = divmod(now, LOGIN_THROTTLE_WINDOW)
+    bucket = int(bucket)
+    counts = cache.get_many([_cache_key(kind, value, bucket), _cache_key(kind, value, bucket - 1)])
+    current = counts.get(_cache_key(kind, value, bucket), 0)
+    previous = counts.get(_cache_key(kind, value, bucket - 1), 0)
+    # La ventana anterior cuenta en la proporción que aún cae dentro de la deslizante
+    return current + previous * (1 - offset / LOGIN_THROTTLE_WINDOW)
+
+
+def _db_failures(kind, value):
+    desde = timezone.now() - timedelta(seconds=LOGIN_THROTTLE_WINDOW)
+    field = 'username' if kind == KIND_USERNAME else 'ip_address'
+    lookup = 'username__iexact' if kind == KIND_USERNAME else 'ip_address'
+    stored = LoginAttempt.objects.filter(success=False, timestamp__gte=desde, **{lookup: value}).count()
+    pending = sum(
+        1 for a in pending_login_attempts()
+        if not a.success and a.timestamp >= desde and getattr(a, field).lower() == value
+    )
+    return stored + pending
+
+
+def is_throttled(username, ip_address):
+    """True si el usuario o la IP han superado el número de fallos permitido"""
+    now = time.time()
+    for kind, value, limit in _limits(username, ip_address):
+        try:
+            failures = _cache_failures(kind, value, now)
+        except Exception as e:
+            logger.warning(f"Login throttle cache unavailable, counting LoginAttempt rows: {e}")
+            failures = _db_failures(kind, value)
+        if failures >= limit:
+            return True
+    return False
+
+
+def register_failure(username, ip_address):
+    """Suma un fallo a los contadores del usuario y de la IP"""
+    bucket = int(time.time() // LOGIN_THROTTLE_WINDOW)
+    for kind, value, limit in _limits(username, ip_address):
+        key = _cache_key(kind, value, bucket)
+        try:
+            # add() no pisa un contador existente; dos ventanas de vida bastan
+            cache.add(key, 0, timeout=LOGIN_THROTTLE_WINDOW * 2)
+            cache.incr(key)
+        except Exception as e:
+            # El fallo queda igualmente en LoginAttempt (señal user_login_failed)
+            logger.warning(f"Login throttle cache unavailable: {e}")
+
+
+def reset_username(username):
+    """Un login correcto borra los fallos acumulados del usuario (no los de la IP)"""
+    if not username:
+        return
+    bucket = int(time.time() // LOGIN_THROTTLE_WINDOW)
+    try:
+        cache.delete_many([_cache_key(KIND_USERNAME, username.lower(), b) for b in (bucket, bucket - 1)])
+    except Exception as e:
+        logger.warning(f"Login throttle cache unavailable: {e}")
@@ -31,7 +31,9 @@ urlpatterns = [
     path('teacher_select_subjects/', views.teacher_select_subjects, name='teacher_select_subjects'),
     path('teacher_student_view/', views.teacher_student_view, name='teacher_student_view'),
     path('coordinator_dashboard/', views.coordinator_dashboard, name='coordinator_dashboard'),
+    path('api/coordinator_activities/', views.coordinator_activities_page, name='coordinator_activities_page'),
     path('send_notification/', views.send_notification, name='send_notification'),
+    path('notification_status/<int:envio_id>/', views.notification_status, name='notification_status'),
     path('kpi_report/', views.kpi_report, name='kpi_report'),
     path('assign_coordinators/', views.assign_coordinators, name='assign_coordinators'),
     path('admin_dashboard/', views.admin_dashboard, name='admin_dashboard'),
@@ -3,44 +3,89 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from .forms import StudentSubjectForm, NotificationForm, CustomUserCreationForm # Import CustomUserCreationForm
 from schedule.models import Actividad, VistaCalendario, TipoActividad, LogActividad
 from schedule.forms import VistaCalendarioForm
+from schedule.events import load_rows, get_closing_date, get_date_window, build_calendar_events
+from schedule.pagination import keyset_paginate
+from schedule.audit import registrar_log
 from academics.models import Titulacion, Asignatura
 from django.core.mail import send_mail
 from django.utils.translation import gettext as _
-from .models import CustomUser
+from .models import CustomUser, EstadisticasKPI, EnvioNotificacion, DestinatarioNotificacion
+from .notifications import crear_envio, encolar_envio, usuarios_destinatarios
 from django.contrib import messages
 from django.http import JsonResponse
 from agenda_academica.models import AgendaSettings
 from django.views.decorators.http import require_http_methods
 import json
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.template.loader import render_to_string
 from django.contrib.sites.shortcuts import get_current_site
-from .models import LoginAttempt
+from .models import LoginAttempt, LoginAttemptDaily
 from django.conf import settings # Import settings
+from django.utils import timezone
+from django.utils.formats import date_format
+from django.core.paginator import Paginator
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
 
+LOGIN_ATTEMPTS_PAGE_SIZE = 50
+
+# Las comprobaciones usan los métodos es_* del usuario: rol legacy + perfiles,
+# resueltos una sola vez por petición (CustomUser.codigos_perfil)
 def is_teacher(user):
-    return user.is_authenticated and user.role in [CustomUser.ROLE_TEACHER, CustomUser.ROLE_COORDINATOR, CustomUser.ROLE_ADMIN]
+    return user.is_authenticated and user.es_profesor()
 
 def is_student(user):
-    return user.is_authenticated and user.role == CustomUser.ROLE_STUDENT
+    return user.is_authenticated and user.es_estudiante()
 
 def is_coordinator(user):
-    return user.is_authenticated and user.role in [CustomUser.ROLE_COORDINATOR, CustomUser.ROLE_ADMIN]
+    return user.is_authenticated and user.es_coordinador()
 
 def is_admin(user):
-    return user.role == CustomUser.ROLE_ADMIN or user.is_superuser
+    return user.is_authenticated and user.es_admin()
 
 def is_coordinator_or_admin(user):
-    return user.role == CustomUser.ROLE_COORDINATOR or user.role == CustomUser.ROLE_ADMIN or user.is_superuser
+    return user.is_authenticated and (user.es_coordinador() or user.is_superuser)
 
 @login_required
 @user_passes_test(is_admin)
 def login_attempts(request):
-    attempts = LoginAttempt.objects.all().order_by('-timestamp')
-    return render(request, 'users/login_attempts.html', {'attempts': attempts})
+    """
+    Intentos de login agregados por día, usuario e IP, paginados.
+
+    Une los resúmenes de LoginAttemptDaily (días ya compactados) con la
+    agregación al vuelo de los intentos recientes que aún están en detalle.
+    """
+    username = request.GET.get('username', '').strip()
+    ip_address = request.GET.get('ip', '').strip()
+
+    recientes = LoginAttempt.objects.all()
+    resumidos = LoginAttemptDaily.objects.all()
+    if username:
+        recientes = recientes.filter(username__icontains=username)
+        resumidos = resumidos.filter(username__icontains=username)
+    if ip_address:
+        recientes = recientes.filter(ip_address=ip_address)
+        resumidos = resumidos.filter(ip_address=ip_address)
+
+    recientes = recientes.annotate(
+        fecha=TruncDate('timestamp')
+    ).values('fecha', 'username', 'ip_address').annotate(
+        exitos=Count('id', filter=Q(success=True)),
+        fallos=Count('id', filter=Q(success=False)),
+    ).order_by()
+    resumidos = resumidos.values('fecha', 'username', 'ip_address', 'exitos', 'fallos').order_by()
+
+    agregados = recientes.union(resumidos, all=True).order_by('-fecha', 'username', 'ip_address')
+    page_obj = Paginator(agregados, LOGIN_ATTEMPTS_PAGE_SIZE).get_page(request.GET.get('page'))
+
+    return render(request, 'users/login_attempts.html', {
+        'page_obj': page_obj,
+        'username': username,
+        'ip': ip_address,
+    })
 
 def register(request):
     if request.method == 'POST':
@@ -338,46 +383,11 @@ def student_calendar_events(request):
         aprobada=True
     ).distinct()
 
-    # 4. Formatear los datos para FullCalendar
-    events = []
-    from agenda_academica.models import AgendaSettings
-    from django.utils import timezone
+    # 4. Formatear los datos para FullCalendar (un evento por grupo, igual que
+    # el calendario general), sólo para el rango visible si se indica
+    events = build_calendar_events(load_rows(activities, get_date_window(request.GET)), get_closing_date())
 
-    # Load the closing date
-    try:
-        closing_date = AgendaSettings.load().closing_date
-    except Exception:
-        # Fallback if AgendaSettings is not configured or an error occurs
-        closing_date = timezone.now().date()
-
-    for activity in activities:
-        event_class_names = []
-        if activity.fecha_inicio.date() < closing_date:
-            event_class_names.append('past-event')
-        else:
-            event_class_names.append('future-event')
-
-        # Get assigned subject names
-        subject_names = ", ".join([s.nombre for s in activity.asignaturas.all()])
-
-        events.append({
-            'id': activity.id, # Add activity ID for eventClick
-            'title': activity.nombre,
-            'start': activity.fecha_inicio.isoformat(), # Formato estándar ISO 8601
-            'end': activity.fecha_fin.isoformat(),
-            'classNames': event_class_names, # Add class for styling
-            'extendedProps': { # Add more details for eventClick
-                'description': activity.descripcion,
-                'activity_type': activity.tipo_actividad.nombre,
-                'subjects': subject_names,
-                'is_approved': activity.aprobada,
-                'is_active': activity.activa,
-                'evaluable': activity.evaluable,
-                'percentage': activity.porcentaje_evaluacion,
-            }
-        })
-
-    # 4. Devolver los datos como una respuesta JSON
+    # 5. Devolver los datos como una respuesta JSON
     return JsonResponse(events, safe=False)
 
 @login_required
@@ -411,7 +421,39 @@ def coordinator_dashboard(request):
     selected_cursos = request.GET.getlist('curso')
     selected_semestres = request.GET.getlist('semestre')
     selected_tipos_actividad = request.GET.getlist('tipo_actividad')
-    
+    filter_evaluable = request.GET.get('filter_evaluable') == 'on'
+    min_percentage = request.GET.get('min_percentage')
+    approval_status = request.GET.get('approval_status') # 'approved', 'unapproved', 'all'
+
+    # Check if user has any coordinated titulaciones
+    show_no_titulaciones_message = not user_coordinated_titulaciones.exists() and not request.user.es_admin()
+
+    # Las tablas de actividades se cargan por páginas desde coordinator_activities_page
+    return render(request, 'users/coordinator_dashboard.html', {
+        'titulaciones': titulaciones, # All titulaciones for filter dropdown
+        'asignaturas': asignaturas, # All asignaturas for filter dropdown
+        'cursos': cursos_with_labels,
+        'semestres': semestres,
+        'tipos_actividad': tipos_actividad,
+        'selected_titulaciones': selected_titulaciones,
+        'selected_asignaturas': selected_asignaturas,
+        'selected_cursos': selected_cursos,
+        'selected_semestres': selected_semestres,
+        'selected_tipos_actividad': selected_tipos_actividad,
+        'filter_evaluable': filter_evaluable,
+        'min_percentage': min_percentage,
+        'approval_status': approval_status,
+        'show_no_titulaciones_message': show_no_titulaciones_message,
+    })
+
+def _filter_coordinator_activities(request, user_coordinated_titulaciones):
+    """Actividades que cumplen los filtros del panel del coordinador (en cualquier estado)"""
+    selected_titulaciones = request.GET.getlist('titulacion')
+    selected_asignaturas = request.GET.getlist('asignatura')
+    selected_cursos = request.GET.getlist('curso')
+    selected_semestres = request.GET.getlist('semestre')
+    selected_tipos_actividad = request.GET.getlist('tipo_actividad')
+
     # New filters
     filter_evaluable = request.GET.get('filter_evaluable') == 'on'
     min_percentage = request.GET.get('min_percentage')
@@ -446,39 +488,82 @@ def coordinator_dashboard(request):
         activities = activities.filter(aprobada=True)
     elif approval_status == 'unapproved':
         activities = activities.filter(aprobada=False)
-    
+
     # Filter activities by coordinator's assigned titulaciones for display in the table
     # This ensures only activities related to coordinated titulaciones are shown in the table
     # and their checkboxes are editable.
-    if not request.user.role == 'ADMIN': # Admins see all activities
-        activities = activities.filter(asignaturas__titulacion__in=user_coordinated_titulaciones).distinct()
+    if not request.user.es_admin(): # Admins see all activities
+        activities = activities.filter(asignaturas__titulacion__in=user_coordinated_titulaciones)
 
-    # Separate activities by state
-    active_activities = activities.filter(estado='visible')
-    inactive_activities = activities.filter(estado='borrada')  # Solo borradas, no archivadas
+    return activities
 
-    # Check if user has any coordinated titulaciones
-    show_no_titulaciones_message = not user_coordinated_titulaciones.exists() and request.user.role != 'ADMIN'
+# Columnas ordenables de las tablas del coordinador (ninguna admite nulos)
+COORDINATOR_TABLE_SORTS = {'nombre', 'fecha_inicio', 'fecha_fin'}
+COORDINATOR_TABLE_PAGE_SIZE = 50
+COORDINATOR_TABLE_MAX_PAGE_SIZE = 200
 
-    return render(request, 'users/coordinator_dashboard.html', {
-        'titulaciones': titulaciones, # All titulaciones for filter dropdown
-        'asignaturas': asignaturas, # All asignaturas for filter dropdown
-        'cursos': cursos_with_labels,
-        'semestres': semestres,
-        'tipos_actividad': tipos_actividad,
-        'active_activities': active_activities.distinct(),
-        'inactive_activities': inactive_activities.distinct(),
-        'selected_titulaciones': selected_titulaciones,
-        'selected_asignaturas': selected_asignaturas,
-        'selected_cursos': selected_cursos,
-        'selected_semestres': selected_semestres,
-        'selected_tipos_actividad': selected_tipos_actividad,
-        'filter_evaluable': filter_evaluable,
-        'min_percentage': min_percentage,
-        'approval_status': approval_status,
-        'user_coordinated_titulaciones_ids': [t.id for t in user_coordinated_titulaciones], # Pass IDs for frontend check
-        'show_no_titulaciones_message': show_no_titulaciones_message,
-    })
+@login_required
+@user_passes_test(is_coordinator)
+def coordinator_activities_page(request):
+    """
+    Una página de las tablas del panel del coordinador en JSON.
+
+    Recibe los mismos filtros que el formulario del panel, más 'estado'
+    ('visible' o 'borrada'), 'sort' (columna, con '-' para descendente),
+    'limit' y el 'cursor' devuelto por la página anterior (paginación por
+    clave). El total solo se cuenta en la primera página.
+    """
+    estado = request.GET.get('estado', Actividad.ESTADO_VISIBLE)
+    if estado not in (Actividad.ESTADO_VISIBLE, Actividad.ESTADO_BORRADA):
+        return JsonResponse({'success': False, 'error': 'Invalid estado'}, status=400)
+
+    sort = request.GET.get('sort', 'fecha_inicio')
+    if sort.lstrip('-') not in COORDINATOR_TABLE_SORTS:
+        return JsonResponse({'success': False, 'error': 'Invalid sort'}, status=400)
+
+    try:
+        limit = min(int(request.GET.get('limit', COORDINATOR_TABLE_PAGE_SIZE)), COORDINATOR_TABLE_MAX_PAGE_SIZE)
+    except ValueError:
+        limit = COORDINATOR_TABLE_PAGE_SIZE
+    limit = max(limit, 1)
+    cursor = request.GET.get('cursor')
+
+    user_coordinated_titulaciones = Titulacion.objects.filter(coordinador=request.user)
+    coordinated_ids = set(user_coordinated_titulaciones.values_list('id', flat=True))
+    is_admin_user = request.user.es_admin()
+
+    # Los filtros cruzan con asignaturas; filtrar por pk evita el DISTINCT
+    matching = _filter_coordinator_activities(request, user_coordinated_titulaciones)
+    activities = Actividad.objects.filter(
+        pk__in=matching.values('pk'), estado=estado
+    ).select_related('tipo_actividad').prefetch_related('asignaturas')
+
+    try:
+        rows, next_cursor = keyset_paginate(activities, sort, cursor, limit)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    results = []
+    for activity in rows:
+        asignaturas = list(activity.asignaturas.all())
+        results.append({
+            'id': activity.id,
+            'nombre': activity.nombre,
+            'subjects': ', '.join(a.nombre for a in asignaturas),
+            'tipo': activity.tipo_actividad.nombre,
+            'fecha_inicio': date_format(timezone.localtime(activity.fecha_inicio), 'd M Y, H:i'),
+            'fecha_fin': date_format(timezone.localtime(activity.fecha_fin), 'd M Y, H:i'),
+            'evaluable': activity.evaluable,
+            'porcentaje_evaluacion': str(activity.porcentaje_evaluacion),
+            'aprobada': activity.aprobada,
+            # El admin edita todo; el coordinador solo sus titulaciones
+            'can_edit_approval': is_admin_user or any(a.titulacion_id in coordinated_ids for a in asignaturas),
+        })
+
+    data = {'success': True, 'results': results, 'next_cursor': next_cursor}
+    if not cursor:
+        data['total'] = activities.count()
+    return JsonResponse(data)
 
 @login_required
 @user_passes_test(is_coordinator)
@@ -488,35 +573,53 @@ def send_notification(request):
         if form.is_valid():
             subject = form.cleaned_data['subject']
             message = form.cleaned_data['message']
-            # Send email to all users
-            for user in CustomUser.objects.all():
-                send_mail(
-                    subject,
-                    message,
-                    'from@example.com',
-                    [user.email],
-                    fail_silently=False,
-                )
+            destinatarios = usuarios_destinatarios(
+                titulaciones=form.cleaned_data['titulaciones'],
+                cursos=form.cleaned_data['cursos'],
+                asignaturas=form.cleaned_data['asignaturas'],
+                tipos_perfil=list(form.cleaned_data['tipos_perfil']),
+            )
+            # Se registra y se envía en segundo plano por lotes (users.notifications)
+            with transaction.atomic():
+                envio = crear_envio(subject, message, request.user, destinatarios)
+                encolar_envio(envio)
+            messages.success(request, f'Notificación encolada para {envio.destinatarios.count()} destinatarios.')
             return redirect('coordinator_dashboard')
     else:
         form = NotificationForm()
     return render(request, 'users/send_notification.html', {'form': form})
 
+@login_required
+@user_passes_test(is_coordinator)
+def notification_status(request, envio_id):
+    """Estado de entrega de una notificación masiva (JSON)"""
+    try:
+        envio = EnvioNotificacion.objects.get(pk=envio_id)
+    except EnvioNotificacion.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Notification not found'}, status=404)
+    if envio.remitente_id != request.user.id and not request.user.es_admin():
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    return JsonResponse({
+        'success': True,
+        'estado': envio.estado,
+        'destinatarios': envio.resumen(),
+        'fallidos': list(envio.destinatarios.filter(
+            estado=DestinatarioNotificacion.ESTADO_FALLIDO
+        ).values('email', 'error')[:100]),
+    })
+
 @login_required
 @user_passes_test(is_admin)
 def kpi_report(request):
-    total_users = CustomUser.objects.count()
-    total_teachers = CustomUser.objects.filter(role='TEACHER').count()
-    total_students = CustomUser.objects.filter(role='STUDENT').count()
-    total_activities = Actividad.objects.count()
-    total_titulaciones = Titulacion.objects.count()
+    # Contadores precalculados: una sola fila en lugar de un COUNT(*) por KPI
+    kpis = EstadisticasKPI.load()
 
     return render(request, 'users/kpi_report.html', {
-        'total_users': total_users,
-        'total_teachers': total_teachers,
-        'total_students': total_students,
-        'total_activities': total_activities,
-        'total_titulaciones': total_titulaciones,
+        'total_users': kpis.total_users,
+        'total_teachers': kpis.total_teachers,
+        'total_students': kpis.total_students,
+        'total_activities': kpis.total_activities,
+        'total_titulaciones': kpis.total_titulaciones,
     })
 
 @login_required
@@ -585,19 +688,15 @@ def admin_dashboard(request):
     from agenda_academica.models import AgendaSettings
     from .models import TipoPerfil
     
-    total_users = CustomUser.objects.count()
-    total_teachers = CustomUser.objects.filter(role='TEACHER').count()
-    total_students = CustomUser.objects.filter(role='STUDENT').count()
-    total_activities = Actividad.objects.count()
-    total_titulaciones = Titulacion.objects.count()
-    total_asignaturas = Asignatura.objects.count()
-    active_activities = Actividad.objects.filter(activa=True).count()
+    # Contadores precalculados (EstadisticasKPI, mantenidos por señales)
+    kpis = EstadisticasKPI.load()
     
-    titulaciones = Titulacion.objects.all().order_by('nombre')
-    all_users = CustomUser.objects.all().order_by('username')
+    titulaciones = Titulacion.objects.select_related('coordinador').order_by('nombre')
+    # Solo lo que muestra el selector de coordinador
+    all_users = CustomUser.objects.only('username', 'first_name', 'last_name', 'role').order_by('username')
     tipos_actividad = TipoActividad.objects.all()
     tipos_perfil = TipoPerfil.objects.all().order_by('orden', 'nombre')
-    logs = LogActividad.objects.all().order_by('-timestamp')[:50]
+    logs = LogActividad.objects.select_related('usuario').order_by('-timestamp', '-id_log')[:50]
     
     try:
         settings = AgendaSettings.load()
@@ -605,13 +704,13 @@ def admin_dashboard(request):
         settings = None
     
     context = {
-        'total_users': total_users,
-        'total_teachers': total_teachers,
-        'total_students': total_students,
-        'total_activities': total_activities,
-        'total_titulaciones': total_titulaciones,
-        'total_asignaturas': total_asignaturas,
-        'active_activities': active_activities,
+        'total_users': kpis.total_users,
+        'total_teachers': kpis.total_teachers,
+        'total_students': kpis.total_students,
+        'total_activities': kpis.total_activities,
+        'total_titulaciones': kpis.total_titulaciones,
+        'total_asignaturas': kpis.total_asignaturas,
+        'active_activities': kpis.active_activities,
         'titulaciones': titulaciones,
         'all_titulaciones': titulaciones,  # For PDF report dropdown
         'all_users': all_users,
@@ -770,7 +869,7 @@ def ajax_update_coordinator(request):
                     details = f'Coordinator {new_coordinator.username} assigned to "{titulacion.nombre}"'
                     action = 'Asignación'
                     
-                LogActividad.objects.create(
+                registrar_log(
                     object_type='coordinador',
                     object_name=titulacion.nombre,
                     object_id=titulacion.id,
@@ -785,7 +884,7 @@ def ajax_update_coordinator(request):
             # Remove coordinator
             if current_coordinator:
                 # Log the coordinator removal
-                LogActividad.objects.create(
+                registrar_log(
                     object_type='coordinador',
                     object_name=titulacion.nombre,
                     object_id=titulacion.id,
@@ -856,7 +955,7 @@ def ajax_create_tipo_perfil(request):
         )
         
         # Log the creation
-        LogActividad.objects.create(
+        registrar_log(
             object_type='tipo_perfil',
             object_name=tipo_perfil.nombre,
             object_id=tipo_perfil.id,
@@ -914,7 +1013,7 @@ def ajax_update_tipo_perfil(request, pk):
         tipo_perfil.save()
         
         # Log the update
-        LogActividad.objects.create(
+        registrar_log(
             object_type='tipo_perfil',
             object_name=tipo_perfil.nombre,
             object_id=tipo_perfil.id,
@@ -965,7 +1064,7 @@ def ajax_delete_tipo_perfil(request, pk):
         tipo_perfil.delete()
         
         # Log the deletion
-        LogActividad.objects.create(
+        registrar_log(
             object_type='tipo_perfil',
             object_name=tipo_name,
             object_id=pk,
@@ -1006,7 +1105,7 @@ def archivar_actividad_ajax(request):
             })
 
         # Verificar permisos: solo coordinadores de la titulación pueden archivar
-        if request.user.role != 'ADMIN':
+        if not request.user.es_admin():
             user_coordinated_titulaciones = Titulacion.objects.filter(coordinador=request.user)
             activity_titulaciones = Titulacion.objects.filter(
                 asignatura__actividad=actividad